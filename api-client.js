@@ -1,324 +1,513 @@
-/**
- * Client API pour Mon Budget Malin
- * Gère la communication avec le backend Python
- */
-
-class BudgetAPI {
-    constructor(baseURL = 'http://localhost:8000') {
-        this.baseURL = baseURL;
-        this.token = localStorage.getItem('auth_token');
-    }
-
-    // Configuration des headers
-    getHeaders() {
-        const headers = {
-            'Content-Type': 'application/json',
-        };
-        
-        if (this.token) {
-            headers['Authorization'] = `Bearer ${this.token}`;
-        }
-        
-        return headers;
-    }
-
-    // Gestion des erreurs
-    async handleResponse(response) {
-        if (!response.ok) {
-            const error = await response.json().catch(() => ({ detail: 'Erreur réseau' }));
-            throw new Error(error.detail || `Erreur ${response.status}`);
-        }
-        return response.json();
-    }
-
-    // Authentification
-    async login(username, password) {
-        const formData = new FormData();
-        formData.append('username', username);
-        formData.append('password', password);
-
-        const response = await fetch(`${this.baseURL}/auth/token`, {
-            method: 'POST',
-            body: formData
-        });
-
-        const data = await this.handleResponse(response);
-        this.token = data.access_token;
-        localStorage.setItem('auth_token', this.token);
-        return data;
-    }
-
-    async register(userData) {
-        const response = await fetch(`${this.baseURL}/auth/register`, {
-            method: 'POST',
-            headers: this.getHeaders(),
-            body: JSON.stringify(userData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async getCurrentUser() {
-        const response = await fetch(`${this.baseURL}/auth/me`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    // Transactions
-    async getTransactions(filters = {}) {
-        const params = new URLSearchParams();
-        Object.entries(filters).forEach(([key, value]) => {
-            if (value !== undefined && value !== null) {
-                params.append(key, value);
-            }
-        });
-
-        const response = await fetch(`${this.baseURL}/transactions/?${params}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async createTransaction(transactionData) {
-        const response = await fetch(`${this.baseURL}/transactions/`, {
-            method: 'POST',
-            headers: this.getHeaders(),
-            body: JSON.stringify(transactionData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async updateTransaction(transactionId, transactionData) {
-        const response = await fetch(`${this.baseURL}/transactions/${transactionId}`, {
-            method: 'PUT',
-            headers: this.getHeaders(),
-            body: JSON.stringify(transactionData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async deleteTransaction(transactionId) {
-        const response = await fetch(`${this.baseURL}/transactions/${transactionId}`, {
-            method: 'DELETE',
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async getTransactionAnalytics(months = 6) {
-        const response = await fetch(`${this.baseURL}/transactions/summary/analytics?months=${months}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    // Budgets
-    async getBudgets(month = null) {
-        const params = month ? `?month=${month}` : '';
-        const response = await fetch(`${this.baseURL}/budgets/${params}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async createBudget(budgetData) {
-        const response = await fetch(`${this.baseURL}/budgets/`, {
-            method: 'POST',
-            headers: this.getHeaders(),
-            body: JSON.stringify(budgetData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async updateBudget(budgetId, budgetData) {
-        const response = await fetch(`${this.baseURL}/budgets/${budgetId}`, {
-            method: 'PUT',
-            headers: this.getHeaders(),
-            body: JSON.stringify(budgetData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async deleteBudget(budgetId) {
-        const response = await fetch(`${this.baseURL}/budgets/${budgetId}`, {
-            method: 'DELETE',
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async getBudgetAlerts(month) {
-        const response = await fetch(`${this.baseURL}/budgets/alerts?month=${month}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    // Objectifs
-    async getGoals(activeOnly = true) {
-        const response = await fetch(`${this.baseURL}/goals/?active_only=${activeOnly}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async createGoal(goalData) {
-        const response = await fetch(`${this.baseURL}/goals/`, {
-            method: 'POST',
-            headers: this.getHeaders(),
-            body: JSON.stringify(goalData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async updateGoal(goalId, goalData) {
-        const response = await fetch(`${this.baseURL}/goals/${goalId}`, {
-            method: 'PUT',
-            headers: this.getHeaders(),
-            body: JSON.stringify(goalData)
-        });
-
-        return this.handleResponse(response);
-    }
-
-    async deleteGoal(goalId) {
-        const response = await fetch(`${this.baseURL}/goals/${goalId}`, {
-            method: 'DELETE',
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    // Catégories
-    async getCategories(categoryType = null) {
-        const params = categoryType ? `?category_type=${categoryType}` : '';
-        const response = await fetch(`${this.baseURL}/categories/${params}`, {
-            headers: this.getHeaders()
-        });
-
-        return this.handleResponse(response);
-    }
-
-    // Déconnexion
-    logout() {
-        this.token = null;
-        localStorage.removeItem('auth_token');
-    }
-
-    // Vérifier si l'utilisateur est connecté
-    isAuthenticated() {
-        return !!this.token;
-    }
-}
-
-// Instance globale de l'API
-const api = new BudgetAPI();
-
-// Fonctions utilitaires pour la migration depuis localStorage
-class DataMigration {
-    static async migrateFromLocalStorage() {
-        try {
-            // Migrer les transactions
-            const localTransactions = JSON.parse(localStorage.getItem('transactions') || '[]');
-            for (const transaction of localTransactions) {
-                await api.createTransaction({
-                    amount: transaction.amount,
-                    type: transaction.type,
-                    category: transaction.category,
-                    description: transaction.description || '',
-                    payment_method: transaction.paymentMethod || 'espèces',
-                    date: new Date(transaction.date).toISOString()
-                });
-            }
-
-            // Migrer les budgets
-            const localBudgets = JSON.parse(localStorage.getItem('budgets') || '{}');
-            const currentMonth = new Date().toISOString().slice(0, 7); // YYYY-MM
-            for (const [category, amount] of Object.entries(localBudgets)) {
-                if (amount > 0) {
-                    await api.createBudget({
-                        category: category,
-                        amount: amount,
-                        month: currentMonth
-                    });
-                }
-            }
-
-            console.log('✅ Migration des données terminée');
-            return true;
-        } catch (error) {
-            console.error('❌ Erreur lors de la migration:', error);
-            return false;
-        }
-    }
-}
-
-// Fonctions de compatibilité avec l'ancien code
-function loadTransactions() {
-    // Si l'utilisateur est connecté, utiliser l'API
-    if (api.isAuthenticated()) {
-        return api.getTransactions().catch(() => []);
-    }
-    // Sinon, utiliser localStorage (fallback)
-    try {
-        return Promise.resolve(JSON.parse(localStorage.getItem('transactions') || '[]'));
-    } catch (e) {
-        return Promise.resolve([]);
-    }
-}
-
-function saveTransactions(transactions) {
-    // Si l'utilisateur est connecté, les transactions sont gérées par l'API
-    // Sinon, utiliser localStorage (fallback)
-    if (!api.isAuthenticated()) {
-        localStorage.setItem('transactions', JSON.stringify(transactions));
-    }
-}
-
-function loadBudgets() {
-    // Si l'utilisateur est connecté, utiliser l'API
-    if (api.isAuthenticated()) {
-        const currentMonth = new Date().toISOString().slice(0, 7);
-        return api.getBudgets(currentMonth).then(budgets => {
-            const budgetMap = {};
-            budgets.forEach(budget => {
-                budgetMap[budget.category] = budget.amount;
-            });
-            return budgetMap;
-        }).catch(() => ({}));
-    }
-    // Sinon, utiliser localStorage (fallback)
-    try {
-        return Promise.resolve(JSON.parse(localStorage.getItem('budgets') || '{}'));
-    } catch (e) {
-        return Promise.resolve({});
-    }
-}
-
-function saveBudgets(budgets) {
-    // Si l'utilisateur est connecté, les budgets sont gérés par l'API
-    // Sinon, utiliser localStorage (fallback)
-    if (!api.isAuthenticated()) {
-        localStorage.setItem('budgets', JSON.stringify(budgets));
-    }
-}
-
-// Export pour utilisation globale
-window.BudgetAPI = BudgetAPI;
-window.api = api;
+/**
+ * Client API pour Mon Budget Malin
+ * Gère la communication avec le backend Python
+ */
+
+class BudgetAPI {
+    constructor(baseURL = 'http://localhost:8000') {
+        this.baseURL = baseURL;
+        this.token = localStorage.getItem('auth_token');
+    }
+
+    // Configuration des headers
+    getHeaders() {
+        const headers = {
+            'Content-Type': 'application/json',
+        };
+        
+        if (this.token) {
+            headers['Authorization'] = `Bearer ${this.token}`;
+        }
+        
+        return headers;
+    }
+
+    // Gestion des erreurs
+    async handleResponse(response) {
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({ detail: 'Erreur réseau' }));
+            throw new Error(error.detail || `Erreur ${response.status}`);
+        }
+        return response.json();
+    }
+
+    // Authentification
+    async login(username, password) {
+        const formData = new FormData();
+        formData.append('username', username);
+        formData.append('password', password);
+
+        const response = await fetch(`${this.baseURL}/auth/token`, {
+            method: 'POST',
+            body: formData
+        });
+
+        const data = await this.handleResponse(response);
+        this.token = data.access_token;
+        localStorage.setItem('auth_token', this.token);
+        return data;
+    }
+
+    async register(userData) {
+        const response = await fetch(`${this.baseURL}/auth/register`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify(userData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async getCurrentUser() {
+        const response = await fetch(`${this.baseURL}/auth/me`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Transactions
+    async getTransactions(filters = {}) {
+        const params = new URLSearchParams();
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value !== undefined && value !== null) {
+                params.append(key, value);
+            }
+        });
+
+        const response = await fetch(`${this.baseURL}/transactions/?${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Courbes : revenus, dépenses et solde par période, réduits côté serveur à maxPoints points
+    // options : { bucket: 'day' | 'week' | 'month', startDate, endDate, byCategory, maxPoints }
+    async getTimeseries(options = {}) {
+        const params = new URLSearchParams({ bucket: options.bucket || 'day' });
+        if (options.startDate) params.append('start_date', options.startDate);
+        if (options.endDate) params.append('end_date', options.endDate);
+        if (options.byCategory) params.append('by_category', 'true');
+        if (options.maxPoints) params.append('max_points', options.maxPoints);
+
+        const response = await fetch(`${this.baseURL}/transactions/timeseries?${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Import en masse (migration, synchronisation) : insertions groupées côté serveur
+    async ingestTransactions(transactions, chunkSize = 1000) {
+        let accepted = 0;
+        for (let start = 0; start < transactions.length; start += chunkSize) {
+            const response = await fetch(`${this.baseURL}/transactions/ingest`, {
+                method: 'POST',
+                headers: this.getHeaders(),
+                body: JSON.stringify({ transactions: transactions.slice(start, start + chunkSize) })
+            });
+
+            const data = await this.handleResponse(response);
+            accepted += data.accepted;
+        }
+        return accepted;
+    }
+
+    // Données de graphique : seulement les champs utiles, un tableau par champ
+    // -> { date: [...], amount: [...], category: [...] }
+    async getTransactionColumns(fields = ['date', 'amount', 'category'], filters = {}) {
+        const data = await this.getTransactions({ ...filters, fields: fields.join(','), layout: 'columns' });
+        return data.columns;
+    }
+
+    async createTransaction(transactionData) {
+        const response = await fetch(`${this.baseURL}/transactions/`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify(transactionData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async updateTransaction(transactionId, transactionData) {
+        const response = await fetch(`${this.baseURL}/transactions/${transactionId}`, {
+            method: 'PUT',
+            headers: this.getHeaders(),
+            body: JSON.stringify(transactionData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async deleteTransaction(transactionId) {
+        const response = await fetch(`${this.baseURL}/transactions/${transactionId}`, {
+            method: 'DELETE',
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async getTransactionAnalytics(months = 6) {
+        const response = await fetch(`${this.baseURL}/transactions/summary/analytics?months=${months}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Agrégations ad hoc côté serveur (ex. dépenses Transport du dernier trimestre)
+    // query : { start_date, end_date, transaction_type, category, group_by, bucket }
+    async queryTransactions(query = {}) {
+        const params = new URLSearchParams();
+        Object.entries(query).forEach(([key, value]) => {
+            if (value === undefined || value === null) return;
+            (Array.isArray(value) ? value : [value]).forEach(v => params.append(key, v));
+        });
+
+        const response = await fetch(`${this.baseURL}/transactions/summary/query?${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Catégorisation automatique d'un lot à importer (ex. synchronisation mobile money)
+    // transactions : [{ amount, type, description, payment_method }] -> [{ category, confidence }]
+    async categorizeTransactions(transactions) {
+        const response = await fetch(`${this.baseURL}/transactions/categorize`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ transactions })
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Recatégorise les transactions restées dans "Divers"
+    async categorizePendingTransactions(minConfidence = null) {
+        const params = minConfidence !== null ? `?min_confidence=${minConfidence}` : '';
+        const response = await fetch(`${this.baseURL}/transactions/categorize/pending${params}`, {
+            method: 'POST',
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Budgets
+    async getBudgets(month = null) {
+        const params = month ? `?month=${month}` : '';
+        const response = await fetch(`${this.baseURL}/budgets/${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async createBudget(budgetData) {
+        const response = await fetch(`${this.baseURL}/budgets/`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify(budgetData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async updateBudget(budgetId, budgetData) {
+        const response = await fetch(`${this.baseURL}/budgets/${budgetId}`, {
+            method: 'PUT',
+            headers: this.getHeaders(),
+            body: JSON.stringify(budgetData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async deleteBudget(budgetId) {
+        const response = await fetch(`${this.baseURL}/budgets/${budgetId}`, {
+            method: 'DELETE',
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async getBudgetAlerts(month) {
+        const response = await fetch(`${this.baseURL}/budgets/alerts?month=${month}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Alertes en temps réel : onAlert(alerte) à chaque changement de statut d'un budget
+    // Le flux s'ouvre avec un ticket de courte durée (le token ne passe jamais dans l'URL),
+    // redemandé à chaque reconnexion. Retourne un objet { close() } pour arrêter
+    subscribeBudgetAlerts(onAlert, onSnapshot = null) {
+        let source = null;
+        let timer = null;
+        let closed = false;
+
+        const open = async () => {
+            try {
+                const response = await fetch(`${this.baseURL}/budgets/alerts/stream/ticket`, {
+                    method: 'POST',
+                    headers: this.getHeaders()
+                });
+                const { ticket } = await this.handleResponse(response);
+                if (closed) {
+                    return;
+                }
+                source = new EventSource(`${this.baseURL}/budgets/alerts/stream?ticket=${encodeURIComponent(ticket)}`);
+            } catch (error) {
+                if (!closed) {
+                    timer = setTimeout(open, 5000);
+                }
+                return;
+            }
+            source.addEventListener('budget_alert', event => onAlert(JSON.parse(event.data)));
+            if (onSnapshot) {
+                source.addEventListener('snapshot', event => onSnapshot(JSON.parse(event.data)));
+            }
+            source.onerror = () => {
+                // EventSource se reconnecte seul avec le même ticket ; s'il a expiré (401)
+                // ou si le flux est refusé (503), la connexion est fermée : nouveau ticket
+                if (source.readyState === EventSource.CLOSED && !closed) {
+                    timer = setTimeout(open, 5000);
+                }
+            };
+        };
+
+        open();
+        return {
+            close() {
+                closed = true;
+                clearTimeout(timer);
+                if (source) {
+                    source.close();
+                }
+            }
+        };
+    }
+
+    // Objectifs
+    async getGoals(activeOnly = true) {
+        const response = await fetch(`${this.baseURL}/goals/?active_only=${activeOnly}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async createGoal(goalData) {
+        const response = await fetch(`${this.baseURL}/goals/`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify(goalData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async updateGoal(goalId, goalData) {
+        const response = await fetch(`${this.baseURL}/goals/${goalId}`, {
+            method: 'PUT',
+            headers: this.getHeaders(),
+            body: JSON.stringify(goalData)
+        });
+
+        return this.handleResponse(response);
+    }
+
+    async deleteGoal(goalId) {
+        const response = await fetch(`${this.baseURL}/goals/${goalId}`, {
+            method: 'DELETE',
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Catégories
+    async getCategories(categoryType = null) {
+        const params = categoryType ? `?category_type=${categoryType}` : '';
+        const response = await fetch(`${this.baseURL}/categories/${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Comparaisons : parts de dépenses (%) par catégorie face aux utilisateurs semblables
+    // -> { month, cohort, categories: [{ category, your_share, peer_median, peer_p25, peer_p75, percentile }] }
+    async getPeerBenchmarks(month = null) {
+        const params = month ? `?month=${month}` : '';
+        const response = await fetch(`${this.baseURL}/analytics/peers${params}`, {
+            headers: this.getHeaders()
+        });
+
+        return this.handleResponse(response);
+    }
+
+    // Relevé d'un mois terminé (format : 'json', 'csv' ou 'html')
+    // Le relevé est calculé en arrière-plan : on réessaie tant que le serveur répond 202
+    async getStatement(month, format = 'json') {
+        for (;;) {
+            const response = await fetch(`${this.baseURL}/statements/${month}?format=${format}`, {
+                headers: this.getHeaders()
+            });
+            if (response.status !== 202) {
+                if (format === 'json') {
+                    return this.handleResponse(response);
+                }
+                if (!response.ok) {
+                    await this.handleResponse(response);
+                }
+                return response.text();
+            }
+            const retryAfter = Number(response.headers.get('Retry-After')) || 2;
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+        }
+    }
+
+    // Requêtes groupées : plusieurs appels en un seul aller-retour
+    // requests : [{ id, method, path, body }] -> [{ id, status, body }] dans le même ordre
+    async batch(requests) {
+        const response = await fetch(`${this.baseURL}/batch`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ requests })
+        });
+
+        const data = await this.handleResponse(response);
+        return data.responses;
+    }
+
+    // Données du tableau de bord en un seul appel ; une section en erreur vaut null
+    async loadDashboard(month, months = 6) {
+        const responses = await this.batch([
+            { id: 'user', path: '/auth/me' },
+            { id: 'transactions', path: '/transactions/' },
+            { id: 'budgets', path: `/budgets/?month=${month}` },
+            { id: 'alerts', path: `/budgets/alerts?month=${month}` },
+            { id: 'goals', path: '/goals/?active_only=true' },
+            { id: 'analytics', path: `/transactions/summary/analytics?months=${months}` }
+        ]);
+
+        const dashboard = {};
+        responses.forEach(item => {
+            dashboard[item.id] = item.status < 400 ? item.body : null;
+        });
+        return dashboard;
+    }
+
+    // Déconnexion
+    logout() {
+        this.token = null;
+        localStorage.removeItem('auth_token');
+    }
+
+    // Vérifier si l'utilisateur est connecté
+    isAuthenticated() {
+        return !!this.token;
+    }
+}
+
+// Instance globale de l'API
+const api = new BudgetAPI();
+
+// Fonctions utilitaires pour la migration depuis localStorage
+class DataMigration {
+    static async migrateFromLocalStorage() {
+        try {
+            // Migrer les transactions
+            const localTransactions = JSON.parse(localStorage.getItem('transactions') || '[]');
+            await api.ingestTransactions(localTransactions.map(transaction => ({
+                amount: transaction.amount,
+                type: transaction.type,
+                category: transaction.category,
+                description: transaction.description || '',
+                payment_method: transaction.paymentMethod || 'espèces',
+                date: new Date(transaction.date).toISOString()
+            })));
+
+            // Migrer les budgets
+            const localBudgets = JSON.parse(localStorage.getItem('budgets') || '{}');
+            const currentMonth = new Date().toISOString().slice(0, 7); // YYYY-MM
+            for (const [category, amount] of Object.entries(localBudgets)) {
+                if (amount > 0) {
+                    await api.createBudget({
+                        category: category,
+                        amount: amount,
+                        month: currentMonth
+                    });
+                }
+            }
+
+            console.log('✅ Migration des données terminée');
+            return true;
+        } catch (error) {
+            console.error('❌ Erreur lors de la migration:', error);
+            return false;
+        }
+    }
+}
+
+// Fonctions de compatibilité avec l'ancien code
+function loadTransactions() {
+    // Si l'utilisateur est connecté, utiliser l'API
+    if (api.isAuthenticated()) {
+        return api.getTransactions().catch(() => []);
+    }
+    // Sinon, utiliser localStorage (fallback)
+    try {
+        return Promise.resolve(JSON.parse(localStorage.getItem('transactions') || '[]'));
+    } catch (e) {
+        return Promise.resolve([]);
+    }
+}
+
+function saveTransactions(transactions) {
+    // Si l'utilisateur est connecté, les transactions sont gérées par l'API
+    // Sinon, utiliser localStorage (fallback)
+    if (!api.isAuthenticated()) {
+        localStorage.setItem('transactions', JSON.stringify(transactions));
+    }
+}
+
+function loadBudgets() {
+    // Si l'utilisateur est connecté, utiliser l'API
+    if (api.isAuthenticated()) {
+        const currentMonth = new Date().toISOString().slice(0, 7);
+        return api.getBudgets(currentMonth).then(budgets => {
+            const budgetMap = {};
+            budgets.forEach(budget => {
+                budgetMap[budget.category] = budget.amount;
+            });
+            return budgetMap;
+        }).catch(() => ({}));
+    }
+    // Sinon, utiliser localStorage (fallback)
+    try {
+        return Promise.resolve(JSON.parse(localStorage.getItem('budgets') || '{}'));
+    } catch (e) {
+        return Promise.resolve({});
+    }
+}
+
+function saveBudgets(budgets) {
+    // Si l'utilisateur est connecté, les budgets sont gérés par l'API
+    // Sinon, utiliser localStorage (fallback)
+    if (!api.isAuthenticated()) {
+        localStorage.setItem('budgets', JSON.stringify(budgets));
+    }
+}
+
+// Export pour utilisation globale
+window.BudgetAPI = BudgetAPI;
+window.api = api;
 window.DataMigration = DataMigration; 
\ No newline at end of file
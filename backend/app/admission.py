@@ -0,0 +1,229 @@
+"""
+Contrôle d'admission des routes coûteuses (analyses, alertes de budget).
+
+Les routes synchrones s'exécutent dans le pool de threads d'AnyIO
+(settings.threadpool_size threads par worker). Sans limite, un pic
+d'ouvertures du tableau de bord occupe tous les threads avec des analyses et
+les écritures interactives attendent derrière elles.
+
+Chaque classe de routes (settings.admission_routes) dispose donc de son propre
+pool (settings.admission_pools, "concurrence/file/attente max en secondes"),
+les autres routes passant par le pool "default" (sondes /health exceptées) :
+au plus `concurrence` requêtes en cours, au plus `file` requêtes en attente.
+Une requête est refusée d'emblée (503 + Retry-After) quand la file est pleine
+ou quand l'attente estimée (position dans la file x durée moyenne d'un calcul
+/ concurrence) dépasse l'attente maximale, et refusée si son attente réelle
+la dépasse.
+
+Les requêtes en attente ne tiennent ni thread ni connexion : la somme des
+concurrences reste inférieure à settings.threadpool_size, qui fixe aussi la
+taille du pool de connexions. Sans cette borne, des requêtes authentifiées
+(connexion déjà prise) peuvent attendre un thread occupé par des requêtes qui
+attendent une connexion. Un lot (POST /batch) compte pour
+settings.batch_concurrency + 1 : il garde sa session pendant ses lectures
+parallèles, chacune sur son thread et sa session.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pondération de la moyenne mobile exponentielle des durées
+EWMA_ALPHA = 0.2
+
+# Pools dont les requêtes attendent (spool, alertes) sans tenir de thread ni de connexion
+UNBOUNDED_POOLS = ("ingest", "streams")
+
+
+class Overloaded(Exception):
+    """Requête refusée par le contrôle d'admission"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_pool(value: str) -> Tuple[int, int, float]:
+    """"concurrence/file/attente" -> (concurrence, taille de file, attente maximale)"""
+    concurrency, queue_size, max_wait = value.split("/")
+    return int(concurrency), int(queue_size), float(max_wait)
+
+
+class AdmissionPool:
+    """Sémaphore à file bornée et délestage selon l'attente estimée (boucle asyncio du worker)"""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_time = 0.05  # estimation initiale (s), affinée à chaque requête
+        self.stats = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0,
+            "rejected_deadline": 0, "timed_out": 0, "max_queue_depth": 0,
+        }
+        self._wait_time = 0.0
+        self._max_wait_seen = 0.0
+
+    def _expected_wait(self, position: int) -> float:
+        return position * self.service_time / self.concurrency
+
+    def _retry_after(self) -> float:
+        return self._expected_wait(len(self._waiters) + 1)
+
+    async def acquire(self) -> float:
+        """Attend une place ; retourne le temps d'attente ou lève Overloaded"""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return 0.0
+
+        if len(self._waiters) >= self.queue_size:
+            self.stats["rejected_queue_full"] += 1
+            raise Overloaded("file pleine", self._retry_after())
+        if self._expected_wait(len(self._waiters) + 1) > self.max_wait:
+            self.stats["rejected_deadline"] += 1
+            raise Overloaded("attente estimée trop longue", self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.stats["queued"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._waiters.remove(future)
+                self.stats["timed_out"] += 1
+                raise Overloaded("délai d'attente dépassé", self._retry_after())
+        except asyncio.CancelledError:
+            # Client parti pendant l'attente : rendre la place si elle venait d'être accordée
+            if future.done() and not future.cancelled():
+                self.release(0.0)
+            else:
+                future.cancel()
+                if future in self._waiters:
+                    self._waiters.remove(future)
+            raise
+
+        waited = time.monotonic() - started
+        self.stats["admitted"] += 1
+        self._wait_time = waited if not self._wait_time else (1 - EWMA_ALPHA) * self._wait_time + EWMA_ALPHA * waited
+        self._max_wait_seen = max(self._max_wait_seen, waited)
+        return waited
+
+    def release(self, service_time: float) -> None:
+        """Libère la place (ou la transmet directement à la première requête en attente)"""
+        if service_time:
+            self.service_time = (1 - EWMA_ALPHA) * self.service_time + EWMA_ALPHA * service_time
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait,
+            "avg_service_seconds": round(self.service_time, 4),
+            "avg_wait_seconds": round(self._wait_time, 4),
+            "max_wait_seen_seconds": round(self._max_wait_seen, 4),
+            **self.stats,
+        }
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI : chaque requête passe par le pool de sa classe de route"""
+
+    def __init__(self, app, pools: Optional[Dict[str, str]] = None, routes: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.pools = {name: AdmissionPool(name, *parse_pool(value)) for name, value in (pools or {}).items()}
+        self.routes = {rule: self.pools[name] for rule, name in (routes or {}).items() if name in self.pools}
+        self.default = self.pools.get("default")
+        admission_pools.update(self.pools)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/health"):
+            await self.app(scope, receive, send)
+            return
+        pool = self.routes.get(f"{scope['method']} {scope['path']}", self.default)
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await pool.acquire()
+        except Overloaded as e:
+            retry_after = max(1, math.ceil(e.retry_after))
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": f"Service surchargé ({e.reason}), réessayez dans {retry_after} s"},
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(time.monotonic() - started)
+
+
+# Pools du worker, exposés par /health/admission
+admission_pools: Dict[str, AdmissionPool] = {}
+
+
+def threads_needed(pools: Dict[str, str], routes: Dict[str, str]) -> int:
+    """Threads (et connexions) que les pools peuvent occuper ensemble"""
+    batch_pool = routes.get("POST /batch")
+    if batch_pool not in pools:
+        batch_pool = "default"
+    total = 0
+    for name, value in pools.items():
+        if name in UNBOUNDED_POOLS:
+            continue
+        concurrency = parse_pool(value)[0]
+        # Un lot tient sa session et jusqu'à batch_concurrency lectures parallèles, chacune sur sa session
+        total += concurrency * (settings.batch_concurrency + 1) if name == batch_pool else concurrency
+    return total
+
+
+def configure_threadpool() -> None:
+    """Fixe la taille du pool de threads des routes synchrones (à appeler au démarrage)"""
+    from anyio import to_thread
+
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    needed = threads_needed(settings.admission_pools, settings.admission_routes)
+    if needed > settings.threadpool_size:
+        logger.warning(
+            "Les pools d'admission peuvent occuper %d threads et connexions pour THREADPOOL_SIZE=%d : "
+            "des requêtes risquent d'attendre une connexion en tenant un thread",
+            needed, settings.threadpool_size,
+        )
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "threadpool_size": settings.threadpool_size,
+        "pools": {name: pool.snapshot() for name, pool in admission_pools.items()},
+    }
@@ -0,0 +1,211 @@
+"""
+Diffusion des alertes de budget en temps réel (GET /budgets/alerts/stream).
+
+Les écritures de transactions tiennent à jour, dans la table budget_spend, les
+dépenses du mois de chaque catégorie budgétée et détectent à ce moment le
+franchissement des seuils de get_budget_alerts (80 %, 100 %). Les changements
+de statut sont publiés après le commit, vers les flux SSE ouverts de
+l'utilisateur : le client n'a plus à interroger /budgets/alerts.
+
+Backends (settings.alerts_backend) :
+- "memory" : flux ouverts sur ce worker seulement (un seul worker)
+- "redis" : canal Redis par utilisateur, chaque worker relaie à ses flux
+Au-delà d'un worker, Redis est imposé : sans lui, une alerte publiée par un
+worker n'atteindrait pas les flux ouverts sur les autres, et les flux sont
+refusés (503) plutôt que de manquer des alertes en silence.
+Chaque flux a une file bornée : un client trop lent perd les plus anciens
+événements, et reçoit de toute façon l'état complet à la reconnexion.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "budget-alerts:"
+# Réabonnement après une coupure de Redis : attente doublée à chaque échec
+LISTEN_RETRY_MIN_SECONDS = 0.5
+LISTEN_RETRY_MAX_SECONDS = 30
+
+
+class Subscription:
+    """Flux d'un client : file asyncio alimentée depuis n'importe quel thread"""
+
+    def __init__(self, broker: "MemoryBroker", user_id: int, queue_size: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def deliver(self, events: List[Dict[str, Any]]) -> None:
+        self.loop.call_soon_threadsafe(self._put, events)
+
+    def _put(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(event)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    """Flux ouverts sur ce worker, par utilisateur"""
+
+    def __init__(self, queue_size: int = 100, streams_enabled: bool = True):
+        self.queue_size = queue_size
+        self.streams_enabled = streams_enabled
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0}
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Ouvre un flux (depuis la boucle asyncio du worker)"""
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, events: List[Dict[str, Any]]) -> None:
+        """Publie les alertes d'un utilisateur (appelé après le commit, depuis les threads des routes)"""
+        if not events:
+            return
+        self.stats["published"] += len(events)
+        self._deliver(user_id, events)
+
+    def _deliver(self, user_id: int, events: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(events)
+        self.stats["delivered"] += len(events) * len(subscribers)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            streams = sum(len(subscribers) for subscribers in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            "backend": "memory", "streams_enabled": self.streams_enabled,
+            "streams": streams, "users": users, **self.stats,
+        }
+
+
+class RedisBroker(MemoryBroker):
+    """Publication sur Redis ; un abonnement par worker relaie les messages à ses flux"""
+
+    def __init__(self, url: str, queue_size: int = 100):
+        import redis
+        import redis.asyncio
+
+        super().__init__(queue_size)
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.client.ping()
+        self.async_client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+        self._listener: Optional[asyncio.Task] = None
+        self.stats.update(reconnections=0, malformed=0)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe(user_id)
+
+    def publish(self, user_id: int, events: List[Dict[str, Any]]) -> None:
+        if not events:
+            return
+        self.stats["published"] += len(events)
+        try:
+            self.client.publish(f"{CHANNEL_PREFIX}{user_id}", json.dumps(events))
+        except Exception as e:
+            # L'écriture est validée : seuls les flux des autres workers manquent l'alerte
+            logger.warning("Publication Redis impossible (%s), diffusion locale seulement", e)
+            self._deliver(user_id, events)
+
+    async def _listen(self) -> None:
+        """Relaie les messages aux flux de ce worker, tant que le worker tourne.
+
+        Une coupure de Redis ne doit pas arrêter la tâche : les flux déjà ouverts
+        ne recevraient plus rien, sans erreur. Elle se réabonne donc, avec une
+        attente croissante ; les alertes publiées pendant la coupure sont perdues
+        pour ces flux (l'état complet est renvoyé à la reconnexion du client).
+        """
+        delay = LISTEN_RETRY_MIN_SECONDS
+        while True:
+            pubsub = self.async_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                delay = LISTEN_RETRY_MIN_SECONDS
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._relay(message)
+                logger.warning("Abonnement Redis fermé, nouvel essai dans %.1f s", delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Abonnement Redis interrompu (%s), nouvel essai dans %.1f s", e, delay)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            self.stats["reconnections"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTEN_RETRY_MAX_SECONDS)
+
+    def _relay(self, message: Dict[str, Any]) -> None:
+        """Remet un message aux flux de l'utilisateur ; un message illisible est ignoré"""
+        try:
+            user_id = int(message["channel"][len(CHANNEL_PREFIX):])
+            events = json.loads(message["data"])
+            if not isinstance(events, list):
+                raise ValueError("liste d'événements attendue")
+        except (KeyError, TypeError, ValueError) as e:
+            self.stats["malformed"] += 1
+            logger.warning("Message d'alerte ignoré sur %s : %s", message.get("channel"), e)
+            return
+        self._deliver(user_id, events)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "backend": "redis"}
+
+
+def create_broker(name: str) -> MemoryBroker:
+    """Crée le backend demandé ; avec plusieurs workers, seul Redis atteint tous les flux"""
+    if name != "redis" and settings.api_workers > 1:
+        logger.info("ALERTS_BACKEND=%s avec %d workers : alertes diffusées par Redis", name, settings.api_workers)
+        name = "redis"
+    if name == "redis":
+        try:
+            return RedisBroker(settings.redis_url, settings.alerts_stream_queue_size)
+        except Exception as e:
+            if settings.api_workers > 1:
+                logger.error(
+                    "Redis indisponible (%s) avec %d workers : flux d'alertes désactivés (503), "
+                    "les clients interrogent GET /budgets/alerts", e, settings.api_workers,
+                )
+                return MemoryBroker(settings.alerts_stream_queue_size, streams_enabled=False)
+            logger.warning("Redis indisponible (%s), alertes diffusées par ce worker seulement", e)
+    return MemoryBroker(settings.alerts_stream_queue_size)
+
+
+# Instance globale de diffusion des alertes
+budget_alerts = create_broker(settings.alerts_backend)
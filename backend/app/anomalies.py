@@ -0,0 +1,126 @@
+"""
+Détection des dépenses inhabituelles, pour tous les utilisateurs à la fois.
+
+Une seule requête agrégée charge les dépenses mensuelles par (utilisateur,
+catégorie) sur settings.anomaly_history_months mois. Les séries sont rangées
+dans une matrice NumPy (une ligne par série, une colonne par mois) et la
+référence de chaque série est calculée en une passe : médiane et écart absolu
+médian (MAD) des mois précédents, depuis le premier mois actif de la série.
+
+Le mois analysé est signalé quand son écart robuste
+0,6745 * (montant - médiane) / MAD dépasse settings.anomaly_threshold. Les
+anomalies sont enregistrées dans `spending_anomalies`, que
+GET /transactions/anomalies lit par index (utilisateur, mois).
+
+Les mois archivés ne sont pas relus : l'historique doit rester plus court que
+settings.archive_horizon_days.
+"""
+
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import extract, func, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+
+# Facteur rendant le MAD comparable à un écart-type (loi normale)
+MAD_SCALE = 0.6745
+FETCH_BATCH_SIZE = 100_000
+
+
+def _month_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def _load_series(db: Session, start: datetime, end: datetime):
+    """(user_id, category_id, indice du mois, total) des dépenses de la période, en tableaux"""
+    year = extract("year", models.Transaction.date)
+    month = extract("month", models.Transaction.date)
+    result = db.execute(
+        db.query(
+            models.Transaction.user_id,
+            models.Transaction.category_id,
+            year,
+            month,
+            func.sum(models.Transaction.amount_minor),
+        ).filter(
+            models.Transaction.type == "depense",
+            models.Transaction.date >= start,
+            models.Transaction.date < end,
+        ).group_by(
+            models.Transaction.user_id, models.Transaction.category_id, year, month
+        ).statement
+    )
+    # Conversion en tuples d'abord : NumPy est bien plus lent sur les objets Row
+    chunks = [np.array([tuple(row) for row in rows], dtype=np.int64) for rows in result.partitions(FETCH_BATCH_SIZE)]
+    data = np.concatenate(chunks) if chunks else np.empty((0, 5), dtype=np.int64)
+    return data[:, 0], data[:, 1], data[:, 2] * 12 + data[:, 3] - 1, data[:, 4]
+
+
+def robust_scores(matrix: np.ndarray, min_history: int):
+    """Médiane, MAD et écart robuste de la dernière colonne par rapport aux précédentes.
+
+    Les mois antérieurs au premier mois actif d'une série sont ignorés ; les
+    séries ayant moins de min_history mois d'historique ont un score nul.
+    """
+    history = matrix[:, :-1].astype(np.float64)
+    current = matrix[:, -1].astype(np.float64)
+    active = np.maximum.accumulate(history > 0, axis=1)
+    history[~active] = np.nan
+    months = active.sum(axis=1)
+
+    scores = np.zeros(len(matrix))
+    baseline = np.zeros(len(matrix))
+    eligible = months >= min_history
+    if eligible.any():
+        h = history[eligible]
+        median = np.nanmedian(h, axis=1)
+        mad = np.nanmedian(np.abs(h - median[:, None]), axis=1)
+        # Série très régulière : MAD plancher à 10 % de la médiane (et 1 unité mineure)
+        mad = np.maximum(mad, np.maximum(0.1 * median, 1))
+        baseline[eligible] = median
+        scores[eligible] = MAD_SCALE * (current[eligible] - median) / mad
+    return baseline, scores
+
+
+def detect_anomalies(db: Session, month: Optional[str] = None) -> Dict[str, int]:
+    """Recalcule les anomalies d'un mois (YYYY-MM, mois en cours par défaut) pour tous les utilisateurs"""
+    month = month or datetime.now().strftime("%Y-%m")
+    target = _month_index(int(month[:4]), int(month[5:7]))
+    first = target - settings.anomaly_history_months
+    start = datetime(first // 12, first % 12 + 1, 1)
+    end = datetime((target + 1) // 12, (target + 1) % 12 + 1, 1)
+
+    user_ids, category_ids, month_ids, totals = _load_series(db, start, end)
+
+    # Une ligne par série (utilisateur, catégorie), une colonne par mois
+    series, row_of = np.unique(np.stack([user_ids, category_ids], axis=1), axis=0, return_inverse=True)
+    row_of = row_of.reshape(-1)
+    matrix = np.zeros((len(series), target - first + 1), dtype=np.int64)
+    np.add.at(matrix, (row_of, month_ids - first), totals)
+
+    baseline, scores = robust_scores(matrix, settings.anomaly_min_history)
+    current = matrix[:, -1]
+    flagged = np.flatnonzero(
+        (scores > settings.anomaly_threshold) & (current > baseline * settings.anomaly_min_ratio)
+    )
+
+    rows = [
+        {
+            "user_id": int(series[i, 0]),
+            "category_id": int(series[i, 1]),
+            "month": month,
+            "amount_minor": int(current[i]),
+            "baseline_minor": int(round(baseline[i])),
+            "score": float(scores[i]),
+        }
+        for i in flagged.tolist()
+    ]
+    db.query(models.SpendingAnomaly).filter(models.SpendingAnomaly.month == month).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(models.SpendingAnomaly), rows)
+    db.commit()
+    return {"series": int(len(series)), "anomalies": len(rows)}
@@ -0,0 +1,23 @@
+import re
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth import get_current_active_user
+from .. import schemas
+from ..peers import peer_comparison
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.get("/peers", response_model=schemas.PeerBenchmarks)
+@statement_budget(5)  # authentification, dernier mois, vos totaux, catégories communes, t-digests
+def get_peer_benchmarks(
+    month: Optional[str] = Query(None, description="Format: YYYY-MM (dernier mois calculé par défaut)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Parts de vos dépenses par catégorie comparées à celles des utilisateurs semblables"""
+    if month is not None and not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+        raise HTTPException(status_code=400, detail=f"Mois invalide: {month}")
+    return peer_comparison(db=db, user=current_user, month=month)
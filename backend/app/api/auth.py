@@ -1,65 +1,77 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..auth import authenticate_user, create_access_token, get_current_active_user
-from .. import crud, schemas
-from ..config import settings
-
-router = APIRouter()
-
-@router.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    """Inscription d'un nouvel utilisateur"""
-    # Vérifier si l'utilisateur existe déjà
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Un utilisateur avec cet email existe déjà"
-        )
-    
-    db_user = crud.get_user_by_username(db, username=user.username)
-    if db_user:
-        raise HTTPException(
-            status_code=400,
-            detail="Un utilisateur avec ce nom d'utilisateur existe déjà"
-        )
-    
-    return crud.create_user(db=db, user=user)
-
-@router.post("/token", response_model=schemas.Token)
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
-):
-    """Connexion et obtention du token JWT"""
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Nom d'utilisateur ou mot de passe incorrect",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
-
-@router.get("/me", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(get_current_active_user)):
-    """Récupère les informations de l'utilisateur connecté"""
-    return current_user
-
-@router.put("/me", response_model=schemas.User)
-def update_user_me(
-    user_update: schemas.UserUpdate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Met à jour les informations de l'utilisateur connecté"""
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth import authenticate_user, create_access_token, get_current_active_user
+from .. import crud, schemas
+from ..config import settings
+from ..money import CURRENCY_EXPONENTS
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.post("/register", response_model=schemas.User)
+@statement_budget(4)
+def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    """Inscription d'un nouvel utilisateur"""
+    # Vérifier si l'utilisateur existe déjà
+    db_user = crud.get_user_by_email(db, email=user.email)
+    if db_user:
+        raise HTTPException(
+            status_code=400,
+            detail="Un utilisateur avec cet email existe déjà"
+        )
+    
+    db_user = crud.get_user_by_username(db, username=user.username)
+    if db_user:
+        raise HTTPException(
+            status_code=400,
+            detail="Un utilisateur avec ce nom d'utilisateur existe déjà"
+        )
+    
+    if user.currency.upper() not in CURRENCY_EXPONENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Devise non prise en charge : {user.currency}"
+        )
+    
+    return crud.create_user(db=db, user=user)
+
+@router.post("/token", response_model=schemas.Token)
+@statement_budget(1)
+def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
+    """Connexion et obtention du token JWT"""
+    user = authenticate_user(db, form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Nom d'utilisateur ou mot de passe incorrect",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get("/me", response_model=schemas.User)
+@statement_budget(1)
+def read_users_me(current_user: schemas.User = Depends(get_current_active_user)):
+    """Récupère les informations de l'utilisateur connecté"""
+    return current_user
+
+@router.put("/me", response_model=schemas.User)
+@statement_budget(4)
+def update_user_me(
+    user_update: schemas.UserUpdate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Met à jour les informations de l'utilisateur connecté"""
     return crud.update_user(db=db, user_id=current_user.id, user_update=user_update) 
\ No newline at end of file
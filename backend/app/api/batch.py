@@ -0,0 +1,172 @@
+"""
+Requêtes groupées : POST /batch exécute plusieurs appels de l'API en un seul
+aller-retour (chargement du tableau de bord sur réseau mobile).
+
+Les sous-requêtes passent par les routers existants (mêmes validations,
+mêmes réponses d'erreur, même limitation de débit) avec une seule
+authentification : l'utilisateur de la requête parente est transmis via
+request.state et n'est plus relu en base. Les écritures et les lectures qui
+les suivent partagent la session de la requête parente, dans l'ordre du lot.
+Une suite de lectures (GET) consécutives s'exécute en parallèle, chacune sur
+sa propre session (une session SQLAlchemy ne se partage pas entre threads),
+dans la limite de settings.batch_concurrency.
+"""
+
+import asyncio
+import json
+import logging
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from starlette.middleware.exceptions import ExceptionMiddleware
+
+from ..auth import get_current_active_user
+from ..config import settings
+from ..database import engine, get_db
+from ..ratelimit import RateLimitMiddleware, bucket_backend
+from .. import schemas
+from ..sqlstats import statement_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Pile ASGI des sous-requêtes (routers + gestion des HTTPException), construite une fois par application
+_dispatchers: Dict[int, Any] = {}
+
+
+def _dispatcher(app):
+    dispatcher = _dispatchers.get(id(app))
+    if dispatcher is None:
+        handlers = {key: value for key, value in app.exception_handlers.items() if key not in (500, Exception)}
+        dispatcher = RateLimitMiddleware(
+            ExceptionMiddleware(app.router, handlers=handlers),
+            backend=bucket_backend,
+            limits=settings.rate_limits,
+        )
+        _dispatchers[id(app)] = dispatcher
+    return dispatcher
+
+
+def _concurrent_reads_allowed() -> bool:
+    # Une base SQLite en mémoire n'a qu'une connexion : lectures séquentielles
+    return settings.batch_concurrency > 1 and ":memory:" not in str(engine.url)
+
+
+async def _dispatch(request: Request, sub: schemas.BatchSubRequest, state: Dict[str, Any]) -> schemas.BatchSubResponse:
+    """Exécute une sous-requête sur les routers de l'application"""
+    path, _, query = sub.path.partition("?")
+    body = b"" if sub.body is None else json.dumps(sub.body).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    headers += [(name, value) for name, value in request.scope["headers"] if name == b"authorization"]
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub.method.upper(),
+        "scheme": request.scope.get("scheme", "http"),
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": request.scope.get("root_path", ""),
+        "query_string": query.encode(),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        "app": request.app,
+        "state": state,
+    }
+
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = 500
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        async with AsyncExitStack() as stack:
+            # Fermeture des dépendances à yield (sessions), comme pour une requête HTTP
+            scope["fastapi_astack"] = stack
+            await _dispatcher(request.app)(scope, receive, send)
+    except Exception:
+        logger.exception("Échec de la sous-requête %s %s", sub.method, sub.path)
+        shared = state.get("batch_db")
+        if shared is not None:
+            shared.rollback()
+        return schemas.BatchSubResponse(id=sub.id, status=500, body={"detail": "Erreur interne"})
+
+    raw = b"".join(chunks)
+    try:
+        content = json.loads(raw) if raw else None
+    except ValueError:
+        content = raw.decode("utf-8", "replace")
+    return schemas.BatchSubResponse(id=sub.id, status=status, body=content)
+
+
+@router.post("/batch", response_model=schemas.BatchResponse)
+@statement_budget(4)  # lot de check_query_budgets.py : authentification et deux sous-requêtes
+async def run_batch(
+    batch: schemas.BatchRequest,
+    request: Request,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Exécute plusieurs requêtes de l'API en un seul appel (réponses dans l'ordre du lot)"""
+    if len(batch.requests) > settings.batch_max_requests:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de requêtes dans le lot (maximum {settings.batch_max_requests})"
+        )
+    for sub in batch.requests:
+        if not sub.path.startswith("/"):
+            raise HTTPException(status_code=422, detail=f"Chemin invalide : {sub.path}")
+        if sub.path.partition("?")[0].rstrip("/") == "/batch":
+            raise HTTPException(status_code=422, detail="Les lots imbriqués ne sont pas autorisés")
+        if sub.path.partition("?")[0].rstrip("/") == "/budgets/alerts/stream":
+            raise HTTPException(status_code=422, detail="Les flux ne sont pas disponibles dans un lot")
+
+    shared_state = {"batch_user": current_user, "batch_db": db}
+    concurrent = _concurrent_reads_allowed()
+    semaphore = asyncio.Semaphore(max(settings.batch_concurrency, 1))
+
+    async def read(sub: schemas.BatchSubRequest) -> schemas.BatchSubResponse:
+        async with semaphore:
+            # Session propre à la lecture (servie par le réplica si configuré)
+            return await _dispatch(request, sub, {"batch_user": current_user})
+
+    responses: List[Optional[schemas.BatchSubResponse]] = []
+    pending: List[schemas.BatchSubRequest] = []
+
+    async def flush_reads():
+        if len(pending) == 1:
+            responses.append(await _dispatch(request, pending[0], shared_state))
+        elif pending:
+            # Recharger l'utilisateur expiré par un commit ici, pas depuis les threads des lectures
+            if "id" not in current_user.__dict__:
+                db.refresh(current_user)
+            responses.extend(await asyncio.gather(*(read(sub) for sub in pending)))
+        pending.clear()
+
+    for sub in batch.requests:
+        if concurrent and sub.method.upper() == "GET":
+            pending.append(sub)
+            continue
+        await flush_reads()
+        responses.append(await _dispatch(request, sub, shared_state))
+    await flush_reads()
+
+    return schemas.BatchResponse(responses=responses)
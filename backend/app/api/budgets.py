@@ -1,76 +1,176 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..auth import get_current_active_user
-from .. import crud, schemas
-
-router = APIRouter()
-
-@router.post("/", response_model=schemas.Budget)
-def create_budget(
-    budget: schemas.BudgetCreate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Crée un nouveau budget"""
-    return crud.create_budget(db=db, budget=budget, user_id=current_user.id)
-
-@router.get("/", response_model=List[schemas.Budget])
-def get_budgets(
-    month: Optional[str] = None,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère les budgets de l'utilisateur"""
-    return crud.get_user_budgets(db=db, user_id=current_user.id, month=month)
-
-@router.put("/{budget_id}", response_model=schemas.Budget)
-def update_budget(
-    budget_id: int,
-    budget_update: schemas.BudgetUpdate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Met à jour un budget"""
-    # Vérifier que le budget appartient à l'utilisateur
-    budget = db.query(crud.models.Budget).filter(
-        crud.models.Budget.id == budget_id,
-        crud.models.Budget.user_id == current_user.id
-    ).first()
-    
-    if not budget:
-        raise HTTPException(status_code=404, detail="Budget non trouvé")
-    
-    return crud.update_budget(db=db, budget_id=budget_id, budget_update=budget_update)
-
-@router.delete("/{budget_id}")
-def delete_budget(
-    budget_id: int,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Supprime un budget"""
-    # Vérifier que le budget appartient à l'utilisateur
-    budget = db.query(crud.models.Budget).filter(
-        crud.models.Budget.id == budget_id,
-        crud.models.Budget.user_id == current_user.id
-    ).first()
-    
-    if not budget:
-        raise HTTPException(status_code=404, detail="Budget non trouvé")
-    
-    success = crud.delete_budget(db=db, budget_id=budget_id)
-    if not success:
-        raise HTTPException(status_code=500, detail="Erreur lors de la suppression")
-    
-    return {"message": "Budget supprimé avec succès"}
-
-@router.get("/alerts")
-def get_budget_alerts(
-    month: str = Query(..., description="Mois au format YYYY-MM"),
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère les alertes de budget pour un mois donné"""
-    return crud.get_budget_alerts(db=db, user_id=current_user.id, month=month) 
\ No newline at end of file
+import asyncio
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from ..database import SessionLocal, get_db, shard_router
+from ..auth import (
+    create_stream_ticket, get_current_active_user, get_current_user, get_ticket_user, optional_oauth2_scheme
+)
+from .. import crud, schemas
+from ..alerts import budget_alerts
+from ..config import settings
+from ..fieldsets import BUDGET_FIELDS
+from ..money import user_exponents
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.post("/", response_model=schemas.Budget)
+@statement_budget(7)
+def create_budget(
+    budget: schemas.BudgetCreate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Crée un nouveau budget"""
+    return crud.create_budget(db=db, budget=budget, user_id=current_user.id)
+
+@router.get("/", response_model=List[schemas.Budget])
+@statement_budget(2)
+def get_budgets(
+    month: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Champs à renvoyer, ex. date,amount,category"),
+    layout: str = Query("rows", description="rows (un objet par ligne) ou columns (un tableau par champ)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les budgets de l'utilisateur"""
+    try:
+        selected = BUDGET_FIELDS.parse(fields, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if selected is None:
+        return crud.get_budgets(db=db, user_id=current_user.id, month=month)
+    budgets = crud.get_budgets(db=db, user_id=current_user.id, month=month, columns=BUDGET_FIELDS.columns(selected))
+    return JSONResponse(BUDGET_FIELDS.encode(budgets, selected, user_exponents.get(current_user.id), layout))
+
+@router.put("/{budget_id}", response_model=schemas.Budget)
+@statement_budget(7)
+def update_budget(
+    budget_id: int,
+    budget_update: schemas.BudgetUpdate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Met à jour un budget"""
+    # crud ne trouve que les budgets de l'utilisateur : une seule lecture
+    budget = crud.update_budget(db=db, budget_id=budget_id, budget_update=budget_update, user_id=current_user.id)
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget non trouvé")
+    
+    return budget
+
+@router.delete("/{budget_id}")
+@statement_budget(4)
+def delete_budget(
+    budget_id: int,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Supprime un budget"""
+    # crud ne trouve que les budgets de l'utilisateur : une seule lecture
+    if not crud.delete_budget(db=db, budget_id=budget_id, user_id=current_user.id):
+        raise HTTPException(status_code=404, detail="Budget non trouvé")
+    
+    return {"message": "Budget supprimé avec succès"}
+
+@router.get("/alerts")
+@statement_budget(3)
+def get_budget_alerts(
+    month: str = Query(..., description="Mois au format YYYY-MM"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les alertes de budget pour un mois donné"""
+    return crud.get_budget_alerts(db=db, user_id=current_user.id, month=month)
+
+@router.post("/alerts/stream/ticket", response_model=schemas.StreamTicket)
+@statement_budget(1)
+def create_alerts_stream_ticket(current_user: schemas.User = Depends(get_current_active_user)):
+    """Ticket d'ouverture du flux d'alertes, valable quelques secondes.
+
+    EventSource ne peut pas envoyer d'en-tête Authorization : le ticket passe
+    dans l'URL (?ticket=) à la place du token, qui finirait sinon dans les
+    journaux d'accès et des proxys.
+    """
+    return {"ticket": create_stream_ticket(current_user.username), "expires_in": settings.stream_ticket_seconds}
+
+def get_stream_user(
+    request: Request,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    ticket: Optional[str] = Query(None, description="Ticket de POST /budgets/alerts/stream/ticket (clients EventSource)")
+):
+    """Utilisateur authentifié sans garder de connexion pendant toute la durée du flux"""
+    db = SessionLocal()
+    db.info["read_only"] = True
+    try:
+        if token is None and ticket is not None:
+            return get_ticket_user(ticket, db)
+        return get_current_active_user(get_current_user(request, token or "", db))
+    finally:
+        db.close()
+
+def _current_alerts(user_id: int, month: str):
+    db = SessionLocal()
+    db.info["read_only"] = True
+    try:
+        shard_router.bind(db, user_id)
+        return crud.get_budget_alerts(db=db, user_id=user_id, month=month)
+    finally:
+        db.close()
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/alerts/stream")
+@statement_budget(3)
+async def stream_budget_alerts(
+    request: Request,
+    current_user: schemas.User = Depends(get_stream_user)
+):
+    """Flux SSE des alertes de budget.
+
+    Envoie d'abord l'état du mois en cours (événement snapshot), puis un
+    événement budget_alert à chaque changement de statut d'un budget
+    (good, warning, exceeded) provoqué par une écriture.
+    """
+    if not budget_alerts.streams_enabled:
+        raise HTTPException(
+            status_code=503,
+            detail="Flux d'alertes indisponible, interrogez GET /budgets/alerts",
+            headers={"Retry-After": "60"},
+        )
+    user_id = current_user.id
+    # Abonnement avant l'état initial : aucun changement ne tombe entre les deux
+    subscription = budget_alerts.subscribe(user_id)
+    month = datetime.now().strftime("%Y-%m")
+    try:
+        alerts = await run_in_threadpool(_current_alerts, user_id, month)
+    except BaseException:
+        subscription.close()
+        raise
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse("snapshot", {"month": month, "alerts": alerts})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), settings.alerts_stream_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Garde la connexion ouverte à travers les proxys
+                    yield ": ping\n\n"
+                    continue
+                yield _sse("budget_alert", event)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
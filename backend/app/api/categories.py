@@ -1,26 +1,38 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..auth import get_current_active_user
-from .. import crud, schemas
-
-router = APIRouter()
-
-@router.get("/", response_model=List[schemas.Category])
-def get_categories(
-    category_type: Optional[str] = Query(None, description="Type de catégorie: 'revenu' ou 'depense'"),
-    db: Session = Depends(get_db)
-):
-    """Récupère toutes les catégories disponibles"""
-    return crud.get_categories(db=db, category_type=category_type)
-
-@router.post("/", response_model=schemas.Category)
-def create_category(
-    category: schemas.CategoryCreate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Crée une nouvelle catégorie (admin seulement)"""
-    # Ici vous pourriez ajouter une vérification pour les droits admin
-    return crud.create_category(db=db, category=category) 
\ No newline at end of file
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth import get_current_active_user, get_optional_user
+from .. import crud, schemas
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.Category])
+@statement_budget(2)
+def get_categories(
+    category_type: Optional[str] = Query(None, description="Type de catégorie: 'revenu' ou 'depense'"),
+    current_user: Optional[schemas.User] = Depends(get_optional_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les catégories communes, et celles de l'utilisateur s'il est connecté"""
+    user_id = current_user.id if current_user else None
+    return crud.get_categories(db=db, category_type=category_type, user_id=user_id)
+
+@router.post("/", response_model=schemas.Category)
+@statement_budget(4)
+def create_category(
+    category: schemas.CategoryCreate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Crée une catégorie propre à l'utilisateur"""
+    if crud.get_category_by_name(db, name=category.name, user_id=current_user.id):
+        raise HTTPException(status_code=409, detail=f"La catégorie {category.name} existe déjà")
+    try:
+        return crud.create_category(db=db, category=category, user_id=current_user.id)
+    except IntegrityError:
+        # Créée au même moment par une autre requête de l'utilisateur
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"La catégorie {category.name} existe déjà")
@@ -1,84 +1,89 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..auth import get_current_active_user
-from .. import crud, schemas
-
-router = APIRouter()
-
-@router.post("/", response_model=schemas.Goal)
-def create_goal(
-    goal: schemas.GoalCreate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Crée un nouvel objectif"""
-    return crud.create_goal(db=db, goal=goal, user_id=current_user.id)
-
-@router.get("/", response_model=List[schemas.Goal])
-def get_goals(
-    active_only: bool = Query(True, description="Récupérer seulement les objectifs actifs"),
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère les objectifs de l'utilisateur"""
-    return crud.get_user_goals(db=db, user_id=current_user.id, active_only=active_only)
-
-@router.get("/{goal_id}", response_model=schemas.Goal)
-def get_goal(
-    goal_id: int,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère un objectif spécifique"""
-    goal = db.query(crud.models.Goal).filter(
-        crud.models.Goal.id == goal_id,
-        crud.models.Goal.user_id == current_user.id
-    ).first()
-    
-    if not goal:
-        raise HTTPException(status_code=404, detail="Objectif non trouvé")
-    
-    return goal
-
-@router.put("/{goal_id}", response_model=schemas.Goal)
-def update_goal(
-    goal_id: int,
-    goal_update: schemas.GoalUpdate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Met à jour un objectif"""
-    # Vérifier que l'objectif appartient à l'utilisateur
-    goal = db.query(crud.models.Goal).filter(
-        crud.models.Goal.id == goal_id,
-        crud.models.Goal.user_id == current_user.id
-    ).first()
-    
-    if not goal:
-        raise HTTPException(status_code=404, detail="Objectif non trouvé")
-    
-    return crud.update_goal(db=db, goal_id=goal_id, goal_update=goal_update)
-
-@router.delete("/{goal_id}")
-def delete_goal(
-    goal_id: int,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Supprime un objectif"""
-    # Vérifier que l'objectif appartient à l'utilisateur
-    goal = db.query(crud.models.Goal).filter(
-        crud.models.Goal.id == goal_id,
-        crud.models.Goal.user_id == current_user.id
-    ).first()
-    
-    if not goal:
-        raise HTTPException(status_code=404, detail="Objectif non trouvé")
-    
-    success = crud.delete_goal(db=db, goal_id=goal_id)
-    if not success:
-        raise HTTPException(status_code=500, detail="Erreur lors de la suppression")
-    
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth import get_current_active_user
+from .. import crud, schemas
+from ..fieldsets import GOAL_FIELDS
+from ..money import user_exponents
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.post("/", response_model=schemas.Goal)
+@statement_budget(3)
+def create_goal(
+    goal: schemas.GoalCreate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Crée un nouvel objectif"""
+    return crud.create_goal(db=db, goal=goal, user_id=current_user.id)
+
+@router.get("/", response_model=List[schemas.Goal])
+@statement_budget(2)
+def get_goals(
+    active_only: bool = Query(True, description="Récupérer seulement les objectifs actifs"),
+    fields: Optional[str] = Query(None, description="Champs à renvoyer, ex. date,amount,category"),
+    layout: str = Query("rows", description="rows (un objet par ligne) ou columns (un tableau par champ)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les objectifs de l'utilisateur"""
+    try:
+        selected = GOAL_FIELDS.parse(fields, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if selected is None:
+        return crud.get_goals(db=db, user_id=current_user.id, active_only=active_only)
+    goals = crud.get_goals(db=db, user_id=current_user.id, active_only=active_only, columns=GOAL_FIELDS.columns(selected))
+    return JSONResponse(GOAL_FIELDS.encode(goals, selected, user_exponents.get(current_user.id), layout))
+
+@router.get("/{goal_id}", response_model=schemas.Goal)
+@statement_budget(2)
+def get_goal(
+    goal_id: int,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère un objectif spécifique"""
+    goal = db.query(crud.models.Goal).filter(
+        crud.models.Goal.id == goal_id,
+        crud.models.Goal.user_id == current_user.id
+    ).first()
+    
+    if not goal:
+        raise HTTPException(status_code=404, detail="Objectif non trouvé")
+    
+    return goal
+
+@router.put("/{goal_id}", response_model=schemas.Goal)
+@statement_budget(4)
+def update_goal(
+    goal_id: int,
+    goal_update: schemas.GoalUpdate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Met à jour un objectif"""
+    # crud ne trouve que les objectifs de l'utilisateur : une seule lecture
+    goal = crud.update_goal(db=db, goal_id=goal_id, goal_update=goal_update, user_id=current_user.id)
+    if not goal:
+        raise HTTPException(status_code=404, detail="Objectif non trouvé")
+    
+    return goal
+
+@router.delete("/{goal_id}")
+@statement_budget(3)
+def delete_goal(
+    goal_id: int,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Supprime un objectif"""
+    # crud ne trouve que les objectifs de l'utilisateur : une seule lecture
+    if not crud.delete_goal(db=db, goal_id=goal_id, user_id=current_user.id):
+        raise HTTPException(status_code=404, detail="Objectif non trouvé")
+    
     return {"message": "Objectif supprimé avec succès"} 
\ No newline at end of file
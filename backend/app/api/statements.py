@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..auth import get_current_active_user
+from .. import schemas
+from ..statements import MONTH_PATTERN, STATEMENT_FORMATS, is_closed, read_statement, statement_generator
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+@router.get("/{month}")
+@statement_budget(1)
+def get_statement(
+    month: str,
+    request: Request,
+    format: str = Query("json", description="json, csv ou html"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Relevé d'un mois terminé : totaux, catégories, budgets et transactions.
+
+    Servi depuis le disque une fois calculé ; sinon le calcul est lancé en
+    arrière-plan et la réponse est 202 avec Retry-After.
+    """
+    if not MONTH_PATTERN.fullmatch(month):
+        raise HTTPException(status_code=400, detail=f"Mois invalide: {month}")
+    if format not in STATEMENT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format inconnu: {format} ({', '.join(STATEMENT_FORMATS)})")
+    if not is_closed(month):
+        raise HTTPException(status_code=409, detail=f"Le relevé de {month} sera disponible à la fin du mois")
+
+    stored = read_statement(current_user.id, month, format)
+    if stored is None:
+        statement_generator.schedule(current_user.id, month, db.info.get("shard"))
+        return JSONResponse(
+            status_code=202,
+            content={"detail": "Relevé en cours de préparation, réessayez dans quelques secondes", "month": month},
+            headers={"Retry-After": "2"}
+        )
+    content, etag = stored
+    # Revalidation à chaque fois : une transaction saisie après coup peut changer le relevé
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="releve-{month}.csv"'
+    return Response(content=content, media_type=STATEMENT_FORMATS[format], headers=headers)
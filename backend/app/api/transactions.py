@@ -1,111 +1,281 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from datetime import datetime
-from ..database import get_db
-from ..auth import get_current_active_user
-from .. import crud, schemas
-
-router = APIRouter()
-
-@router.post("/", response_model=schemas.Transaction)
-def create_transaction(
-    transaction: schemas.TransactionCreate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Crée une nouvelle transaction"""
-    return crud.create_transaction(db=db, transaction=transaction, user_id=current_user.id)
-
-@router.get("/", response_model=List[schemas.Transaction])
-def get_transactions(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    transaction_type: Optional[str] = None,
-    category: Optional[str] = None,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère les transactions de l'utilisateur avec filtres"""
-    # Convertir les dates si fournies
-    start_dt = None
-    end_dt = None
-    
-    if start_date:
-        try:
-            start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Format de date invalide pour start_date")
-    
-    if end_date:
-        try:
-            end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Format de date invalide pour end_date")
-    
-    return crud.get_user_transactions(
-        db=db,
-        user_id=current_user.id,
-        skip=skip,
-        limit=limit,
-        start_date=start_dt,
-        end_date=end_dt,
-        transaction_type=transaction_type,
-        category=category
-    )
-
-@router.get("/{transaction_id}", response_model=schemas.Transaction)
-def get_transaction(
-    transaction_id: int,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère une transaction spécifique"""
-    transaction = crud.get_transaction(db=db, transaction_id=transaction_id)
-    if not transaction or transaction.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Transaction non trouvée")
-    return transaction
-
-@router.put("/{transaction_id}", response_model=schemas.Transaction)
-def update_transaction(
-    transaction_id: int,
-    transaction_update: schemas.TransactionUpdate,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Met à jour une transaction"""
-    # Vérifier que la transaction appartient à l'utilisateur
-    transaction = crud.get_transaction(db=db, transaction_id=transaction_id)
-    if not transaction or transaction.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Transaction non trouvée")
-    
-    return crud.update_transaction(db=db, transaction_id=transaction_id, transaction_update=transaction_update)
-
-@router.delete("/{transaction_id}")
-def delete_transaction(
-    transaction_id: int,
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Supprime une transaction"""
-    # Vérifier que la transaction appartient à l'utilisateur
-    transaction = crud.get_transaction(db=db, transaction_id=transaction_id)
-    if not transaction or transaction.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Transaction non trouvée")
-    
-    success = crud.delete_transaction(db=db, transaction_id=transaction_id)
-    if not success:
-        raise HTTPException(status_code=500, detail="Erreur lors de la suppression")
-    
-    return {"message": "Transaction supprimée avec succès"}
-
-@router.get("/summary/analytics")
-def get_transactions_analytics(
-    months: int = Query(6, ge=1, le=24),
-    current_user: schemas.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Récupère les analyses des transactions"""
-    return crud.get_user_analytics(db=db, user_id=current_user.id, months=months) 
\ No newline at end of file
+import math
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from ..database import SessionLocal, get_db
+from ..auth import get_current_active_user, get_current_user, oauth2_scheme
+from .. import crud, schemas
+from ..config import settings
+from ..columnar import user_snapshots, GROUP_FIELDS, BUCKETS
+from ..fieldsets import TRANSACTION_FIELDS
+from ..timeseries import BUCKETS as TIMESERIES_BUCKETS, compute_timeseries
+from ..money import AmountError, user_exponents
+from ..admission import Overloaded
+from ..ingest import ingest_queue
+from ..sqlstats import statement_budget
+
+router = APIRouter()
+
+def parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    """Convertit une date ISO 8601 en datetime (HTTP 400 si invalide)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Format de date invalide pour {name}")
+
+@router.post("/", response_model=schemas.Transaction)
+@statement_budget(5)
+def create_transaction(
+    transaction: schemas.TransactionCreate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Crée une nouvelle transaction"""
+    return crud.create_transaction(db=db, transaction=transaction, user_id=current_user.id)
+
+def get_ingest_user(request: Request, token: str = Depends(oauth2_scheme)):
+    """Utilisateur authentifié sans garder de connexion pendant l'attente de l'accusé de réception"""
+    db = SessionLocal()
+    db.info["read_only"] = True
+    try:
+        return get_current_active_user(get_current_user(request, token, db))
+    finally:
+        db.close()
+
+@router.post("/ingest", status_code=202, response_model=schemas.IngestResult)
+@statement_budget(1)
+async def ingest_transactions(
+    request: schemas.IngestRequest,
+    current_user: schemas.User = Depends(get_ingest_user)
+):
+    """Dépose des transactions dans la file d'ingestion (flux mobile money, synchronisations).
+
+    Répond une fois les transactions écrites dans le spool durable ; elles sont
+    insérées en base par lots dans les millisecondes qui suivent.
+    """
+    try:
+        accepted = await ingest_queue.submit(current_user.id, request.transactions)
+    except AmountError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        retry_after = max(1, math.ceil(e.retry_after))
+        raise HTTPException(
+            status_code=503,
+            detail=f"Ingestion surchargée ({e.reason}), réessayez dans {retry_after} s",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return {"accepted": accepted}
+
+@router.post("/categorize", response_model=List[schemas.CategoryPrediction])
+@statement_budget(5)
+def categorize_transactions(
+    request: schemas.CategorizeRequest,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Prédit la catégorie d'un lot de transactions à importer (synchronisation mobile money, migration)"""
+    if len(request.transactions) > settings.classifier_max_batch:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lot trop volumineux (maximum {settings.classifier_max_batch} transactions)"
+        )
+    return crud.categorize_transactions(db=db, user_id=current_user.id, items=request.transactions)
+
+@router.post("/categorize/pending")
+@statement_budget(2)
+def categorize_pending_transactions(
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Recatégorise les transactions restées dans une catégorie fourre-tout ("Divers")"""
+    return crud.categorize_pending_transactions(
+        db=db,
+        user_id=current_user.id,
+        min_confidence=settings.classifier_min_confidence if min_confidence is None else min_confidence,
+        limit=settings.classifier_max_batch
+    )
+
+@router.get("/", response_model=List[schemas.Transaction])
+@statement_budget(2)
+def get_transactions(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Champs à renvoyer, ex. date,amount,category"),
+    layout: str = Query("rows", description="rows (un objet par ligne) ou columns (un tableau par champ)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les transactions de l'utilisateur avec filtres"""
+    # Convertir les dates si fournies
+    start_dt = parse_date(start_date, "start_date")
+    end_dt = parse_date(end_date, "end_date")
+    try:
+        selected = TRANSACTION_FIELDS.parse(fields, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    transactions = crud.get_user_transactions(
+        db=db,
+        user_id=current_user.id,
+        skip=skip,
+        limit=limit,
+        start_date=start_dt,
+        end_date=end_dt,
+        transaction_type=transaction_type,
+        category=category,
+        columns=TRANSACTION_FIELDS.columns(selected) if selected else None
+    )
+    if selected is None:
+        return transactions
+    # Projection : encodage direct, sans validation de la réponse complète
+    return JSONResponse(TRANSACTION_FIELDS.encode(transactions, selected, user_exponents.get(current_user.id), layout))
+
+@router.get("/anomalies", response_model=List[schemas.SpendingAnomaly])
+@statement_budget(2)
+def get_anomalies(
+    month: Optional[str] = Query(None, description="Format: YYYY-MM (mois en cours par défaut)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Dépenses inhabituelles par catégorie, détectées chaque nuit"""
+    return crud.get_user_anomalies(db=db, user_id=current_user.id, month=month)
+
+@router.get("/timeseries")
+@statement_budget(3)
+def get_timeseries(
+    bucket: str = Query("day", description="Période: day, week ou month"),
+    start_date: Optional[str] = Query(None, description="Début (un an avant la fin par défaut)"),
+    end_date: Optional[str] = Query(None, description="Fin, jour inclus (maintenant par défaut)"),
+    by_category: bool = Query(False, description="Dépenses empilées par catégorie"),
+    max_points: int = Query(settings.timeseries_max_points, ge=3, le=5000, description="Nombre maximal de points (LTTB)"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Revenus, dépenses et solde cumulé par période, réduits pour les graphiques"""
+    if bucket not in TIMESERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Période invalide: {bucket}")
+    end_dt = parse_date(end_date, "end_date")
+    if end_dt is None:
+        end_dt = datetime.now()
+    elif len(end_date) == 10:
+        # Date seule : le jour entier est inclus
+        end_dt += timedelta(days=1)
+    start_dt = parse_date(start_date, "start_date") or end_dt - timedelta(days=365)
+    start_dt, end_dt = (
+        value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+        for value in (start_dt, end_dt)
+    )
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="start_date doit précéder end_date")
+    
+    return compute_timeseries(
+        db=db,
+        user_id=current_user.id,
+        start=start_dt,
+        end=end_dt,
+        bucket=bucket,
+        by_category=by_category,
+        max_points=max_points
+    )
+
+@router.get("/{transaction_id}", response_model=schemas.Transaction)
+@statement_budget(2)
+def get_transaction(
+    transaction_id: int,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère une transaction spécifique (archive comprise)"""
+    transaction = crud.get_transaction(db=db, transaction_id=transaction_id, user_id=current_user.id)
+    if not transaction:
+        transaction = crud.get_archived_transaction(user_id=current_user.id, transaction_id=transaction_id)
+    if not transaction or transaction.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Transaction non trouvée")
+    return transaction
+
+def _not_found_or_archived(user_id: int, transaction_id: int) -> HTTPException:
+    """404, ou 409 si la transaction a été déplacée dans l'archive (années closes en lecture seule)"""
+    if crud.get_archived_transaction(user_id=user_id, transaction_id=transaction_id) is not None:
+        return HTTPException(status_code=409, detail="Transaction archivée : les années closes ne sont plus modifiables")
+    return HTTPException(status_code=404, detail="Transaction non trouvée")
+
+@router.put("/{transaction_id}", response_model=schemas.Transaction)
+@statement_budget(6)
+def update_transaction(
+    transaction_id: int,
+    transaction_update: schemas.TransactionUpdate,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Met à jour une transaction"""
+    # crud ne trouve que les transactions de l'utilisateur : une seule lecture
+    transaction = crud.update_transaction(db=db, transaction_id=transaction_id, transaction_update=transaction_update, user_id=current_user.id)
+    if not transaction:
+        raise _not_found_or_archived(current_user.id, transaction_id)
+    
+    return transaction
+
+@router.delete("/{transaction_id}")
+@statement_budget(5)
+def delete_transaction(
+    transaction_id: int,
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Supprime une transaction"""
+    # crud ne trouve que les transactions de l'utilisateur : une seule lecture
+    if not crud.delete_transaction(db=db, transaction_id=transaction_id, user_id=current_user.id):
+        raise _not_found_or_archived(current_user.id, transaction_id)
+    
+    return {"message": "Transaction supprimée avec succès"}
+
+@router.get("/summary/analytics")
+@statement_budget(3)
+def get_transactions_analytics(
+    months: int = Query(6, ge=1, le=24),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Récupère les analyses des transactions"""
+    return crud.get_user_analytics(db=db, user_id=current_user.id, months=months) 
+
+@router.get("/summary/query")
+@statement_budget(3)
+def query_transactions(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[List[str]] = Query(None, description="Types à inclure: 'revenu', 'depense'"),
+    category: Optional[List[str]] = Query(None, description="Catégories à inclure"),
+    group_by: Optional[List[str]] = Query(None, description="Regroupement: 'category' et/ou 'type'"),
+    bucket: Optional[str] = Query(None, description="Période: day, week, month, quarter ou year"),
+    current_user: schemas.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Agrégations ad hoc (somme et nombre) sur l'instantané colonnaire de l'utilisateur"""
+    group_by = group_by or []
+    invalid = [field for field in group_by if field not in GROUP_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Regroupement invalide: {', '.join(invalid)}")
+    if bucket and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Période invalide: {bucket}")
+    
+    snapshot = user_snapshots.get(db, current_user.id)
+    return snapshot.query(
+        start_date=parse_date(start_date, "start_date"),
+        end_date=parse_date(end_date, "end_date"),
+        types=transaction_type,
+        categories=category,
+        group_by=group_by,
+        bucket=bucket
+    )
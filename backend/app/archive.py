@@ -0,0 +1,438 @@
+"""
+Archive des transactions froides dans des fichiers colonnaires compressés.
+
+Les années closes plus anciennes que settings.archive_horizon_days sont
+déplacées, par utilisateur, de la table `transactions` vers
+`{archive_dir}/{user_id}/{année}.bma`. Chaque colonne y est stockée séparément
+(tableau binaire compressé zlib, chaînes encodées par dictionnaire) : une
+lecture ne décompresse que les colonnes dont elle a besoin.
+
+Les lectures (liste des transactions, analyses, alertes) passent par
+read_transactions / monthly_totals / category_totals quand la période
+demandée remonte jusqu'aux années archivées. Une transaction archivée reste
+lisible par son id (find_transaction) mais n'est plus modifiable.
+"""
+
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import extract
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import shard_router
+from .money import to_minor
+
+MAGIC = b"BMA1"
+EPOCH = datetime(1970, 1, 1)
+NULL_TIMESTAMP = -(2 ** 63)
+DELETE_BATCH_SIZE = 500
+
+# Colonnes archivées : nom -> type de stockage
+# "q" : entier 64 bits, "d" : flottant 64 bits, "dict" : chaîne encodée par dictionnaire
+COLUMNS = {
+    "id": "q",
+    "date": "q",
+    "amount_minor": "q",
+    "type": "dict",
+    "category": "dict",
+    "description": "dict",
+    "payment_method": "dict",
+    "created_at": "q",
+    "updated_at": "q",
+}
+TIMESTAMP_COLUMNS = ("date", "created_at", "updated_at")
+
+
+def _to_micros(value: Optional[datetime]) -> int:
+    if value is None:
+        return NULL_TIMESTAMP
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value: int) -> Optional[datetime]:
+    if value == NULL_TIMESTAMP:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(settings.archive_dir, str(user_id))
+
+
+def _year_path(user_id: int, year: int) -> str:
+    return os.path.join(_user_dir(user_id), f"{year}.bma")
+
+
+def _pending_path(user_id: int, year: int) -> str:
+    """Fichier d'une année écrit par l'archivage, publié après le commit"""
+    return _year_path(user_id, year) + ".pending"
+
+
+def archived_years(user_id: int) -> List[int]:
+    """Années archivées pour un utilisateur, triées"""
+    try:
+        names = os.listdir(_user_dir(user_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-4]) for name in names if name.endswith(".bma") and name[:-4].isdigit())
+
+
+def archive_end(user_id: int) -> Optional[datetime]:
+    """Début de la première année non archivée (None si rien n'est archivé)"""
+    years = archived_years(user_id)
+    return datetime(years[-1] + 1, 1, 1) if years else None
+
+
+# Format de fichier
+
+def _encode_columns(rows: List[Dict[str, Any]], columns: Dict[str, str] = COLUMNS) -> bytes:
+    header_columns = []
+    blobs = []
+    for name, kind in columns.items():
+        values = [row[name] for row in rows]
+        meta: Dict[str, Any] = {"name": name, "kind": kind}
+        if kind == "dict":
+            dictionary: Dict[Optional[str], int] = {}
+            codes = array("i", (dictionary.setdefault(v, len(dictionary)) for v in values))
+            meta["values"] = list(dictionary)
+            raw = codes.tobytes()
+        else:
+            if name in TIMESTAMP_COLUMNS:
+                values = [_to_micros(v) for v in values]
+            raw = array(kind, values).tobytes()
+        blob = zlib.compress(raw, 6)
+        meta["length"] = len(blob)
+        header_columns.append(meta)
+        blobs.append(blob)
+
+    header = json.dumps({
+        "rows": len(rows),
+        "byteorder": sys.byteorder,
+        "columns": header_columns,
+    }).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(header)) + header + b"".join(blobs)
+
+
+@lru_cache(maxsize=256)
+def _read_columns_cached(path: str, mtime_ns: int, names: Tuple[str, ...]) -> Dict[str, list]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"Fichier d'archive invalide : {path}")
+    (header_length,) = struct.unpack("<I", data[4:8])
+    header = json.loads(data[8:8 + header_length])
+    swap = header["byteorder"] != sys.byteorder
+
+    columns: Dict[str, list] = {}
+    offset = 8 + header_length
+    for meta in header["columns"]:
+        start, offset = offset, offset + meta["length"]
+        if meta["name"] not in names:
+            continue
+        raw = zlib.decompress(data[start:offset])
+        values = array("i" if meta["kind"] == "dict" else meta["kind"])
+        values.frombytes(raw)
+        if swap:
+            values.byteswap()
+        if meta["kind"] == "dict":
+            dictionary = meta["values"]
+            columns[meta["name"]] = [dictionary[code] for code in values]
+        else:
+            columns[meta["name"]] = values.tolist()
+    return columns
+
+
+def _read_columns(user_id: int, year: int, names: Iterable[str]) -> Dict[str, list]:
+    path = _year_path(user_id, year)
+    return _read_columns_cached(path, os.stat(path).st_mtime_ns, tuple(sorted(names)))
+
+
+def _read_rows(user_id: int, year: int) -> List[Dict[str, Any]]:
+    columns = _read_columns(user_id, year, COLUMNS)
+    rows = []
+    for i in range(len(columns["id"])):
+        row = {name: columns[name][i] for name in COLUMNS}
+        for name in TIMESTAMP_COLUMNS:
+            row[name] = _from_micros(row[name])
+        row["user_id"] = user_id
+        rows.append(row)
+    return rows
+
+
+def load_columns(user_id: int, names: Iterable[str]) -> Dict[str, list]:
+    """Colonnes brutes de toutes les années archivées, concaténées (dates en microsecondes)"""
+    names = tuple(names)
+    columns: Dict[str, list] = {name: [] for name in names}
+    for year in archived_years(user_id):
+        for name, values in _read_columns(user_id, year, names).items():
+            columns[name].extend(values)
+    return columns
+
+
+def _write_file(path: str, rows: List[Dict[str, Any]], columns: Dict[str, str] = COLUMNS) -> None:
+    with open(path, "wb") as f:
+        f.write(_encode_columns(sorted(rows, key=lambda r: (r["date"], r["id"])), columns))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_year(user_id: int, year: int, rows: List[Dict[str, Any]], columns: Dict[str, str] = COLUMNS) -> None:
+    """Écrit (ou remplace) le fichier d'une année de façon atomique"""
+    os.makedirs(_user_dir(user_id), exist_ok=True)
+    path = _year_path(user_id, year)
+    tmp_path = path + ".tmp"
+    _write_file(tmp_path, rows, columns)
+    os.replace(tmp_path, path)
+
+
+def _pending_years() -> Dict[int, List[int]]:
+    """Utilisateur -> années dont un fichier attend sa publication"""
+    pending: Dict[int, List[int]] = {}
+    try:
+        user_dirs = os.listdir(settings.archive_dir)
+    except FileNotFoundError:
+        return pending
+    for user_dir in user_dirs:
+        if not user_dir.isdigit():
+            continue
+        for name in os.listdir(os.path.join(settings.archive_dir, user_dir)):
+            year = name[:-len(".bma.pending")]
+            if name.endswith(".bma.pending") and year.isdigit():
+                pending.setdefault(int(user_dir), []).append(int(year))
+    return pending
+
+
+def _recover_pending(db: Session) -> None:
+    """Publie ou abandonne les fichiers d'un archivage interrompu (utilisateurs du shard de la session).
+
+    Le commit supprime d'un coup toutes les lignes archivées d'une année : si
+    l'une des nouvelles lignes du fichier est encore dans la table chaude, le
+    commit n'a pas eu lieu et le fichier est abandonné ; sinon il est publié.
+    """
+    pending = _pending_years()
+    if not pending:
+        return
+    shards = shard_router.lookup(db, pending)
+    for user_id, years in pending.items():
+        if shards[user_id][0] != db.info.get("shard"):
+            continue
+        for year in years:
+            path = _pending_path(user_id, year)
+            ids = set(_read_columns_cached(path, os.stat(path).st_mtime_ns, ("id",))["id"])
+            if year in archived_years(user_id):
+                ids -= set(_read_columns(user_id, year, ("id",))["id"])
+            ids = list(ids)
+            committed = not any(
+                db.query(models.Transaction.id).filter(
+                    models.Transaction.id.in_(ids[i:i + DELETE_BATCH_SIZE])
+                ).first()
+                for i in range(0, len(ids), DELETE_BATCH_SIZE)
+            )
+            if committed:
+                os.replace(path, _year_path(user_id, year))
+            else:
+                os.remove(path)
+
+
+# Tâche d'archivage
+
+def archive_closed_years(db: Session, now: Optional[datetime] = None) -> List[Dict[str, int]]:
+    """Déplace les années closes antérieures à l'horizon vers l'archive.
+
+    Les lignes lues sont verrouillées (FOR UPDATE, sans effet sous SQLite) et
+    seules celles encore inchangées (même id et même updated_at) sont
+    supprimées : une ligne modifiée entre la lecture et la suppression reste
+    dans la table chaude et n'est pas écrite dans l'archive.
+
+    Le fichier de l'année est écrit à part ({année}.bma.pending), puis publié
+    après le commit : une ligne n'est jamais à la fois dans la table chaude et
+    dans l'archive publiée. Un fichier laissé par une interruption est publié
+    ou abandonné au passage suivant (_recover_pending).
+    """
+    _recover_pending(db)
+    cutoff = (now or datetime.now()) - timedelta(days=settings.archive_horizon_days)
+    boundary = datetime(cutoff.year, 1, 1)
+    year_column = extract("year", models.Transaction.date)
+
+    pairs = db.query(models.Transaction.user_id, year_column).filter(
+        models.Transaction.date < boundary
+    ).distinct().all()
+
+    report = []
+    for user_id, year in sorted(pairs):
+        year = int(year)
+        hot_rows = db.query(models.Transaction).filter(
+            models.Transaction.user_id == user_id,
+            models.Transaction.date >= datetime(year, 1, 1),
+            models.Transaction.date < datetime(year + 1, 1, 1),
+        ).with_for_update().all()
+        if not hot_rows:
+            continue
+
+        read = {t.id: {name: getattr(t, name) for name in COLUMNS} for t in hot_rows}
+        by_version: Dict[Optional[datetime], List[int]] = {}
+        for t in hot_rows:
+            by_version.setdefault(t.updated_at, []).append(t.id)
+        for updated_at, ids in by_version.items():
+            unchanged = models.Transaction.updated_at.is_(None) if updated_at is None else (
+                models.Transaction.updated_at == updated_at
+            )
+            for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                db.query(models.Transaction).filter(
+                    models.Transaction.id.in_(ids[i:i + DELETE_BATCH_SIZE]), unchanged
+                ).delete(synchronize_session=False)
+
+        # Lignes modifiées depuis la lecture : elles restent dans la table chaude
+        ids = list(read)
+        kept = set()
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            kept.update(id_ for (id_,) in db.query(models.Transaction.id).filter(
+                models.Transaction.id.in_(ids[i:i + DELETE_BATCH_SIZE])
+            ))
+
+        merged = {}
+        if year in archived_years(user_id):
+            merged = {row["id"]: row for row in _read_rows(user_id, year)}
+        for transaction_id, row in read.items():
+            if transaction_id in kept:
+                merged.pop(transaction_id, None)
+            else:
+                merged[transaction_id] = row
+        os.makedirs(_user_dir(user_id), exist_ok=True)
+        pending = _pending_path(user_id, year)
+        _write_file(pending, list(merged.values()))
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            os.remove(pending)
+            raise
+        os.replace(pending, _year_path(user_id, year))
+        report.append({
+            "user_id": user_id, "year": year, "archived": len(read) - len(kept),
+            "kept": len(kept), "total": len(merged),
+        })
+    return report
+
+
+# Lectures à travers l'archive
+
+def _years_in_range(user_id: int, start_date: Optional[datetime], end_date: Optional[datetime]) -> List[int]:
+    return [
+        year for year in archived_years(user_id)
+        if (start_date is None or year >= start_date.year)
+        and (end_date is None or year <= end_date.year)
+    ]
+
+
+def find_transaction(user_id: int, transaction_id: int) -> Optional[Dict[str, Any]]:
+    """Transaction archivée portant cet id (None si elle n'est pas dans l'archive)"""
+    for year in reversed(archived_years(user_id)):
+        if transaction_id in _read_columns(user_id, year, ("id",))["id"]:
+            return next(row for row in _read_rows(user_id, year) if row["id"] == transaction_id)
+    return None
+
+
+def read_transactions(
+    user_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    transaction_type: Optional[str] = None,
+    category: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Transactions archivées correspondant aux filtres, de la plus récente à la plus ancienne"""
+    rows = []
+    for year in _years_in_range(user_id, start_date, end_date):
+        for row in _read_rows(user_id, year):
+            if start_date is not None and row["date"] < start_date:
+                continue
+            if end_date is not None and row["date"] > end_date:
+                continue
+            if transaction_type is not None and row["type"] != transaction_type:
+                continue
+            if category is not None and row["category"] != category:
+                continue
+            rows.append(row)
+    rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+    return rows
+
+
+def monthly_totals(user_id: int, months: Iterable[str]) -> Dict[Tuple[str, str], int]:
+    """Totaux archivés (unités mineures) par (mois YYYY-MM, type) pour les mois demandés"""
+    months = set(months)
+    years = {int(month[:4]) for month in months}
+    totals: Dict[Tuple[str, str], int] = {}
+    for year in archived_years(user_id):
+        if year not in years:
+            continue
+        columns = _read_columns(user_id, year, ("date", "amount_minor", "type"))
+        for micros, amount, kind in zip(columns["date"], columns["amount_minor"], columns["type"]):
+            month = _from_micros(micros).strftime("%Y-%m")
+            if month in months:
+                totals[(month, kind)] = totals.get((month, kind), 0) + amount
+    return totals
+
+
+def category_totals(user_id: int, month: str, transaction_type: str = "depense") -> Dict[str, int]:
+    """Totaux archivés (unités mineures) par catégorie pour un mois (YYYY-MM)"""
+    year = int(month[:4])
+    if year not in archived_years(user_id):
+        return {}
+    columns = _read_columns(user_id, year, ("date", "amount_minor", "type", "category"))
+    totals: Dict[str, int] = {}
+    for micros, amount, kind, category in zip(
+        columns["date"], columns["amount_minor"], columns["type"], columns["category"]
+    ):
+        if kind == transaction_type and _from_micros(micros).strftime("%Y-%m") == month:
+            totals[category] = totals.get(category, 0) + amount
+    return totals
+
+
+def add_minor_amounts(exponent_for_user: Callable[[int], int]) -> int:
+    """Ajoute la colonne amount_minor aux fichiers archivés avec des montants flottants.
+
+    La colonne `amount` est conservée pour que l'ancienne version de
+    l'application puisse encore lire l'archive pendant la migration.
+    Retourne le nombre de fichiers réécrits.
+    """
+    rewritten = 0
+    try:
+        user_dirs = os.listdir(settings.archive_dir)
+    except FileNotFoundError:
+        return 0
+    legacy_columns = {**{k: v for k, v in COLUMNS.items() if k != "amount_minor"}, "amount": "d"}
+    for user_dir in user_dirs:
+        if not user_dir.isdigit():
+            continue
+        user_id = int(user_dir)
+        for year in archived_years(user_id):
+            path = _year_path(user_id, year)
+            with open(path, "rb") as f:
+                data = f.read()
+            (header_length,) = struct.unpack("<I", data[4:8])
+            names = {meta["name"] for meta in json.loads(data[8:8 + header_length])["columns"]}
+            if "amount_minor" in names:
+                continue
+            columns = _read_columns(user_id, year, legacy_columns)
+            exponent = exponent_for_user(user_id)
+            rows = []
+            for i in range(len(columns["id"])):
+                row = {name: columns[name][i] for name in legacy_columns}
+                for name in TIMESTAMP_COLUMNS:
+                    row[name] = _from_micros(row[name])
+                row["amount_minor"] = to_minor(row["amount"], exponent, strict=False)
+                rows.append(row)
+            _write_year(user_id, year, rows, {**COLUMNS, "amount": "d"})
+            rewritten += 1
+    return rewritten
@@ -1,80 +1,122 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import User
-from .schemas import TokenData
-from .config import settings
-
-# Configuration du hachage des mots de passe
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Configuration OAuth2
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Vérifie si le mot de passe correspond au hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    """Génère le hash d'un mot de passe"""
-    return pwd_context.hash(password)
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """Crée un token JWT"""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
-    
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
-    return encoded_jwt
-
-def verify_token(token: str, credentials_exception):
-    """Vérifie et décode un token JWT"""
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    return token_data
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Récupère l'utilisateur actuel à partir du token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Impossible de valider les identifiants",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    token_data = verify_token(token, credentials_exception)
-    user = db.query(User).filter(User.username == token_data.username).first()
-    
-    if user is None:
-        raise credentials_exception
-    
-    return user
-
-def get_current_active_user(current_user: User = Depends(get_current_user)):
-    """Vérifie que l'utilisateur actuel est actif"""
-    if not current_user.is_active:
-        raise HTTPException(status_code=400, detail="Utilisateur inactif")
-    return current_user
-
-def authenticate_user(db: Session, username: str, password: str):
-    """Authentifie un utilisateur"""
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
+from datetime import datetime, timedelta
+from typing import Optional
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.orm import Session
+from .database import get_db, shard_router
+from .models import User
+from .schemas import TokenData
+from .config import settings
+
+# Configuration du hachage des mots de passe
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Configuration OAuth2
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Token facultatif : routes publiques qui s'adaptent à l'utilisateur connecté
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+# Portée des tickets de flux SSE (jamais acceptés comme token d'accès)
+STREAM_TICKET_SCOPE = "alerts:stream"
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Vérifie si le mot de passe correspond au hash"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    """Génère le hash d'un mot de passe"""
+    return pwd_context.hash(password)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """Crée un token JWT"""
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
+    
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+    return encoded_jwt
+
+def verify_token(token: str, credentials_exception, scope: Optional[str] = None):
+    """Vérifie et décode un token JWT (scope : usage restreint du token, None pour un token d'accès)"""
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        username: str = payload.get("sub")
+        # Un ticket de flux n'ouvre que son flux, un token d'accès n'est pas un ticket
+        if username is None or payload.get("scope") != scope:
+            raise credentials_exception
+        token_data = TokenData(username=username)
+    except JWTError:
+        raise credentials_exception
+    return token_data
+
+def create_stream_ticket(username: str) -> str:
+    """Ticket de courte durée pour ouvrir un flux SSE (EventSource ne peut pas envoyer d'en-tête)"""
+    return create_access_token(
+        {"sub": username, "scope": STREAM_TICKET_SCOPE},
+        expires_delta=timedelta(seconds=settings.stream_ticket_seconds),
+    )
+
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Récupère l'utilisateur actuel à partir du token"""
+    # Sous-requête de POST /batch : l'utilisateur a déjà été authentifié par la requête parente
+    user = getattr(request.state, "batch_user", None)
+    if user is not None:
+        db.info["user_id"] = user.id
+        if "shard" not in db.info:
+            shard_router.bind(db, user.id)
+        return user
+    
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Impossible de valider les identifiants",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    user = _user_for_token(db, token, credentials_exception)
+    
+    # Permet au routage lecture/écriture d'appliquer la lecture de ses propres écritures
+    db.info["user_id"] = user.id
+    # Les données de l'utilisateur sont lues et écrites sur son shard
+    shard_router.bind(db, user.id)
+    return user
+
+def _user_for_token(db: Session, token: str, credentials_exception, scope: Optional[str] = None) -> User:
+    token_data = verify_token(token, credentials_exception, scope)
+    user = db.query(User).filter(User.username == token_data.username).first()
+    if user is None:
+        raise credentials_exception
+    return user
+
+def get_ticket_user(ticket: str, db: Session) -> User:
+    """Utilisateur actif d'un ticket de flux"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Ticket de flux invalide ou expiré",
+    )
+    return get_current_active_user(_user_for_token(db, ticket, credentials_exception, STREAM_TICKET_SCOPE))
+
+def get_current_active_user(current_user: User = Depends(get_current_user)):
+    """Vérifie que l'utilisateur actuel est actif"""
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Utilisateur inactif")
+    return current_user
+
+def get_optional_user(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme), db: Session = Depends(get_db)):
+    """Utilisateur actuel s'il a envoyé un token, None sinon"""
+    if token is None and getattr(request.state, "batch_user", None) is None:
+        return None
+    return get_current_active_user(get_current_user(request, token, db))
+
+def authenticate_user(db: Session, username: str, password: str):
+    """Authentifie un utilisateur"""
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
+        return False
+    if not verify_password(password, user.hashed_password):
+        return False
     return user 
\ No newline at end of file
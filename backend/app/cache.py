@@ -0,0 +1,381 @@
+"""
+Cache partagé des résultats d'analyse (analyses utilisateur, alertes de budget).
+
+Chaque résultat est rangé sous une clé qui contient la version des « tags » dont
+il dépend, par exemple les transactions d'un utilisateur pour un mois donné.
+Une écriture incrémente la version des tags concernés : les anciennes entrées ne
+sont plus jamais lues et expirent d'elles-mêmes (TTL). Une invalidation coûte
+donc O(1) et un calcul en cours pendant une écriture ne peut pas réinstaller
+un résultat périmé.
+
+Backends disponibles (settings.cache_backend) :
+- "redis" : partagé entre les workers (settings.redis_url)
+- "memory" : propre au processus, utilisé aussi en repli si Redis est indisponible
+- "none" : cache désactivé
+Avec plusieurs workers (settings.api_workers), une écriture n'invaliderait que
+le cache de son worker : seul Redis convient, le cache est désactivé sinon.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Les versions doivent survivre bien plus longtemps que les entrées
+VERSION_TTL_SECONDS = 30 * 24 * 3600
+
+
+class MemoryBackend:
+    """Backend en mémoire du processus"""
+
+    def __init__(self, max_entries: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._values: Dict[str, tuple] = {}
+        # tag -> (version, instant de la dernière incrémentation)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._versions_limit = max_entries
+        self._last_version = 0
+        self._max_ttl = 0.0
+        self._locks: Dict[str, tuple] = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._mutex:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= self.clock():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._mutex:
+            if len(self._values) >= self.max_entries:
+                self._evict()
+            self._values[key] = (value, self.clock() + ttl)
+            self._max_ttl = max(self._max_ttl, ttl)
+
+    def _evict(self) -> None:
+        now = self.clock()
+        for key in [k for k, (_, expires_at) in self._values.items() if expires_at <= now]:
+            del self._values[key]
+        # Toujours plein : retirer les entrées les plus anciennes (ordre d'insertion)
+        overflow = len(self._values) - self.max_entries + 1
+        for key in list(self._values)[:max(overflow, 0)]:
+            del self._values[key]
+
+    def get_versions(self, tags: List[str]) -> List[int]:
+        with self._mutex:
+            return [self._versions.get(tag, (0, 0.0))[0] for tag in tags]
+
+    def bump_versions(self, tags: List[str]) -> List[Tuple[int, int]]:
+        with self._mutex:
+            now = self.clock()
+            bumped = []
+            for tag in tags:
+                # Compteur commun à tous les tags : une version n'est jamais réattribuée
+                self._last_version += 1
+                bumped.append((self._versions.get(tag, (0, 0.0))[0], self._last_version))
+                self._versions[tag] = (self._last_version, now)
+            if len(self._versions) > self._versions_limit:
+                self._purge_versions(now)
+            return bumped
+
+    def _purge_versions(self, now: float) -> None:
+        # Un tag inchangé depuis plus longtemps que la durée de vie des entrées repart de 0 :
+        # les entrées calculées en version 0 datent d'avant sa première incrémentation et
+        # ont expiré, ses prochaines versions sortent du compteur commun
+        for tag in [t for t, (_, bumped_at) in self._versions.items() if now - bumped_at > self._max_ttl]:
+            del self._versions[tag]
+        self._versions_limit = max(self.max_entries, 2 * len(self._versions))
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        with self._mutex:
+            now = self.clock()
+            held = self._locks.get(name)
+            if held is not None and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, now + ttl)
+            return token
+
+    def release_lock(self, name: str, token: str) -> None:
+        with self._mutex:
+            held = self._locks.get(name)
+            if held is not None and held[0] == token:
+                del self._locks[name]
+
+
+class RedisBackend:
+    """Backend Redis partagé entre les workers"""
+
+    _RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.client.ping()
+        self._release = self.client.register_script(self._RELEASE_SCRIPT)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self.client.set(key, value, px=int(ttl * 1000))
+
+    def get_versions(self, tags: List[str]) -> List[int]:
+        return [int(v or 0) for v in self.client.mget([f"v:{tag}" for tag in tags])]
+
+    def bump_versions(self, tags: List[str]) -> List[Tuple[int, int]]:
+        pipe = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f"v:{tag}")
+            pipe.expire(f"v:{tag}", VERSION_TTL_SECONDS)
+        # INCR : la version précédente est la nouvelle moins un
+        return [(version - 1, version) for version in pipe.execute()[::2]]
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(name, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release_lock(self, name: str, token: str) -> None:
+        self._release(keys=[name], args=[token])
+
+
+class ResultCache:
+    """Cache de résultats JSON avec invalidation par tags et calcul unique (single-flight)"""
+
+    def __init__(self, backend=None, ttl: float = 300, lock_timeout: float = 10):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "coalesced": 0, "computations": 0, "errors": 0}
+        )
+        self._stats_lock = threading.Lock()
+        # Calculs en cours dans ce worker : les autres demandeurs attendent leur fin
+        self._flights: Dict[str, threading.Event] = {}
+        self._flights_lock = threading.Lock()
+
+    def _count(self, namespace: str, name: str) -> None:
+        with self._stats_lock:
+            self._stats[namespace][name] += 1
+
+    def _versioned_key(self, namespace: str, key: str, tags: List[str]) -> str:
+        versions = self.backend.get_versions(tags)
+        suffix = ".".join(str(v) for v in versions)
+        return f"{namespace}:{key}@{suffix}"
+
+    def get_or_compute(self, namespace: str, key: str, tags: Iterable[str], compute: Callable[[], Any]) -> Any:
+        """Retourne le résultat en cache ou le calcule une seule fois pour tous les demandeurs"""
+        if self.backend is None:
+            return compute()
+
+        tags = list(tags)
+        try:
+            cache_key = self._versioned_key(namespace, key, tags)
+            cached = self.backend.get(cache_key)
+        except Exception:
+            logger.exception("Cache indisponible, calcul direct")
+            self._count(namespace, "errors")
+            return compute()
+
+        if cached is not None:
+            self._count(namespace, "hits")
+            return json.loads(cached)
+        self._count(namespace, "misses")
+
+        with self._flights_lock:
+            flight = self._flights.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[cache_key] = threading.Event()
+        if not leader:
+            # Même worker : attendre la fin du calcul sans interroger le backend en boucle
+            flight.wait(self.lock_timeout)
+            cached = self._get(namespace, cache_key)
+            if cached is not None:
+                self._count(namespace, "coalesced")
+                return json.loads(cached)
+            return self._compute_and_store(namespace, cache_key, compute)
+
+        try:
+            return self._compute_once(namespace, cache_key, compute)
+        finally:
+            with self._flights_lock:
+                del self._flights[cache_key]
+            flight.set()
+
+    def _compute_once(self, namespace: str, cache_key: str, compute: Callable[[], Any]) -> Any:
+        """Calcule le résultat sous le verrou du backend, ou attend le worker qui le calcule.
+
+        Si le backend tombe en route, le résultat est calculé directement.
+        """
+        lock_name = f"lock:{cache_key}"
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+        while True:
+            try:
+                token = self.backend.acquire_lock(lock_name, self.lock_timeout)
+            except Exception:
+                logger.exception("Cache indisponible, calcul direct")
+                self._count(namespace, "errors")
+                return self._compute_and_store(namespace, cache_key, compute)
+            if token is not None:
+                try:
+                    # Un autre demandeur a pu remplir l'entrée entre-temps
+                    cached = self._get(namespace, cache_key)
+                    if cached is not None:
+                        self._count(namespace, "coalesced")
+                        return json.loads(cached)
+                    return self._compute_and_store(namespace, cache_key, compute)
+                finally:
+                    try:
+                        self.backend.release_lock(lock_name, token)
+                    except Exception:
+                        # Le verrou expire de lui-même (lock_timeout) ; le résultat reste valable
+                        logger.exception("Échec de la libération du verrou du cache")
+                        self._count(namespace, "errors")
+
+            # Un autre worker calcule déjà ce résultat : attendre qu'il le publie
+            # (un seul thread par worker et par clé attend ici)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            try:
+                cached = self.backend.get(cache_key)
+            except Exception:
+                logger.exception("Cache indisponible, calcul direct")
+                self._count(namespace, "errors")
+                return self._compute_and_store(namespace, cache_key, compute)
+            if cached is not None:
+                self._count(namespace, "coalesced")
+                return json.loads(cached)
+            if time.monotonic() >= deadline:
+                return self._compute_and_store(namespace, cache_key, compute)
+
+    def _get(self, namespace: str, cache_key: str) -> Optional[str]:
+        """Entrée du cache, None si elle est absente ou si le backend est indisponible"""
+        try:
+            return self.backend.get(cache_key)
+        except Exception:
+            logger.exception("Cache indisponible, calcul direct")
+            self._count(namespace, "errors")
+            return None
+
+    def _compute_and_store(self, namespace: str, cache_key: str, compute: Callable[[], Any]) -> Any:
+        self._count(namespace, "computations")
+        result = compute()
+        try:
+            self.backend.set(cache_key, json.dumps(result, default=str), self.ttl)
+        except Exception:
+            logger.exception("Échec de l'écriture dans le cache")
+            self._count(namespace, "errors")
+        return result
+
+    def invalidate(self, tags: Iterable[str]) -> Optional[List[Tuple[int, int]]]:
+        """Invalide tous les résultats qui dépendent de ces tags.
+
+        Retourne (version précédente, nouvelle version) de chaque tag, None si le
+        cache est désactivé ou indisponible.
+        """
+        tags = list(tags)
+        if self.backend is None or not tags:
+            return None
+        try:
+            return self.backend.bump_versions(tags)
+        except Exception:
+            logger.exception("Échec de l'invalidation du cache")
+            return None
+
+    def current_versions(self, tags: Iterable[str]) -> Optional[List[int]]:
+        """Versions actuelles des tags (None si le cache est désactivé ou indisponible)"""
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get_versions(list(tags))
+        except Exception:
+            logger.exception("Cache indisponible, versions inconnues")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs de hits/misses par espace de noms (propres au processus)"""
+        with self._stats_lock:
+            namespaces = {name: dict(counters) for name, counters in self._stats.items()}
+        for counters in namespaces.values():
+            lookups = counters["hits"] + counters["misses"]
+            counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "namespaces": namespaces,
+        }
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._stats.clear()
+
+
+def create_backend(name: str):
+    """Crée le backend demandé ; avec plusieurs workers, seul Redis garde le cache cohérent"""
+    if name == "none":
+        return None
+    if name == "redis":
+        try:
+            return RedisBackend(settings.redis_url)
+        except Exception as e:
+            if settings.api_workers > 1:
+                logger.warning("Redis indisponible (%s), cache des analyses désactivé (%d workers)", e, settings.api_workers)
+                return None
+            logger.warning("Redis indisponible (%s), repli sur le cache en mémoire", e)
+    elif settings.api_workers > 1:
+        logger.warning(
+            "CACHE_BACKEND=%s avec %d workers : une écriture n'invaliderait que le cache de son worker, "
+            "cache des analyses désactivé (utilisez CACHE_BACKEND=redis)", name, settings.api_workers,
+        )
+        return None
+    return MemoryBackend()
+
+
+def next_versions(known: Optional[List[int]], bumped: Optional[List[Tuple[int, int]]]) -> Optional[List[int]]:
+    """Versions d'un objet en mémoire qui vient d'appliquer une écriture (bumped : retour d'invalidate).
+
+    None si les versions qu'il portait ne sont pas celles qui précèdent directement
+    l'écriture : une autre écriture (autre worker, autre thread) s'est intercalée et
+    l'objet ne la contient pas. Il doit alors être reconstruit.
+    """
+    if bumped is None or known != [previous for previous, _ in bumped]:
+        return None
+    return [version for _, version in bumped]
+
+
+def transactions_tag(user_id: int, month: str) -> str:
+    """Tag des transactions d'un utilisateur pour un mois (YYYY-MM)"""
+    return f"tx:{user_id}:{month}"
+
+
+def budgets_tag(user_id: int, month: str) -> str:
+    """Tag des budgets d'un utilisateur pour un mois (YYYY-MM)"""
+    return f"budget:{user_id}:{month}"
+
+
+# Instance globale du cache d'analyses
+analytics_cache = ResultCache(
+    create_backend(settings.cache_backend),
+    ttl=settings.cache_ttl_seconds,
+    lock_timeout=settings.cache_lock_timeout,
+)
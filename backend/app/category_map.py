@@ -0,0 +1,142 @@
+"""
+Correspondance en mémoire entre identifiants et noms de catégories.
+
+Les transactions et budgets ne stockent que `category_id` ; l'API continue
+d'exposer le nom de la catégorie, résolu ici sans requête tant que la
+correspondance est en cache.
+
+Un nom est unique parmi les catégories communes (user_id NULL) et parmi les
+catégories d'un utilisateur. Pour un utilisateur, un nom désigne sa propre
+catégorie si elle existe, sinon la catégorie commune : jamais celle d'un autre.
+Une catégorie commune ajoutée plus tard (init_data.py) ne détourne donc pas les
+écritures d'un utilisateur qui avait déjà la sienne.
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+# Durée pendant laquelle un nom introuvable n'est pas recherché à nouveau en base
+MISSING_TTL_SECONDS = 60
+MAX_MISSING_NAMES = 10000
+
+
+class CategoryMap:
+    """Cache id <-> (propriétaire, nom) de la table categories (le dictionnaire des catégories)"""
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._ids: Dict[Tuple[Optional[int], str], int] = {}
+        # nom -> {utilisateur : fin de validité} des recherches infructueuses
+        self._missing: Dict[str, Dict[Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, category_id: int, name: str, owner: Optional[int]) -> None:
+        with self._lock:
+            self._names[category_id] = name
+            self._ids[(owner, name)] = category_id
+            self._missing.pop(name, None)
+
+    def _query(self, db: Optional[Session], *criteria) -> None:
+        session = db or SessionLocal()
+        try:
+            rows = session.query(
+                models.Category.id, models.Category.name, models.Category.user_id
+            ).filter(*criteria).all()
+        finally:
+            if db is None:
+                session.close()
+        for category_id, name, owner in rows:
+            self._remember(category_id, name, owner)
+
+    def warm(self, db: Optional[Session] = None) -> None:
+        """Charge toute la table des catégories"""
+        self._query(db)
+
+    def name(self, category_id: Optional[int]) -> Optional[str]:
+        """Nom d'une catégorie à partir de son identifiant"""
+        if category_id is None:
+            return None
+        name = self._names.get(category_id)
+        if name is None:
+            # Catégorie créée par un autre worker ou pas encore chargée
+            self._query(None, models.Category.id == category_id)
+            name = self._names.get(category_id)
+        return name
+
+    def _cached_id(self, name: str, user_id: Optional[int]) -> Optional[int]:
+        if user_id is not None:
+            category_id = self._ids.get((user_id, name))
+            if category_id is not None:
+                return category_id
+        return self._ids.get((None, name))
+
+    def id_for(self, name: Optional[str], db: Optional[Session] = None, user_id: Optional[int] = None) -> Optional[int]:
+        """Identifiant de la catégorie commune ou de l'utilisateur portant ce nom (None si elle n'existe pas)"""
+        if name is None:
+            return None
+        category_id = self._cached_id(name, user_id)
+        if category_id is not None:
+            return category_id
+
+        now = time.monotonic()
+        with self._lock:
+            if self._missing.get(name, {}).get(user_id, 0) > now:
+                return None
+        owners = models.Category.user_id.is_(None)
+        if user_id is not None:
+            owners = or_(owners, models.Category.user_id == user_id)
+        self._query(db, models.Category.name == name, owners)
+        category_id = self._cached_id(name, user_id)
+        if category_id is None:
+            with self._lock:
+                if len(self._missing) >= MAX_MISSING_NAMES:
+                    self._missing.clear()
+                self._missing.setdefault(name, {})[user_id] = now + MISSING_TTL_SECONDS
+        return category_id
+
+    def ensure_id(self, db: Session, name: str, category_type: str, user_id: Optional[int] = None) -> int:
+        """Identifiant d'une catégorie, créée pour l'utilisateur si elle n'existe pas encore"""
+        category_id = self.id_for(name, db, user_id)
+        if category_id is not None:
+            return category_id
+
+        category = models.Category(name=name, type=category_type, user_id=user_id)
+        try:
+            with db.begin_nested():
+                db.add(category)
+        except IntegrityError:
+            # Créée au même moment par une autre requête
+            with self._lock:
+                self._missing.pop(name, None)
+            category_id = self.id_for(name, db, user_id)
+            if category_id is None:
+                raise
+            return category_id
+        # Mise en cache au premier accès après le commit de la requête
+        with self._lock:
+            self._missing.pop(name, None)
+        return category.id
+
+    def forget_missing(self, name: str) -> None:
+        """Oublie les recherches infructueuses d'un nom (catégorie qui vient d'être créée)"""
+        with self._lock:
+            self._missing.pop(name, None)
+
+    def forget(self) -> None:
+        """Vide le cache (après un renommage par exemple)"""
+        with self._lock:
+            self._names.clear()
+            self._ids.clear()
+            self._missing.clear()
+
+
+# Instance globale de la correspondance des catégories
+category_map = CategoryMap()
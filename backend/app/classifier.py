@@ -0,0 +1,374 @@
+"""
+Catégorisation automatique des transactions importées.
+
+Classifieur bayésien naïf multinomial sur des caractéristiques hachées : mots
+de la description (sans accents), type, moyen de paiement et ordre de grandeur
+du montant. Chaque utilisateur a son modèle, complété par un modèle global
+appris sur les catégories communes de tous les utilisateurs (pondéré par
+settings.classifier_global_weight).
+
+Les modèles ne sont que des comptes : l'apprentissage incrémental (création,
+correction ou suppression d'une transaction) ajoute ou retire des comptes, et
+la prédiction d'un lot se fait en quelques opérations NumPy, quel que soit le
+nombre de lignes. Comme pour les instantanés colonnaires, une version partagée
+par utilisateur permet à un worker de reconstruire le modèle quand un autre
+worker a écrit.
+"""
+
+import math
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import archive, models
+from .cache import analytics_cache, next_versions
+from .category_map import category_map
+from .config import settings
+from .money import user_exponents
+
+N_FEATURES = 1 << 14
+SMOOTHING = 0.1
+WORD_RE = re.compile(r"[a-z]{2,}")
+
+# Ligne à classer : (description, montant en unités mineures, exposant, type, moyen de paiement)
+Row = Tuple[Optional[str], int, int, str, Optional[str]]
+
+
+def classifier_tag(user_id: int) -> str:
+    return f"classifier:{user_id}"
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) & (N_FEATURES - 1)
+
+
+def _features(row: Row) -> List[int]:
+    description, amount_minor, exponent, kind, payment_method = row
+    text = unicodedata.normalize("NFKD", (description or "").lower()).encode("ascii", "ignore").decode("ascii")
+    features = [f"w:{word}" for word in WORD_RE.findall(text)]
+    features.append(f"t:{kind}")
+    # Ordre de grandeur par demi-décade, propre à chaque échelle de devise
+    features.append(f"a:{exponent}:{int(2 * math.log10(abs(amount_minor or 0) + 1))}")
+    if payment_method:
+        features.append(f"p:{payment_method.lower()}")
+    return [_hash(feature) for feature in features]
+
+
+def featurize(rows: Sequence[Row]) -> Tuple[np.ndarray, np.ndarray]:
+    """Matrice creuse des lignes (format CSR : indptr, indices)"""
+    indices: List[int] = []
+    indptr = np.empty(len(rows) + 1, dtype=np.int64)
+    indptr[0] = 0
+    for i, row in enumerate(rows):
+        indices.extend(_features(row))
+        indptr[i + 1] = len(indices)
+    return indptr, np.array(indices, dtype=np.int64)
+
+
+class NaiveBayesCounts:
+    """Comptes d'un modèle : occurrences (catégorie x caractéristique) et nombre de lignes par catégorie.
+
+    Les occurrences sont creuses (un dictionnaire par catégorie) : la mémoire
+    suit le nombre de caractéristiques vues, pas N_FEATURES.
+    """
+
+    def __init__(self):
+        self.category_ids: List[int] = []
+        self.index: Dict[int, int] = {}
+        self.features: List[Dict[int, float]] = []
+        self.totals: List[float] = []
+        self.documents: List[float] = []
+        self.lock = threading.Lock()
+
+    def _class_index(self, category_id: int) -> int:
+        position = self.index.get(category_id)
+        if position is None:
+            position = self.index[category_id] = len(self.category_ids)
+            self.category_ids.append(category_id)
+            self.features.append({})
+            self.totals.append(0.0)
+            self.documents.append(0.0)
+        return position
+
+    def add(self, rows: Sequence[Row], category_ids: Sequence[int], weight: float = 1.0) -> None:
+        """Ajoute (weight=1) ou retire (weight=-1) des lignes étiquetées"""
+        if not rows:
+            return
+        deltas: Dict[Tuple[int, int], float] = {}
+        documents: Dict[int, float] = {}
+        for row, category_id in zip(rows, category_ids):
+            for feature in _features(row):
+                key = (category_id, feature)
+                deltas[key] = deltas.get(key, 0.0) + weight
+            documents[category_id] = documents.get(category_id, 0.0) + weight
+        with self.lock:
+            for (category_id, feature), delta in deltas.items():
+                position = self._class_index(category_id)
+                counts = self.features[position]
+                old = counts.get(feature, 0.0)
+                new = max(old + delta, 0.0)
+                if new > 0:
+                    counts[feature] = new
+                else:
+                    counts.pop(feature, None)
+                self.totals[position] += new - old
+            for category_id, delta in documents.items():
+                position = self._class_index(category_id)
+                self.documents[position] = max(self.documents[position] + delta, 0.0)
+
+
+def _combine(
+    user: Optional[NaiveBayesCounts],
+    global_counts: Optional[NaiveBayesCounts],
+    global_weight: float,
+    features: List[int],
+):
+    """Comptes de l'utilisateur complétés par les comptes globaux pondérés, sur les seules caractéristiques du lot"""
+    category_ids: List[int] = []
+    parts = []
+    for counts, weight in ((global_counts, global_weight), (user, 1.0)):
+        if counts is None or not counts.category_ids:
+            continue
+        with counts.lock:
+            occurrences = np.array(
+                [[row.get(feature, 0.0) for feature in features] for row in counts.features], dtype=np.float64
+            ).reshape(len(counts.category_ids), len(features))
+            parts.append((
+                list(counts.category_ids), occurrences, np.array(counts.totals), np.array(counts.documents), weight
+            ))
+        category_ids.extend(c for c in counts.category_ids if c not in category_ids)
+
+    index = {category_id: i for i, category_id in enumerate(category_ids)}
+    occurrences = np.zeros((len(category_ids), len(features)), dtype=np.float64)
+    totals = np.zeros(len(category_ids), dtype=np.float64)
+    documents = np.zeros(len(category_ids), dtype=np.float64)
+    for ids, part_occurrences, part_totals, part_documents, weight in parts:
+        rows = np.array([index[c] for c in ids], dtype=np.int64)
+        occurrences[rows] += weight * part_occurrences
+        totals[rows] += weight * part_totals
+        documents[rows] += weight * part_documents
+    return category_ids, occurrences, totals, documents
+
+
+def predict(
+    rows: Sequence[Row],
+    user: Optional[NaiveBayesCounts],
+    global_counts: Optional[NaiveBayesCounts],
+    global_weight: float,
+) -> List[Tuple[Optional[int], float]]:
+    """(category_id, confiance) pour chaque ligne, None si aucun modèle n'est disponible"""
+    if not rows:
+        return []
+    indptr, indices = featurize(rows)
+    # Colonnes des seules caractéristiques présentes dans le lot
+    features, positions = np.unique(indices, return_inverse=True)
+    category_ids, occurrences, totals, documents = _combine(user, global_counts, global_weight, features.tolist())
+    if not category_ids:
+        return [(None, 0.0)] * len(rows)
+
+    log_likelihood = np.log(occurrences + SMOOTHING) - np.log(totals + SMOOTHING * N_FEATURES)[:, None]
+    log_prior = np.log(documents + 1) - np.log(documents.sum() + len(documents))
+
+    # Somme des log-vraisemblances des caractéristiques de chaque ligne (toute ligne en a au moins deux)
+    scores = np.add.reduceat(log_likelihood[:, positions], indptr[:-1], axis=1) + log_prior[:, None]
+    scores -= scores.max(axis=0)
+    probabilities = np.exp(scores)
+    probabilities /= probabilities.sum(axis=0)
+    best = probabilities.argmax(axis=0)
+    confidence = probabilities[best, np.arange(len(rows))]
+    return [(category_ids[b], float(c)) for b, c in zip(best.tolist(), confidence.tolist())]
+
+
+def transaction_row(transaction: models.Transaction, exponent: int) -> Row:
+    return (transaction.description, transaction.amount_minor, exponent, transaction.type, transaction.payment_method)
+
+
+class CategoryClassifier:
+    """Modèles par utilisateur (LRU) et modèle global, mis à jour à chaque écriture"""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users: "OrderedDict[int, Tuple[NaiveBayesCounts, Optional[list]]]" = OrderedDict()
+        self._global: Optional[NaiveBayesCounts] = None
+        self._global_ids: set = set()
+        self._global_built_at = 0.0
+        self._lock = threading.Lock()
+        # Une seule construction du modèle global à la fois (jusqu'à classifier_global_max_rows lignes)
+        self._global_lock = threading.Lock()
+
+    def _generic(self, db: Optional[Session] = None, user_id: Optional[int] = None) -> set:
+        """Catégories fourre-tout ("Divers"...) : jamais apprises ni prédites"""
+        ids = {category_map.id_for(name, db, user_id) for name in settings.classifier_generic_categories}
+        return {category_id for category_id in ids if category_id is not None}
+
+    def _labelled(self, rows: Iterable[Row], category_ids: Iterable[Optional[int]], generic: set):
+        kept = [(row, c) for row, c in zip(rows, category_ids) if c is not None and c not in generic]
+        return [row for row, _ in kept], [c for _, c in kept]
+
+    # Construction
+
+    def _build_user(self, db: Session, user_id: int) -> NaiveBayesCounts:
+        exponent = user_exponents.get(user_id)
+        generic = self._generic(db, user_id)
+        counts = NaiveBayesCounts()
+
+        cold = archive.load_columns(user_id, ("description", "amount_minor", "type", "payment_method", "category"))
+        rows = [
+            (description, amount, exponent, kind, payment_method)
+            for description, amount, kind, payment_method in zip(
+                cold["description"], cold["amount_minor"], cold["type"], cold["payment_method"]
+            )
+        ]
+        counts.add(*self._labelled(rows, (category_map.id_for(name, db, user_id) for name in cold["category"]), generic))
+
+        hot = db.query(
+            models.Transaction.description,
+            models.Transaction.amount_minor,
+            models.Transaction.type,
+            models.Transaction.payment_method,
+            models.Transaction.category_id,
+        ).filter(models.Transaction.user_id == user_id).all()
+        rows = [(description, amount, exponent, kind, payment_method) for description, amount, kind, payment_method, _ in hot]
+        counts.add(*self._labelled(rows, (row[4] for row in hot), generic))
+        return counts
+
+    def _build_global(self, db: Session) -> Tuple[NaiveBayesCounts, set]:
+        generic = self._generic(db)
+        global_ids = {
+            category_id for (category_id,) in
+            db.query(models.Category.id).filter(models.Category.user_id.is_(None)).all()
+        }
+        # Sans jointure : avec des shards, les transactions ne sont pas dans la base des utilisateurs
+        # et des catégories (le modèle global est alors appris sur le shard de l'utilisateur courant)
+        query = db.query(
+            models.Transaction.description,
+            models.Transaction.amount_minor,
+            models.Transaction.user_id,
+            models.Transaction.type,
+            models.Transaction.payment_method,
+            models.Transaction.category_id,
+        ).filter(
+            models.Transaction.category_id.in_(global_ids)
+        ).order_by(models.Transaction.id.desc()).limit(settings.classifier_global_max_rows)
+
+        counts = NaiveBayesCounts()
+        exponents: Dict[int, int] = {}
+
+        def add(batch: List[tuple]) -> None:
+            missing = {row[2] for row in batch} - exponents.keys()
+            if missing:
+                exponents.update(db.query(models.User.id, models.User.currency_exponent).filter(
+                    models.User.id.in_(missing)
+                ).all())
+            rows = [(description, amount, exponents.get(user_id, 0), kind, payment_method)
+                    for description, amount, user_id, kind, payment_method, _ in batch]
+            counts.add(*self._labelled(rows, (row[5] for row in batch), generic))
+
+        batch: List[tuple] = []
+        for row in query.yield_per(5000):
+            batch.append(row)
+            if len(batch) == 5000:
+                add(batch)
+                batch = []
+        if batch:
+            add(batch)
+        return counts, global_ids
+
+    def _user_model(self, db: Session, user_id: int) -> NaiveBayesCounts:
+        version = analytics_cache.current_versions([classifier_tag(user_id)])
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[1] == version:
+                self._users.move_to_end(user_id)
+                return entry[0]
+
+        counts = self._build_user(db, user_id)
+        with self._lock:
+            self._users[user_id] = (counts, version)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return counts
+
+    def _global_stale(self) -> bool:
+        return time.monotonic() - self._global_built_at > settings.classifier_global_refresh_seconds
+
+    def _global_model(self, db: Session) -> Optional[NaiveBayesCounts]:
+        # Les autres workers ne voient les écritures locales qu'au prochain rafraîchissement
+        current = self._global
+        if current is not None and not self._global_stale():
+            return current
+        # Pendant un rafraîchissement, les autres requêtes gardent le modèle précédent ;
+        # sans modèle, elles attendent la construction en cours au lieu d'en lancer une autre
+        if not self._global_lock.acquire(blocking=current is None):
+            return current
+        try:
+            if self._global is None or self._global_stale():
+                counts, global_ids = self._build_global(db)
+                with self._lock:
+                    self._global, self._global_ids = counts, global_ids
+                    self._global_built_at = time.monotonic()
+            return self._global
+        finally:
+            self._global_lock.release()
+
+    # Prédiction et apprentissage
+
+    def classify(self, db: Session, user_id: int, rows: Sequence[Row]) -> List[Tuple[Optional[str], float]]:
+        """(catégorie, confiance) pour chaque ligne d'un lot"""
+        predictions = predict(
+            rows, self._user_model(db, user_id), self._global_model(db), settings.classifier_global_weight
+        )
+        return [(category_map.name(category_id), confidence) for category_id, confidence in predictions]
+
+    def record_write(
+        self,
+        user_id: int,
+        added: Iterable[Tuple[Row, Optional[int]]] = (),
+        removed: Iterable[Tuple[Row, Optional[int]]] = (),
+    ) -> None:
+        """Apprend les lignes ajoutées et oublie les lignes retirées ((ligne, category_id))"""
+        generic = self._generic(user_id=user_id)
+        added, removed = list(added), list(removed)
+        added = self._labelled(*zip(*added), generic) if added else ([], [])
+        removed = self._labelled(*zip(*removed), generic) if removed else ([], [])
+
+        with self._lock:
+            entry = self._users.get(user_id)
+            global_counts, global_ids = self._global, self._global_ids
+        for counts in ([entry[0]] if entry else []) + ([global_counts] if global_counts else []):
+            restrict = counts is global_counts
+            for (rows, category_ids), weight in ((removed, -1.0), (added, 1.0)):
+                if restrict:
+                    kept = [(r, c) for r, c in zip(rows, category_ids) if c in global_ids]
+                    rows, category_ids = [r for r, _ in kept], [c for _, c in kept]
+                counts.add(rows, category_ids, weight)
+
+        bumped = analytics_cache.invalidate([classifier_tag(user_id)])
+        if entry is None or analytics_cache.backend is None:
+            # Sans cache des analyses, un seul worker : le modèle est à jour en place
+            return
+        with self._lock:
+            if self._users.get(user_id) is entry:
+                # Une écriture intercalée depuis la version du modèle n'y est pas : le reconstruire
+                versions = next_versions(entry[1], bumped)
+                if versions is None:
+                    del self._users[user_id]
+                else:
+                    self._users[user_id] = (entry[0], versions)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+            self._global = None
+
+
+# Instance globale du classifieur
+category_classifier = CategoryClassifier(settings.classifier_max_users)
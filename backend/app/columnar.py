@@ -0,0 +1,347 @@
+"""
+Instantané colonnaire des transactions d'un utilisateur pour les requêtes ad hoc.
+
+Chaque instantané garde les transactions (table chaude et archive) dans des
+tableaux NumPy : dates en microsecondes (int64), montants en unités mineures
+(int64), type et catégorie encodés par dictionnaire (int32). Les filtres,
+regroupements et découpages temporels sont calculés par opérations vectorisées.
+
+Les instantanés sont construits à la première requête, évincés selon l'ordre
+LRU (settings.snapshot_max_users) et mis à jour en place par les écritures de
+crud. Une version partagée par utilisateur (backend du cache des analyses)
+permet à un worker de reconstruire son instantané quand un autre worker a écrit.
+Une écriture n'est appliquée en place que si elle suit directement la version
+de l'instantané (cache.next_versions) ; sinon l'instantané est reconstruit.
+Sans cache des analyses, la version est un repère lu en base (nombre de
+transactions, plus grand id, dernière modification). Dans tous les cas, un
+instantané plus vieux que settings.snapshot_ttl_seconds est reconstruit.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import archive, models
+from .cache import analytics_cache, next_versions
+from .category_map import category_map
+from .config import settings
+from .money import from_minor, user_exponents
+
+GROUP_FIELDS = ("category", "type")
+BUCKETS = ("day", "week", "month", "quarter", "year")
+
+MICROS_PER_DAY = 86_400_000_000
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_ids(dates_us: np.ndarray, bucket: str) -> np.ndarray:
+    """Numéro de période (jours, semaines, mois... depuis 1970) de dates en microsecondes"""
+    if bucket == "day":
+        return dates_us // MICROS_PER_DAY
+    if bucket == "week":
+        # Semaines commençant le lundi (le 1er janvier 1970 est un jeudi)
+        return (dates_us // MICROS_PER_DAY + 3) // 7
+    months = dates_us.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+    if bucket == "month":
+        return months
+    if bucket == "quarter":
+        return months // 3
+    return months // 12
+
+
+def bucket_label(bucket: str, value: int) -> str:
+    """Libellé d'une période (date de début, YYYY-MM, YYYY-Tn ou YYYY)"""
+    if bucket == "day":
+        return (EPOCH + timedelta(days=value)).strftime("%Y-%m-%d")
+    if bucket == "week":
+        return (EPOCH + timedelta(days=value * 7 - 3)).strftime("%Y-%m-%d")
+    if bucket == "month":
+        return f"{1970 + value // 12:04d}-{value % 12 + 1:02d}"
+    if bucket == "quarter":
+        return f"{1970 + value // 4:04d}-T{value % 4 + 1}"
+    return f"{1970 + value:04d}"
+
+
+def snapshot_tag(user_id: int) -> str:
+    return f"snapshot:{user_id}"
+
+
+def _to_micros(dates: Sequence[datetime]) -> np.ndarray:
+    naive = [d.astimezone(timezone.utc).replace(tzinfo=None) if d.tzinfo else d for d in dates]
+    return np.array(naive, dtype="datetime64[us]").astype(np.int64)
+
+
+class _Dictionary:
+    """Encodage par dictionnaire : chaîne <-> code entier"""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        return np.fromiter((self.encode(v) for v in values), dtype=np.int32)
+
+    def lookup(self, values: Iterable[str]) -> np.ndarray:
+        """Codes des valeurs connues (les valeurs inconnues sont ignorées)"""
+        return np.array([self.codes[v] for v in values if v in self.codes], dtype=np.int32)
+
+
+class UserSnapshot:
+    """Transactions d'un utilisateur en colonnes NumPy"""
+
+    def __init__(self, version: Optional[list] = None, exponent: int = 0):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.exponent = exponent
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.dates = np.empty(0, dtype=np.int64)
+        self.amounts = np.empty(0, dtype=np.int64)
+        self.type_codes = np.empty(0, dtype=np.int32)
+        self.category_codes = np.empty(0, dtype=np.int32)
+        self.alive = np.empty(0, dtype=bool)
+        self.types = _Dictionary()
+        self.categories = _Dictionary()
+        self.position: Dict[int, int] = {}
+        self.dead = 0
+        self.lock = threading.Lock()
+
+    # Construction et mises à jour
+
+    def _reserve(self, extra: int) -> None:
+        needed = self.size + extra
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+        for name in ("ids", "dates", "amounts", "type_codes", "category_codes", "alive"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, ids, dates_us, amounts, types, categories) -> None:
+        count = len(ids)
+        if not count:
+            return
+        self._reserve(count)
+        start, end = self.size, self.size + count
+        self.ids[start:end] = ids
+        self.dates[start:end] = dates_us
+        self.amounts[start:end] = amounts
+        self.type_codes[start:end] = self.types.encode_many(types)
+        self.category_codes[start:end] = self.categories.encode_many(categories)
+        self.alive[start:end] = True
+        for offset, transaction_id in enumerate(self.ids[start:end].tolist()):
+            self.position[transaction_id] = start + offset
+        self.size = end
+
+    def remove(self, transaction_ids: Iterable[int]) -> None:
+        for transaction_id in transaction_ids:
+            index = self.position.pop(transaction_id, None)
+            if index is not None:
+                self.alive[index] = False
+                self.dead += 1
+        if self.dead > 64 and self.dead * 4 > self.size:
+            self._compact()
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self.alive[:self.size])
+        for name in ("ids", "dates", "amounts", "type_codes", "category_codes"):
+            setattr(self, name, getattr(self, name)[keep].copy())
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.size = len(keep)
+        self.position = {transaction_id: i for i, transaction_id in enumerate(self.ids.tolist())}
+        self.dead = 0
+
+    # Requêtes
+
+    def query(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        types: Optional[Sequence[str]] = None,
+        categories: Optional[Sequence[str]] = None,
+        group_by: Sequence[str] = (),
+        bucket: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Filtre puis agrège (somme et nombre) par catégorie, type et/ou période"""
+        with self.lock:
+            n = self.size
+            mask = self.alive[:n].copy()
+            dates = self.dates[:n]
+            if start_date is not None:
+                mask &= dates >= _to_micros([start_date])[0]
+            if end_date is not None:
+                mask &= dates <= _to_micros([end_date])[0]
+            if types:
+                mask &= np.isin(self.type_codes[:n], self.types.lookup(types))
+            if categories:
+                mask &= np.isin(self.category_codes[:n], self.categories.lookup(categories))
+
+            amounts = self.amounts[:n][mask]
+            result: Dict[str, Any] = {
+                "total": from_minor(int(amounts.sum()), self.exponent),
+                "count": int(amounts.size),
+            }
+            if not group_by and not bucket:
+                return result
+            if not amounts.size:
+                result["groups"] = []
+                return result
+
+            # Clé de groupe unique en base mixte, puis un seul tri et des sommes entières par segment
+            components = []
+            if "category" in group_by:
+                components.append(("category", self.category_codes[:n][mask].astype(np.int64), 0, len(self.categories.values)))
+            if "type" in group_by:
+                components.append(("type", self.type_codes[:n][mask].astype(np.int64), 0, len(self.types.values)))
+            if bucket:
+                periods = bucket_ids(dates[mask], bucket)
+                low = int(periods.min()) if periods.size else 0
+                high = int(periods.max()) + 1 if periods.size else 1
+                components.append(("period", periods - low, low, high - low))
+
+            keys = np.zeros(amounts.size, dtype=np.int64)
+            for _, values, _, radix in components:
+                keys = keys * radix + values
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            unique_keys = sorted_keys[starts]
+            totals = np.add.reduceat(amounts[order], starts)
+            counts = np.diff(np.r_[starts, keys.size])
+
+            groups = []
+            for key, total, count in zip(unique_keys.tolist(), totals.tolist(), counts.tolist()):
+                group: Dict[str, Any] = {}
+                for name, _, offset, radix in reversed(components):
+                    key, value = divmod(key, radix)
+                    if name == "category":
+                        group["category"] = self.categories.values[value]
+                    elif name == "type":
+                        group["type"] = self.types.values[value]
+                    else:
+                        group["period"] = bucket_label(bucket, value + offset)
+                group["total"] = from_minor(total, self.exponent)
+                group["count"] = count
+                groups.append(group)
+            result["groups"] = groups
+            return result
+
+
+class SnapshotStore:
+    """Instantanés par utilisateur, évincés selon l'ordre LRU"""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._snapshots: "OrderedDict[int, UserSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, db: Session, user_id: int, version: Optional[list]) -> UserSnapshot:
+        snapshot = UserSnapshot(version, user_exponents.get(user_id))
+        cold = archive.load_columns(user_id, ("id", "date", "amount_minor", "type", "category"))
+        snapshot.append(cold["id"], cold["date"], cold["amount_minor"], cold["type"], cold["category"])
+
+        hot = db.query(
+            models.Transaction.id,
+            models.Transaction.date,
+            models.Transaction.amount_minor,
+            models.Transaction.type,
+            models.Transaction.category_id,
+        ).filter(models.Transaction.user_id == user_id).all()
+        if hot:
+            ids, dates, amounts, types, category_ids = zip(*hot)
+            categories = [category_map.name(category_id) for category_id in category_ids]
+            # Une ligne rétrodatée peut exister des deux côtés entre deux archivages
+            snapshot.remove(ids)
+            snapshot.append(ids, _to_micros(dates), amounts, types, categories)
+        return snapshot
+
+    def _version(self, db: Session, user_id: int) -> list:
+        """Version partagée de l'instantané, ou repère lu en base sans cache des analyses"""
+        version = analytics_cache.current_versions([snapshot_tag(user_id)])
+        if version is not None:
+            return version
+        count, last_id, last_update = db.query(
+            func.count(models.Transaction.id),
+            func.max(models.Transaction.id),
+            func.max(models.Transaction.updated_at),
+        ).filter(models.Transaction.user_id == user_id).one()
+        return ["db", count, last_id, str(last_update)]
+
+    def get(self, db: Session, user_id: int) -> UserSnapshot:
+        """Instantané à jour de l'utilisateur, construit si nécessaire"""
+        version = self._version(db, user_id)
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+            if (
+                snapshot is not None
+                and snapshot.version == version
+                and time.monotonic() - snapshot.built_at < settings.snapshot_ttl_seconds
+            ):
+                self._snapshots.move_to_end(user_id)
+                return snapshot
+
+        snapshot = self._build(db, user_id, version)
+        with self._lock:
+            self._snapshots[user_id] = snapshot
+            self._snapshots.move_to_end(user_id)
+            while len(self._snapshots) > self.max_users:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def record_write(
+        self,
+        user_id: int,
+        added: Iterable[models.Transaction] = (),
+        removed_ids: Iterable[int] = (),
+    ) -> None:
+        """Applique une écriture à l'instantané chargé et publie la nouvelle version"""
+        added = list(added)
+        bumped = analytics_cache.invalidate([snapshot_tag(user_id)])
+        with self._lock:
+            snapshot = self._snapshots.get(user_id)
+        if snapshot is None:
+            return
+        with snapshot.lock:
+            # Sans cache, le repère en base ne sera connu qu'à la prochaine lecture ; si une autre
+            # écriture s'est intercalée depuis la version de l'instantané, il ne la contient pas
+            version = next_versions(snapshot.version, bumped)
+            if version is not None:
+                snapshot.remove(list(removed_ids) + [t.id for t in added])
+                if added:
+                    snapshot.append(
+                        [t.id for t in added],
+                        _to_micros([t.date for t in added]),
+                        [t.amount_minor for t in added],
+                        [t.type for t in added],
+                        [t.category for t in added],
+                    )
+                snapshot.version = version
+        if version is None:
+            # Reconstruit à la prochaine lecture
+            with self._lock:
+                if self._snapshots.get(user_id) is snapshot:
+                    del self._snapshots[user_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+
+# Instance globale des instantanés
+user_snapshots = SnapshotStore(settings.snapshot_max_users)
@@ -1,35 +1,160 @@
-from pydantic_settings import BaseSettings
-from typing import List
-import os
-
-class Settings(BaseSettings):
-    # Configuration de base
-    app_name: str = "Mon Budget Malin API"
-    debug: bool = True
-    environment: str = "development"
-    
-    # Configuration de la base de données
-    database_url: str = "sqlite:///./budget_malin.db"
-    
-    # Configuration de sécurité
-    secret_key: str = "votre_cle_secrete_tres_longue_et_complexe_changez_la_en_production"
-    algorithm: str = "HS256"
-    access_token_expire_minutes: int = 30
-    
-    # Configuration CORS
-    allowed_origins: List[str] = [
-        "http://localhost:3000",
-        "http://localhost:8080", 
-        "http://127.0.0.1:8080",
-        "http://127.0.0.1:3000"
-    ]
-    
-    # Configuration Redis (optionnel)
-    redis_url: str = "redis://localhost:6379"
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-
-# Instance globale des paramètres
+from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
+import os
+
+class Settings(BaseSettings):
+    # Configuration de base
+    app_name: str = "Mon Budget Malin API"
+    debug: bool = True
+    environment: str = "development"
+    
+    # Configuration de la base de données
+    database_url: str = "sqlite:///./budget_malin.db"
+    # Réplica en lecture (optionnel) : reçoit les requêtes GET et les analyses
+    database_read_url: Optional[str] = None
+    # Durée (s) pendant laquelle un utilisateur qui vient d'écrire lit sur le primaire
+    read_your_writes_seconds: float = 5
+    read_your_writes_redis_timeout: float = 0.2  # connexion et réponse de Redis (une fois par session)
+    # Shards : bases recevant les données des utilisateurs (transactions, budgets, objectifs...),
+    # database_url gardant les utilisateurs, les catégories et l'annuaire des shards. Vide : une seule base.
+    shard_urls: List[str] = []
+    shard_move_grace_seconds: float = 2  # attente des requêtes en cours lors du déplacement d'un utilisateur
+    
+    # Archive des transactions froides (années closes au-delà de l'horizon)
+    archive_dir: str = "./archive"
+    archive_horizon_days: int = 730
+    
+    # Configuration de sécurité
+    secret_key: str = "votre_cle_secrete_tres_longue_et_complexe_changez_la_en_production"
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 30
+    stream_ticket_seconds: int = 60  # validité d'un ticket d'ouverture de flux SSE (il passe dans l'URL)
+    
+    # Configuration CORS
+    allowed_origins: List[str] = [
+        "http://localhost:3000",
+        "http://localhost:8080", 
+        "http://127.0.0.1:8080",
+        "http://127.0.0.1:3000"
+    ]
+    
+    # Limitation de débit : "memory" (par worker), "redis" (partagée) ou "none"
+    rate_limit_backend: str = "memory"
+    rate_limit_max_keys: int = 100000
+    # "MÉTHODE chemin" ou "MÉTHODE *" -> "capacité/période en secondes", par utilisateur ou par IP
+    rate_limits: Dict[str, str] = {
+        "POST /auth/token": "10/60",
+        "POST /auth/register": "5/3600",
+        "POST /transactions/": "120/60",
+        "POST /transactions/ingest": "6000/60",
+        "POST *": "300/60",
+        "PUT *": "300/60",
+        "DELETE *": "300/60",
+    }
+    
+    # Ingestion des flux de transactions (POST /transactions/ingest) : spool local + insertions groupées
+    ingest_spool_dir: str = "./ingest_spool"
+    ingest_batch_size: int = 500  # lignes par insertion (N)
+    ingest_flush_ms: int = 50  # attente maximale avant insertion d'un lot incomplet (T)
+    ingest_queue_size: int = 20000  # lignes en attente au-delà desquelles les producteurs attendent
+    ingest_max_wait: float = 2  # attente maximale (s) d'un producteur avant un refus 503
+    ingest_spool_max_bytes: int = 64 * 1024 * 1024  # le spool est vidé au-delà, une fois tout inséré
+    ingest_max_attempts: int = 5  # essais d'un lot si la base est indisponible, avant de le laisser au rejeu du spool
+    
+    # POST /batch : nombre de sous-requêtes par lot et lectures exécutées en parallèle
+    batch_max_requests: int = 20
+    batch_concurrency: int = 4
+    
+    # Contrôle d'admission des routes coûteuses
+    threadpool_size: int = 40  # threads des routes synchrones, par worker
+    # Classe -> "concurrence/file/attente max (s)" ; "default" couvre les autres routes.
+    # La somme des concurrences ne doit pas dépasser threadpool_size (taille du pool de connexions),
+    # sauf "ingest" et "streams" : leurs requêtes attendent (spool, alertes) sans thread ni connexion.
+    # Un lot (POST /batch) compte pour batch_concurrency + 1 : sa session et ses lectures parallèles.
+    # 20 + 6 + 4 + 2 x (4 + 1) = 40
+    admission_pools: Dict[str, str] = {
+        "default": "20/1024/10",
+        "ingest": "512/4096/5",
+        "analytics": "6/32/2",
+        "alerts": "4/32/2",
+        "batch": "2/32/2",
+        "streams": "1000/0/1",
+    }
+    admission_routes: Dict[str, str] = {
+        "GET /transactions/summary/analytics": "analytics",
+        "GET /transactions/summary/query": "analytics",
+        "GET /transactions/timeseries": "analytics",
+        "GET /analytics/peers": "analytics",
+        "GET /budgets/alerts": "alerts",
+        "GET /budgets/alerts/stream": "streams",
+        "POST /batch": "batch",
+        "POST /transactions/ingest": "ingest",
+    }
+    
+    # Configuration Redis (optionnel)
+    redis_url: str = "redis://localhost:6379"
+    
+    # Cache des analyses : "redis" (partagé entre workers), "memory" (un seul worker) ou "none"
+    cache_backend: str = "memory"
+    cache_ttl_seconds: int = 300
+    cache_lock_timeout: float = 10  # attente maximale d'un calcul en cours (single-flight)
+    
+    # Instantanés colonnaires pour les requêtes ad hoc (nombre d'utilisateurs gardés en mémoire)
+    snapshot_max_users: int = 1000
+    snapshot_ttl_seconds: int = 600  # reconstruction au-delà, quelle que soit la version
+    
+    # Catégorisation automatique (classifieur bayésien naïf par utilisateur + global)
+    classifier_max_users: int = 1000
+    classifier_generic_categories: List[str] = ["Divers"]  # catégories fourre-tout, ni apprises ni prédites
+    classifier_global_weight: float = 0.2  # poids des comptes globaux face à ceux de l'utilisateur
+    classifier_global_refresh_seconds: int = 3600
+    classifier_global_max_rows: int = 200000
+    classifier_max_batch: int = 5000
+    classifier_min_confidence: float = 0.6  # seuil d'application aux transactions en attente
+    
+    # Séries temporelles des graphiques : nombre de points par défaut après réduction (LTTB)
+    timeseries_max_points: int = 300
+    
+    # Alertes de budget en temps réel (GET /budgets/alerts/stream) : "memory" (un worker) ou "redis"
+    # (imposé au-delà d'un worker : une alerte publiée par un worker doit atteindre les flux des autres)
+    alerts_backend: str = "memory"
+    alerts_stream_queue_size: int = 100  # événements en attente par flux
+    alerts_stream_heartbeat_seconds: float = 15  # commentaire SSE gardant la connexion ouverte
+    
+    # Comparaisons entre utilisateurs (compute_peer_benchmarks.py, GET /analytics/peers)
+    peers_min_users: int = 20  # une cohorte plus petite n'est pas exposée
+    peers_compression: float = 100  # précision des t-digests
+    peers_workers: int = 4  # processus de calcul par défaut
+    
+    # Relevés mensuels (GET /statements/{YYYY-MM}), calculés une fois par mois terminé
+    statements_dir: str = "./statements"
+    statements_workers: int = 2  # processus de calcul par worker de l'API
+    
+    # Requêtes SQL comptées par requête HTTP (en-tête Server-Timing, dépassements des budgets des routes)
+    sql_stats: bool = False
+    
+    # Détection nocturne des dépenses inhabituelles (médiane / MAD par catégorie)
+    anomaly_history_months: int = 12
+    anomaly_min_history: int = 3  # mois d'historique minimum pour juger une série
+    anomaly_threshold: float = 3.5  # écart robuste minimum
+    anomaly_min_ratio: float = 1.5  # et au moins 1,5 fois la médiane
+    
+    # Configuration du serveur de production (serve.py)
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    workers: int = 0  # 0 = un worker par cœur CPU
+    # Workers lancés (posé par serve.py, 1 avec run.py) : au-delà d'un worker, l'état partagé
+    # (lectures après écriture, cache des analyses, alertes) doit passer par Redis
+    api_workers: int = 1
+    keep_alive: int = 5  # secondes
+    backlog: int = 2048
+    max_requests: int = 10000  # recyclage d'un worker après N requêtes (0 = jamais)
+    max_requests_jitter: int = 1000
+    graceful_timeout: int = 30  # secondes laissées aux requêtes en cours sur SIGTERM
+    
+    class Config:
+        env_file = ".env"
+        case_sensitive = False
+
+# Instance globale des paramètres
 settings = Settings() 
\ No newline at end of file
@@ -1,265 +1,678 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from . import models, schemas
-from .auth import get_password_hash
-
-# Fonctions CRUD pour les utilisateurs
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = get_password_hash(user.password)
-    db_user = models.User(
-        email=user.email,
-        username=user.username,
-        full_name=user.full_name,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
-
-def get_user(db: Session, user_id: int) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
-def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.email == email).first()
-
-def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.username == username).first()
-
-def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate) -> Optional[models.User]:
-    db_user = get_user(db, user_id)
-    if db_user:
-        for field, value in user_update.dict(exclude_unset=True).items():
-            setattr(db_user, field, value)
-        db.commit()
-        db.refresh(db_user)
-    return db_user
-
-# Fonctions CRUD pour les transactions
-def create_transaction(db: Session, transaction: schemas.TransactionCreate, user_id: int) -> models.Transaction:
-    db_transaction = models.Transaction(**transaction.dict(), user_id=user_id)
-    db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
-    return db_transaction
-
-def get_transactions(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Transaction]:
-    return db.query(models.Transaction).filter(models.Transaction.user_id == user_id).offset(skip).limit(limit).all()
-
-def get_transaction(db: Session, transaction_id: int, user_id: int) -> Optional[models.Transaction]:
-    return db.query(models.Transaction).filter(
-        models.Transaction.id == transaction_id,
-        models.Transaction.user_id == user_id
-    ).first()
-
-def update_transaction(db: Session, transaction_id: int, transaction_update: schemas.TransactionUpdate, user_id: int) -> Optional[models.Transaction]:
-    db_transaction = get_transaction(db, transaction_id, user_id)
-    if db_transaction:
-        for field, value in transaction_update.dict(exclude_unset=True).items():
-            setattr(db_transaction, field, value)
-        db.commit()
-        db.refresh(db_transaction)
-    return db_transaction
-
-def delete_transaction(db: Session, transaction_id: int, user_id: int) -> bool:
-    db_transaction = get_transaction(db, transaction_id, user_id)
-    if db_transaction:
-        db.delete(db_transaction)
-        db.commit()
-        return True
-    return False
-
-# Fonctions CRUD pour les budgets
-def create_budget(db: Session, budget: schemas.BudgetCreate, user_id: int) -> models.Budget:
-    db_budget = models.Budget(**budget.dict(), user_id=user_id)
-    db.add(db_budget)
-    db.commit()
-    db.refresh(db_budget)
-    return db_budget
-
-def get_budgets(db: Session, user_id: int, month: str = None) -> List[models.Budget]:
-    query = db.query(models.Budget).filter(models.Budget.user_id == user_id)
-    if month:
-        query = query.filter(models.Budget.month == month)
-    return query.all()
-
-def update_budget(db: Session, budget_id: int, budget_update: schemas.BudgetUpdate, user_id: int) -> Optional[models.Budget]:
-    db_budget = db.query(models.Budget).filter(
-        models.Budget.id == budget_id,
-        models.Budget.user_id == user_id
-    ).first()
-    if db_budget:
-        for field, value in budget_update.dict(exclude_unset=True).items():
-            setattr(db_budget, field, value)
-        db.commit()
-        db.refresh(db_budget)
-    return db_budget
-
-def delete_budget(db: Session, budget_id: int, user_id: int) -> bool:
-    db_budget = db.query(models.Budget).filter(
-        models.Budget.id == budget_id,
-        models.Budget.user_id == user_id
-    ).first()
-    if db_budget:
-        db.delete(db_budget)
-        db.commit()
-        return True
-    return False
-
-# Fonctions CRUD pour les objectifs
-def create_goal(db: Session, goal: schemas.GoalCreate, user_id: int) -> models.Goal:
-    db_goal = models.Goal(**goal.dict(), user_id=user_id)
-    db.add(db_goal)
-    db.commit()
-    db.refresh(db_goal)
-    return db_goal
-
-def get_goals(db: Session, user_id: int) -> List[models.Goal]:
-    return db.query(models.Goal).filter(models.Goal.user_id == user_id).all()
-
-def get_goal(db: Session, goal_id: int, user_id: int) -> Optional[models.Goal]:
-    return db.query(models.Goal).filter(
-        models.Goal.id == goal_id,
-        models.Goal.user_id == user_id
-    ).first()
-
-def update_goal(db: Session, goal_id: int, goal_update: schemas.GoalUpdate, user_id: int) -> Optional[models.Goal]:
-    db_goal = get_goal(db, goal_id, user_id)
-    if db_goal:
-        for field, value in goal_update.dict(exclude_unset=True).items():
-            setattr(db_goal, field, value)
-        db.commit()
-        db.refresh(db_goal)
-    return db_goal
-
-def delete_goal(db: Session, goal_id: int, user_id: int) -> bool:
-    db_goal = get_goal(db, goal_id, user_id)
-    if db_goal:
-        db.delete(db_goal)
-        db.commit()
-        return True
-    return False
-
-# Fonctions CRUD pour les catégories
-def get_categories(db: Session) -> List[models.Category]:
-    return db.query(models.Category).all()
-
-def create_category(db: Session, category: schemas.CategoryCreate) -> models.Category:
-    db_category = models.Category(**category.dict())
-    db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
-    return db_category
-
-# Fonctions d'analyse
-def get_user_analytics(db: Session, user_id: int) -> Dict[str, Any]:
-    """Obtenir les analyses pour un utilisateur"""
-    # Calculer les totaux du mois en cours
-    current_month = datetime.now().strftime("%Y-%m")
-    
-    # Revenus du mois
-    total_revenues = db.query(func.sum(models.Transaction.amount)).filter(
-        models.Transaction.user_id == user_id,
-        models.Transaction.type == "revenu",
-        func.strftime("%Y-%m", models.Transaction.date) == current_month
-    ).scalar() or 0
-    
-    # Dépenses du mois
-    total_expenses = db.query(func.sum(models.Transaction.amount)).filter(
-        models.Transaction.user_id == user_id,
-        models.Transaction.type == "depense",
-        func.strftime("%Y-%m", models.Transaction.date) == current_month
-    ).scalar() or 0
-    
-    # Solde
-    balance = total_revenues - total_expenses
-    
-    # Taux d'épargne
-    savings_rate = (balance / total_revenues * 100) if total_revenues > 0 else 0
-    
-    # Top catégories de dépenses
-    top_expense_categories = db.query(
-        models.Transaction.category,
-        func.sum(models.Transaction.amount).label('total')
-    ).filter(
-        models.Transaction.user_id == user_id,
-        models.Transaction.type == "depense",
-        func.strftime("%Y-%m", models.Transaction.date) == current_month
-    ).group_by(models.Transaction.category).order_by(func.sum(models.Transaction.amount).desc()).limit(5).all()
-    
-    # Tendances mensuelles (6 derniers mois)
-    monthly_trends = []
-    for i in range(6):
-        month = (datetime.now() - timedelta(days=30*i)).strftime("%Y-%m")
-        month_revenues = db.query(func.sum(models.Transaction.amount)).filter(
-            models.Transaction.user_id == user_id,
-            models.Transaction.type == "revenu",
-            func.strftime("%Y-%m", models.Transaction.date) == month
-        ).scalar() or 0
-        
-        month_expenses = db.query(func.sum(models.Transaction.amount)).filter(
-            models.Transaction.user_id == user_id,
-            models.Transaction.type == "depense",
-            func.strftime("%Y-%m", models.Transaction.date) == month
-        ).scalar() or 0
-        
-        monthly_trends.append({
-            "month": month,
-            "revenues": month_revenues,
-            "expenses": month_expenses,
-            "balance": month_revenues - month_expenses
-        })
-    
-    return {
-        "total_revenues": total_revenues,
-        "total_expenses": total_expenses,
-        "balance": balance,
-        "savings_rate": savings_rate,
-        "top_expense_categories": [
-            {"category": cat.category, "total": float(total)} 
-            for cat, total in top_expense_categories
-        ],
-        "monthly_trends": monthly_trends
-    }
-
-def get_budget_alerts(db: Session, user_id: int, month: str = None) -> List[Dict[str, Any]]:
-    """Obtenir les alertes de budget pour un utilisateur"""
-    if not month:
-        month = datetime.now().strftime("%Y-%m")
-    
-    alerts = []
-    
-    # Récupérer tous les budgets de l'utilisateur pour le mois
-    budgets = get_budgets(db, user_id, month)
-    
-    for budget in budgets:
-        # Calculer les dépenses pour cette catégorie
-        spent_amount = db.query(func.sum(models.Transaction.amount)).filter(
-            models.Transaction.user_id == user_id,
-            models.Transaction.category == budget.category,
-            models.Transaction.type == "depense",
-            func.strftime("%Y-%m", models.Transaction.date) == month
-        ).scalar() or 0
-        
-        # Calculer le pourcentage utilisé
-        percentage = (spent_amount / budget.amount * 100) if budget.amount > 0 else 0
-        
-        # Déterminer le statut
-        if percentage > 100:
-            status = "exceeded"
-        elif percentage > 80:
-            status = "warning"
-        else:
-            status = "good"
-        
-        alerts.append({
-            "category": budget.category,
-            "budget_amount": budget.amount,
-            "spent_amount": spent_amount,
-            "percentage": percentage,
-            "status": status
-        })
-    
+from sqlalchemy.orm import Session
+from sqlalchemy import func, extract, or_, update
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Iterable, List, Optional, Dict, Any
+from sqlalchemy.exc import IntegrityError
+from . import archive, models, schemas, statements
+from .alerts import budget_alerts
+from .auth import get_password_hash
+from .cache import analytics_cache, transactions_tag, budgets_tag
+from .classifier import category_classifier, transaction_row
+from .columnar import user_snapshots
+from .config import settings
+from .database import shard_router
+from .category_map import category_map
+from .money import currency_exponent, from_minor, to_minor, user_exponents
+
+def _month_of(date: datetime) -> str:
+    """Mois (YYYY-MM) d'une date, utilisé pour l'invalidation du cache"""
+    return date.strftime("%Y-%m")
+
+def _encode_category(db: Session, data: Dict[str, Any], user_id: int, category_type: str) -> Dict[str, Any]:
+    """Remplace le nom de catégorie par son identifiant (catégorie créée si besoin)"""
+    if "category" in data:
+        data["category_id"] = category_map.ensure_id(db, data.pop("category"), category_type, user_id)
+    return data
+
+def _encode_amounts(data: Dict[str, Any], user_id: int, fields: List[str]) -> Dict[str, Any]:
+    """Convertit les montants reçus par l'API en unités mineures (colonnes *_minor)"""
+    exponent = user_exponents.get(user_id)
+    for field in fields:
+        if field in data:
+            value = data.pop(field)
+            if value is not None:
+                data[f"{field}_minor"] = to_minor(value, exponent)
+    return data
+
+def _select(db: Session, model, columns: Optional[List[str]] = None, required: tuple = ()):
+    """Requête sur le modèle entier, ou sur les seules colonnes demandées (projection des listes)"""
+    if columns is None:
+        return db.query(model)
+    names = dict.fromkeys([*required, *columns])
+    return db.query(*[getattr(model, name) for name in names])
+
+def _labelled_row(transaction: models.Transaction):
+    """Ligne étiquetée (caractéristiques, category_id) pour le classifieur"""
+    return transaction_row(transaction, user_exponents.get(transaction.user_id)), transaction.category_id
+
+def _learn(user_id: int, added: List[models.Transaction] = (), removed: list = ()) -> None:
+    """Apprentissage incrémental du classifieur après une écriture"""
+    category_classifier.record_write(user_id, added=[_labelled_row(t) for t in added], removed=removed)
+
+# Dépenses courantes des catégories budgétées : alertes détectées à l'écriture
+def _budget_status(spent_minor: int, budget_minor: int) -> str:
+    """Statut d'un budget : au-delà de 80 % « warning », au-delà de 100 % « exceeded »"""
+    percentage = (spent_minor / budget_minor * 100) if budget_minor > 0 else 0
+    if percentage > 100:
+        return "exceeded"
+    if percentage > 80:
+        return "warning"
+    return "good"
+
+def _spend_entry(transaction) -> tuple:
+    """((user_id, category_id, mois), montant) d'une dépense ; clé None pour un revenu"""
+    if transaction.type != "depense":
+        return None, 0
+    return (transaction.user_id, transaction.category_id, _month_of(transaction.date)), transaction.amount_minor
+
+def _spend_deltas(added: Iterable = (), removed: Iterable[tuple] = ()) -> Dict[tuple, int]:
+    """Variation des dépenses par (user_id, category_id, mois) ; removed : entrées prises avant l'écriture"""
+    deltas: Dict[tuple, int] = defaultdict(int)
+    for key, amount in removed:
+        if key is not None:
+            deltas[key] -= amount
+    for transaction in added:
+        key, amount = _spend_entry(transaction)
+        if key is not None:
+            deltas[key] += amount
+    return deltas
+
+def _month_spent(db: Session, user_id: int, category_id: int, month: str) -> int:
+    """Dépenses d'une catégorie pour un mois (unités mineures), archive comprise"""
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+    spent = db.query(func.sum(models.Transaction.amount_minor)).filter(
+        models.Transaction.user_id == user_id,
+        models.Transaction.category_id == category_id,
+        models.Transaction.type == "depense",
+        models.Transaction.date >= start,
+        models.Transaction.date < end
+    ).scalar() or 0
+    return spent + archive.category_totals(user_id, month).get(category_map.name(category_id), 0)
+
+def _running_spend(db: Session, user_id: int, category_id: int, month: str, delta: int) -> int:
+    """Ajoute delta aux dépenses suivies et retourne le nouveau total (ligne créée au premier passage)"""
+    key = (
+        models.BudgetSpend.user_id == user_id,
+        models.BudgetSpend.category_id == category_id,
+        models.BudgetSpend.month == month,
+    )
+    # Incrément en SQL : les écritures concurrentes d'autres workers ne se perdent pas
+    increment = update(models.BudgetSpend).where(*key).values(
+        spent_minor=models.BudgetSpend.spent_minor + delta
+    ).execution_options(synchronize_session=False)
+    if db.get_bind(mapper=models.BudgetSpend.__mapper__).dialect.update_returning:
+        # Nouveau total lu dans la même requête (PostgreSQL, SQLite >= 3.35)
+        spent = db.execute(increment.returning(models.BudgetSpend.spent_minor)).scalar()
+        if spent is not None:
+            return spent
+    elif db.execute(increment).rowcount:
+        return db.query(models.BudgetSpend.spent_minor).filter(*key).scalar()
+    # L'écriture en cours est déjà envoyée (flush) : elle est comprise dans le total
+    spent = _month_spent(db, user_id, category_id, month)
+    try:
+        with db.begin_nested():
+            db.add(models.BudgetSpend(user_id=user_id, category_id=category_id, month=month, spent_minor=spent))
+    except IntegrityError:
+        # Ligne créée entre-temps par une autre écriture : l'incrément suffit
+        return _running_spend(db, user_id, category_id, month, delta)
+    return spent
+
+def _budget_alert(user_id: int, category_id: int, month: str, budget_minor: int, spent_minor: int,
+                  previous_status: Optional[str] = None) -> Dict[str, Any]:
+    exponent = user_exponents.get(user_id)
+    return {
+        "category": category_map.name(category_id),
+        "month": month,
+        "budget_amount": from_minor(budget_minor, exponent),
+        "spent_amount": from_minor(spent_minor, exponent),
+        "percentage": (spent_minor / budget_minor * 100) if budget_minor > 0 else 0,
+        "status": _budget_status(spent_minor, budget_minor),
+        "previous_status": previous_status,
+    }
+
+def _track_budget_spend(db: Session, deltas: Dict[tuple, int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Reporte une écriture sur les dépenses suivies des mois budgétés, avant le commit.
+
+    Retourne, par utilisateur, les alertes dont le statut vient de changer.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    budgets = {
+        (user_id, category_id, month): amount
+        for user_id, category_id, month, amount in db.query(
+            models.Budget.user_id, models.Budget.category_id, models.Budget.month, models.Budget.amount_minor
+        ).filter(
+            models.Budget.user_id.in_({key[0] for key in deltas}),
+            models.Budget.month.in_({key[2] for key in deltas})
+        )
+    }
+    events: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    db.flush()
+    for key, delta in deltas.items():
+        budget_minor = budgets.get(key)
+        if budget_minor is None:
+            continue
+        spent = _running_spend(db, *key, delta)
+        previous = _budget_status(spent - delta, budget_minor)
+        if previous != _budget_status(spent, budget_minor):
+            events[key[0]].append(_budget_alert(*key, budget_minor, spent, previous))
+    return events
+
+def _publish_budget_alerts(events: Dict[int, List[Dict[str, Any]]]) -> None:
+    """Diffuse les changements de statut après le commit"""
+    for user_id, user_events in events.items():
+        budget_alerts.publish(user_id, user_events)
+
+def _refresh_budget_spend(db: Session, budget: models.Budget, previous_minor: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Recalcule les dépenses suivies d'un budget créé ou modifié ; alerte si son statut change"""
+    key = (budget.user_id, budget.category_id, budget.month)
+    spent = _month_spent(db, *key)
+    db.query(models.BudgetSpend).filter(
+        models.BudgetSpend.user_id == budget.user_id,
+        models.BudgetSpend.category_id == budget.category_id,
+        models.BudgetSpend.month == budget.month
+    ).delete(synchronize_session=False)
+    db.add(models.BudgetSpend(user_id=budget.user_id, category_id=budget.category_id, month=budget.month, spent_minor=spent))
+    previous = _budget_status(spent, previous_minor) if previous_minor is not None else "good"
+    if previous == _budget_status(spent, budget.amount_minor):
+        return []
+    return [_budget_alert(*key, budget.amount_minor, spent, previous)]
+
+def _forget_budget_spend(db: Session, user_id: int, category_id: int, month: str) -> None:
+    """Arrête le suivi d'un mois qui n'est plus budgété (recalculé s'il l'est de nouveau)"""
+    db.query(models.BudgetSpend).filter(
+        models.BudgetSpend.user_id == user_id,
+        models.BudgetSpend.category_id == category_id,
+        models.BudgetSpend.month == month
+    ).delete(synchronize_session=False)
+
+# Fonctions CRUD pour les utilisateurs
+def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+    hashed_password = get_password_hash(user.password)
+    currency = user.currency.upper()
+    db_user = models.User(
+        email=user.email,
+        username=user.username,
+        full_name=user.full_name,
+        hashed_password=hashed_password,
+        currency=currency,
+        currency_exponent=currency_exponent(currency)
+    )
+    db.add(db_user)
+    db.flush()
+    shard_router.place(db, db_user.id)
+    db.commit()
+    db.refresh(db_user)
+    user_exponents.remember(db_user.id, db_user.currency_exponent)
+    return db_user
+
+def get_user(db: Session, user_id: int) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.username == username).first()
+
+def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate) -> Optional[models.User]:
+    db_user = get_user(db, user_id)
+    if db_user:
+        for field, value in user_update.dict(exclude_unset=True).items():
+            setattr(db_user, field, value)
+        db.commit()
+        db.refresh(db_user)
+    return db_user
+
+# Fonctions CRUD pour les transactions
+def create_transaction(db: Session, transaction: schemas.TransactionCreate, user_id: int) -> models.Transaction:
+    data = _encode_category(db, transaction.dict(), user_id, transaction.type)
+    data = _encode_amounts(data, user_id, ["amount"])
+    db_transaction = models.Transaction(**data, user_id=user_id)
+    db.add(db_transaction)
+    events = _track_budget_spend(db, _spend_deltas(added=[db_transaction]))
+    db.commit()
+    db.refresh(db_transaction)
+    analytics_cache.invalidate([transactions_tag(user_id, _month_of(db_transaction.date))])
+    statements.invalidate(user_id, [_month_of(db_transaction.date)])
+    user_snapshots.record_write(user_id, added=[db_transaction])
+    _learn(user_id, added=[db_transaction])
+    _publish_budget_alerts(events)
+    return db_transaction
+
+def ingest_transactions(db: Session, events: List[tuple], spool: str, sequence: int) -> List[models.Transaction]:
+    """Insère un lot d'événements d'ingestion (user_id, TransactionCreate) en une seule transaction.
+
+    Le point de reprise du spool est enregistré dans la même transaction : au
+    redémarrage, les lignes déjà insérées ne sont pas rejouées.
+    """
+    rows = []
+    for user_id, transaction in events:
+        data = _encode_category(db, transaction.dict(), user_id, transaction.type)
+        data = _encode_amounts(data, user_id, ["amount"])
+        rows.append(models.Transaction(**data, user_id=user_id))
+    db.add_all(rows)
+    db.merge(models.IngestCheckpoint(spool=spool, sequence=sequence))
+    events = _track_budget_spend(db, _spend_deltas(added=rows))
+    db.commit()
+
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row.user_id].append(row)
+    analytics_cache.invalidate({transactions_tag(row.user_id, _month_of(row.date)) for row in rows})
+    for user_id, added in by_user.items():
+        statements.invalidate(user_id, {_month_of(row.date) for row in added})
+        user_snapshots.record_write(user_id, added=added)
+        _learn(user_id, added=added)
+    _publish_budget_alerts(events)
+    return rows
+
+def get_transactions(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Transaction]:
+    return db.query(models.Transaction).filter(models.Transaction.user_id == user_id).offset(skip).limit(limit).all()
+
+def get_user_transactions(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    transaction_type: Optional[str] = None,
+    category: Optional[str] = None,
+    columns: Optional[List[str]] = None
+) -> list:
+    """Transactions filtrées, des plus récentes aux plus anciennes, archive comprise.
+
+    Avec columns, seules ces colonnes sont lues et les lignes ne sont pas des modèles.
+    """
+    query = _select(db, models.Transaction, columns, required=("id", "date"))
+    query = query.filter(models.Transaction.user_id == user_id)
+    if start_date:
+        query = query.filter(models.Transaction.date >= start_date)
+    if end_date:
+        query = query.filter(models.Transaction.date <= end_date)
+    if transaction_type:
+        query = query.filter(models.Transaction.type == transaction_type)
+    if category:
+        query = query.filter(models.Transaction.category_id == category_map.id_for(category, db, user_id))
+    query = query.order_by(models.Transaction.date.desc(), models.Transaction.id.desc())
+
+    window = skip + limit
+    hot = query.limit(window).all()
+
+    # L'archive ne peut contribuer que si la période remonte jusqu'aux années archivées
+    # et que la table chaude ne remplit pas déjà la page avec des lignes plus récentes
+    archive_end = archive.archive_end(user_id)
+    if archive_end is None or (start_date and start_date >= archive_end):
+        return hot[skip:]
+    if len(hot) == window and hot[-1].date >= archive_end:
+        return hot[skip:]
+
+    cold = [
+        _archived_transaction(row, columns is not None)
+        for row in archive.read_transactions(user_id, start_date, end_date, transaction_type, category)
+    ]
+    merged = sorted(hot + cold, key=lambda t: (t.date, t.id), reverse=True)
+    return merged[skip:window]
+
+def _archived_transaction(row: Dict[str, Any], projected: bool):
+    """Transaction lue dans l'archive, sous la même forme que les lignes de la table chaude"""
+    values = dict(row)
+    values["category_id"] = category_map.id_for(values.pop("category"), user_id=values["user_id"])
+    return SimpleNamespace(**values) if projected else models.Transaction(**values)
+
+def get_transaction(db: Session, transaction_id: int, user_id: int) -> Optional[models.Transaction]:
+    return db.query(models.Transaction).filter(
+        models.Transaction.id == transaction_id,
+        models.Transaction.user_id == user_id
+    ).first()
+
+def get_archived_transaction(user_id: int, transaction_id: int) -> Optional[models.Transaction]:
+    """Transaction de l'utilisateur déplacée dans l'archive (lecture seule)"""
+    row = archive.find_transaction(user_id, transaction_id)
+    return _archived_transaction(row, False) if row is not None else None
+
+def update_transaction(db: Session, transaction_id: int, transaction_update: schemas.TransactionUpdate, user_id: int) -> Optional[models.Transaction]:
+    db_transaction = get_transaction(db, transaction_id, user_id)
+    if db_transaction:
+        old_month = _month_of(db_transaction.date)
+        old_row = _labelled_row(db_transaction)
+        old_spend = _spend_entry(db_transaction)
+        data = _encode_category(
+            db, transaction_update.dict(exclude_unset=True), user_id,
+            transaction_update.type or db_transaction.type
+        )
+        data = _encode_amounts(data, user_id, ["amount"])
+        for field, value in data.items():
+            setattr(db_transaction, field, value)
+        events = _track_budget_spend(db, _spend_deltas(added=[db_transaction], removed=[old_spend]))
+        db.commit()
+        db.refresh(db_transaction)
+        analytics_cache.invalidate({
+            transactions_tag(user_id, old_month),
+            transactions_tag(user_id, _month_of(db_transaction.date)),
+        })
+        statements.invalidate(user_id, [old_month, _month_of(db_transaction.date)])
+        user_snapshots.record_write(user_id, added=[db_transaction])
+        _learn(user_id, added=[db_transaction], removed=[old_row])
+        _publish_budget_alerts(events)
+    return db_transaction
+
+def delete_transaction(db: Session, transaction_id: int, user_id: int) -> bool:
+    db_transaction = get_transaction(db, transaction_id, user_id)
+    if db_transaction:
+        month = _month_of(db_transaction.date)
+        old_row = _labelled_row(db_transaction)
+        old_spend = _spend_entry(db_transaction)
+        db.delete(db_transaction)
+        events = _track_budget_spend(db, _spend_deltas(removed=[old_spend]))
+        db.commit()
+        analytics_cache.invalidate([transactions_tag(user_id, month)])
+        statements.invalidate(user_id, [month])
+        user_snapshots.record_write(user_id, removed_ids=[transaction_id])
+        _learn(user_id, removed=[old_row])
+        _publish_budget_alerts(events)
+        return True
+    return False
+
+# Catégorisation automatique
+def categorize_transactions(db: Session, user_id: int, items: List[schemas.CategorizeItem]) -> List[Dict[str, Any]]:
+    """Catégories prédites pour un lot de transactions à importer"""
+    exponent = user_exponents.get(user_id)
+    rows = [
+        (item.description, to_minor(item.amount, exponent, strict=False), exponent, item.type, item.payment_method)
+        for item in items
+    ]
+    return [
+        {"category": category, "confidence": confidence}
+        for category, confidence in category_classifier.classify(db, user_id, rows)
+    ]
+
+def categorize_pending_transactions(db: Session, user_id: int, min_confidence: float, limit: int) -> Dict[str, int]:
+    """Recatégorise les transactions classées dans une catégorie fourre-tout ("Divers")"""
+    generic_ids = [
+        category_id for category_id in
+        (category_map.id_for(name, db, user_id) for name in settings.classifier_generic_categories)
+        if category_id is not None
+    ]
+    if not generic_ids:
+        return {"examined": 0, "categorized": 0}
+    pending = db.query(models.Transaction).filter(
+        models.Transaction.user_id == user_id,
+        models.Transaction.category_id.in_(generic_ids)
+    ).order_by(models.Transaction.id).limit(limit).all()
+
+    exponent = user_exponents.get(user_id)
+    predictions = category_classifier.classify(db, user_id, [transaction_row(t, exponent) for t in pending])
+    changed, old_spend = [], []
+    for transaction, (category, confidence) in zip(pending, predictions):
+        if category is not None and confidence >= min_confidence:
+            old_spend.append(_spend_entry(transaction))
+            transaction.category_id = category_map.id_for(category, db, user_id)
+            changed.append(transaction)
+    if changed:
+        events = _track_budget_spend(db, _spend_deltas(added=changed, removed=old_spend))
+        db.commit()
+        analytics_cache.invalidate({transactions_tag(user_id, _month_of(t.date)) for t in changed})
+        statements.invalidate(user_id, {_month_of(t.date) for t in changed})
+        user_snapshots.record_write(user_id, added=changed)
+        _learn(user_id, added=changed)
+        _publish_budget_alerts(events)
+    return {"examined": len(pending), "categorized": len(changed)}
+
+def get_user_anomalies(db: Session, user_id: int, month: Optional[str] = None) -> List[models.SpendingAnomaly]:
+    """Dépenses inhabituelles détectées par la tâche nocturne (app/anomalies.py)"""
+    month = month or datetime.now().strftime("%Y-%m")
+    return db.query(models.SpendingAnomaly).filter(
+        models.SpendingAnomaly.user_id == user_id,
+        models.SpendingAnomaly.month == month
+    ).order_by(models.SpendingAnomaly.score.desc()).all()
+
+# Fonctions CRUD pour les budgets
+def create_budget(db: Session, budget: schemas.BudgetCreate, user_id: int) -> models.Budget:
+    data = _encode_category(db, budget.dict(), user_id, "depense")
+    data = _encode_amounts(data, user_id, ["amount"])
+    db_budget = models.Budget(**data, user_id=user_id)
+    db.add(db_budget)
+    events = _refresh_budget_spend(db, db_budget)
+    db.commit()
+    db.refresh(db_budget)
+    analytics_cache.invalidate([budgets_tag(user_id, db_budget.month)])
+    statements.invalidate(user_id, [db_budget.month])
+    budget_alerts.publish(user_id, events)
+    return db_budget
+
+def get_budgets(db: Session, user_id: int, month: str = None, columns: Optional[List[str]] = None) -> list:
+    query = _select(db, models.Budget, columns).filter(models.Budget.user_id == user_id)
+    if month:
+        query = query.filter(models.Budget.month == month)
+    return query.all()
+
+def update_budget(db: Session, budget_id: int, budget_update: schemas.BudgetUpdate, user_id: int) -> Optional[models.Budget]:
+    db_budget = db.query(models.Budget).filter(
+        models.Budget.id == budget_id,
+        models.Budget.user_id == user_id
+    ).first()
+    if db_budget:
+        old_month, old_amount = db_budget.month, db_budget.amount_minor
+        data = _encode_amounts(budget_update.dict(exclude_unset=True), user_id, ["amount"])
+        for field, value in data.items():
+            setattr(db_budget, field, value)
+        if db_budget.month != old_month:
+            _forget_budget_spend(db, user_id, db_budget.category_id, old_month)
+        events = _refresh_budget_spend(db, db_budget, old_amount if db_budget.month == old_month else None)
+        db.commit()
+        db.refresh(db_budget)
+        analytics_cache.invalidate({budgets_tag(user_id, old_month), budgets_tag(user_id, db_budget.month)})
+        statements.invalidate(user_id, [old_month, db_budget.month])
+        budget_alerts.publish(user_id, events)
+    return db_budget
+
+def delete_budget(db: Session, budget_id: int, user_id: int) -> bool:
+    db_budget = db.query(models.Budget).filter(
+        models.Budget.id == budget_id,
+        models.Budget.user_id == user_id
+    ).first()
+    if db_budget:
+        month = db_budget.month
+        _forget_budget_spend(db, user_id, db_budget.category_id, month)
+        db.delete(db_budget)
+        db.commit()
+        analytics_cache.invalidate([budgets_tag(user_id, month)])
+        statements.invalidate(user_id, [month])
+        return True
+    return False
+
+# Fonctions CRUD pour les objectifs
+def create_goal(db: Session, goal: schemas.GoalCreate, user_id: int) -> models.Goal:
+    data = _encode_amounts(goal.dict(), user_id, ["target_amount", "current_amount"])
+    db_goal = models.Goal(**data, user_id=user_id)
+    db.add(db_goal)
+    db.commit()
+    db.refresh(db_goal)
+    return db_goal
+
+def get_goals(db: Session, user_id: int, active_only: bool = False, columns: Optional[List[str]] = None) -> list:
+    query = _select(db, models.Goal, columns).filter(models.Goal.user_id == user_id)
+    if active_only:
+        query = query.filter(models.Goal.is_active == True)
+    return query.all()
+
+def get_goal(db: Session, goal_id: int, user_id: int) -> Optional[models.Goal]:
+    return db.query(models.Goal).filter(
+        models.Goal.id == goal_id,
+        models.Goal.user_id == user_id
+    ).first()
+
+def update_goal(db: Session, goal_id: int, goal_update: schemas.GoalUpdate, user_id: int) -> Optional[models.Goal]:
+    db_goal = get_goal(db, goal_id, user_id)
+    if db_goal:
+        data = _encode_amounts(goal_update.dict(exclude_unset=True), user_id, ["target_amount", "current_amount"])
+        for field, value in data.items():
+            setattr(db_goal, field, value)
+        db.commit()
+        db.refresh(db_goal)
+    return db_goal
+
+def delete_goal(db: Session, goal_id: int, user_id: int) -> bool:
+    db_goal = get_goal(db, goal_id, user_id)
+    if db_goal:
+        db.delete(db_goal)
+        db.commit()
+        return True
+    return False
+
+# Fonctions CRUD pour les catégories
+def get_categories(db: Session, category_type: Optional[str] = None, user_id: Optional[int] = None) -> List[models.Category]:
+    # Catégories communes, et celles de l'utilisateur (privées)
+    owners = models.Category.user_id.is_(None)
+    if user_id is not None:
+        owners = or_(owners, models.Category.user_id == user_id)
+    query = db.query(models.Category).filter(owners)
+    if category_type:
+        query = query.filter(models.Category.type == category_type)
+    return query.all()
+
+def get_category_by_name(db: Session, name: str, user_id: int) -> Optional[models.Category]:
+    """Catégorie commune ou de l'utilisateur portant ce nom"""
+    return db.query(models.Category).filter(
+        models.Category.name == name,
+        or_(models.Category.user_id.is_(None), models.Category.user_id == user_id),
+    ).first()
+
+def create_category(db: Session, category: schemas.CategoryCreate, user_id: int) -> models.Category:
+    """Crée une catégorie propre à l'utilisateur (les catégories communes viennent de init_data.py)"""
+    db_category = models.Category(**category.dict(), user_id=user_id)
+    db.add(db_category)
+    db.commit()
+    db.refresh(db_category)
+    category_map.forget_missing(category.name)
+    return db_category
+
+# Fonctions d'analyse
+def _trend_months(months: int) -> List[str]:
+    """Mois (YYYY-MM) couverts par la tendance mensuelle, du plus récent au plus ancien"""
+    return [(datetime.now() - timedelta(days=30*i)).strftime("%Y-%m") for i in range(months)]
+
+def get_user_analytics(db: Session, user_id: int, months: int = 6) -> Dict[str, Any]:
+    """Obtenir les analyses pour un utilisateur (résultat mis en cache)"""
+    current_month = datetime.now().strftime("%Y-%m")
+    trend_months = _trend_months(months)
+    tags = {transactions_tag(user_id, month) for month in trend_months + [current_month]}
+    return analytics_cache.get_or_compute(
+        "analytics", f"{user_id}:{current_month}:{months}", sorted(tags),
+        lambda: _compute_user_analytics(db, user_id, current_month, trend_months)
+    )
+
+def _compute_user_analytics(db: Session, user_id: int, current_month: str, trend_months: List[str]) -> Dict[str, Any]:
+    """Calcule les analyses d'un utilisateur (sommes entières en unités mineures)"""
+    exponent = user_exponents.get(user_id)
+    
+    # Revenus et dépenses par mois, mois courant et tendances en une requête
+    months = sorted(set(trend_months) | {current_month})
+    start = datetime.strptime(months[0], "%Y-%m")
+    end = (datetime.strptime(months[-1], "%Y-%m") + timedelta(days=32)).replace(day=1)
+    month_of_date = func.strftime("%Y-%m", models.Transaction.date)
+    totals = {
+        (month, kind): total or 0
+        for month, kind, total in db.query(
+            month_of_date, models.Transaction.type, func.sum(models.Transaction.amount_minor)
+        ).filter(
+            models.Transaction.user_id == user_id,
+            models.Transaction.date >= start,
+            models.Transaction.date < end
+        ).group_by(month_of_date, models.Transaction.type)
+    }
+    
+    # Revenus et dépenses du mois
+    total_revenues = totals.get((current_month, "revenu"), 0)
+    total_expenses = totals.get((current_month, "depense"), 0)
+    
+    # Solde
+    balance = total_revenues - total_expenses
+    
+    # Taux d'épargne
+    savings_rate = (balance / total_revenues * 100) if total_revenues > 0 else 0
+    
+    # Top catégories de dépenses
+    top_expense_categories = db.query(
+        models.Transaction.category_id,
+        func.sum(models.Transaction.amount_minor).label('total')
+    ).filter(
+        models.Transaction.user_id == user_id,
+        models.Transaction.type == "depense",
+        func.strftime("%Y-%m", models.Transaction.date) == current_month
+    ).group_by(models.Transaction.category_id).order_by(func.sum(models.Transaction.amount_minor).desc()).limit(5).all()
+    
+    # Tendances mensuelles (les mois archivés sont lus dans l'archive)
+    archived_totals = archive.monthly_totals(user_id, trend_months)
+    monthly_trends = []
+    for month in trend_months:
+        month_revenues = totals.get((month, "revenu"), 0) + archived_totals.get((month, "revenu"), 0)
+        month_expenses = totals.get((month, "depense"), 0) + archived_totals.get((month, "depense"), 0)
+        
+        monthly_trends.append({
+            "month": month,
+            "revenues": from_minor(month_revenues, exponent),
+            "expenses": from_minor(month_expenses, exponent),
+            "balance": from_minor(month_revenues - month_expenses, exponent)
+        })
+    
+    return {
+        "total_revenues": from_minor(total_revenues, exponent),
+        "total_expenses": from_minor(total_expenses, exponent),
+        "balance": from_minor(balance, exponent),
+        "savings_rate": savings_rate,
+        "top_expense_categories": [
+            {"category": category_map.name(category_id), "total": from_minor(total, exponent)} 
+            for category_id, total in top_expense_categories
+        ],
+        "monthly_trends": monthly_trends
+    }
+
+def get_budget_alerts(db: Session, user_id: int, month: str = None) -> List[Dict[str, Any]]:
+    """Obtenir les alertes de budget pour un utilisateur (résultat mis en cache)"""
+    if not month:
+        month = datetime.now().strftime("%Y-%m")
+    
+    return analytics_cache.get_or_compute(
+        "alerts", f"{user_id}:{month}",
+        [transactions_tag(user_id, month), budgets_tag(user_id, month)],
+        lambda: _compute_budget_alerts(db, user_id, month)
+    )
+
+def _compute_budget_alerts(db: Session, user_id: int, month: str) -> List[Dict[str, Any]]:
+    """Calcule les alertes de budget d'un utilisateur pour un mois (sommes entières en unités mineures)"""
+    exponent = user_exponents.get(user_id)
+    alerts = []
+    
+    # Récupérer tous les budgets de l'utilisateur pour le mois
+    budgets = get_budgets(db, user_id, month)
+    # Dépenses tenues à jour à l'écriture (budget_spend)
+    tracked = dict(db.query(models.BudgetSpend.category_id, models.BudgetSpend.spent_minor).filter(
+        models.BudgetSpend.user_id == user_id,
+        models.BudgetSpend.month == month
+    ).all()) if budgets else {}
+    
+    for budget in budgets:
+        spent_amount = tracked.get(budget.category_id)
+        if spent_amount is None:
+            # Budget antérieur au suivi : dépenses agrégées (suivies dès la prochaine écriture)
+            spent_amount = _month_spent(db, user_id, budget.category_id, month)
+        
+        # Calculer le pourcentage utilisé
+        percentage = (spent_amount / budget.amount_minor * 100) if budget.amount_minor > 0 else 0
+        
+        alerts.append({
+            "category": budget.category,
+            "budget_amount": from_minor(budget.amount_minor, exponent),
+            "spent_amount": from_minor(spent_amount, exponent),
+            "percentage": percentage,
+            "status": _budget_status(spent_amount, budget.amount_minor)
+        })
+    
     return alerts 
\ No newline at end of file
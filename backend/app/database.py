@@ -1,24 +1,306 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import settings
-
-# Création du moteur de base de données
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
-
-# Création de la session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Base pour les modèles
-Base = declarative_base()
-
-# Fonction pour obtenir la session de base de données
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+import logging
+import math
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql.util import find_tables
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def _create_engine(url: str):
+    # Une connexion par thread de route : une requête admise n'attend jamais le pool de connexions
+    pool_options = {} if ":memory:" in url else {"pool_size": settings.threadpool_size}
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False} if "sqlite" in url else {},
+        **pool_options
+    )
+
+# Création du moteur de base de données (primaire : toutes les écritures)
+engine = _create_engine(settings.database_url)
+
+# Moteur de lecture (réplica) : le primaire si aucun réplica n'est configuré
+read_engine = _create_engine(settings.database_read_url) if settings.database_read_url else engine
+
+# Shards : données des utilisateurs réparties entre plusieurs bases (le primaire peut en faire partie).
+# Le primaire garde les utilisateurs, les catégories, l'annuaire des shards et les tables globales.
+shard_engines = [engine if url == settings.database_url else _create_engine(url) for url in settings.shard_urls]
+
+# Tables des données propres à chaque utilisateur, stockées sur son shard
+SHARDED_TABLES = frozenset({
+    "transactions", "budgets", "budget_spend", "goals", "spending_anomalies", "ingest_checkpoints",
+})
+# Annuaire user_id -> shard, toujours lu sur le primaire (un réplica en retard renverrait l'ancien shard)
+DIRECTORY_TABLE = "user_shards"
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Hachage cohérent (Lamping et Veach) : passer de N à N+1 shards ne déplace qu'un utilisateur sur N+1"""
+    key &= 0xFFFFFFFFFFFFFFFF
+    shard, candidate = -1, 0
+    while candidate < buckets:
+        shard = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((shard + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return shard
+
+class ShardRouter:
+    """Associe chaque utilisateur à son shard.
+
+    L'annuaire (table user_shards du primaire) fait foi : un nouvel utilisateur y
+    est placé par jump_hash, rebalance_shards.py l'y déplace. Un utilisateur sans
+    entrée (créé avant l'activation des shards) est sur le shard 0.
+    """
+
+    def __init__(self, engines: list):
+        self.engines = engines
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def shards(self) -> list:
+        """Shards à parcourir par les tâches globales ([None] avec une seule base)"""
+        return list(range(len(self.engines))) or [None]
+
+    def target(self, user_id: int) -> int:
+        """Shard désigné par le hachage stable"""
+        return jump_hash(user_id, len(self.engines))
+
+    def lookup(self, db: Session, user_ids: Iterable[int]) -> Dict[int, Tuple[Optional[int], bool]]:
+        """(shard, déplacement en cours) de chaque utilisateur"""
+        user_ids = set(user_ids)
+        if not self.enabled:
+            return {user_id: (None, False) for user_id in user_ids}
+        from .models import UserShard
+
+        found = {
+            user_id: (shard, moving)
+            for user_id, shard, moving in db.query(UserShard.user_id, UserShard.shard, UserShard.moving).filter(
+                UserShard.user_id.in_(user_ids)
+            )
+        }
+        return {user_id: found.get(user_id, (0, False)) for user_id in user_ids}
+
+    def place(self, db: Session, user_id: int) -> None:
+        """Inscrit un nouvel utilisateur dans l'annuaire (commit par l'appelant)"""
+        if self.enabled:
+            from .models import UserShard
+
+            db.add(UserShard(user_id=user_id, shard=self.target(user_id)))
+
+    def bind(self, db: Session, user_id: int) -> None:
+        """Oriente la session vers le shard de l'utilisateur"""
+        if self.enabled:
+            db.info["shard"], db.info["moving"] = self.lookup(db, [user_id])[user_id]
+
+shard_router = ShardRouter(shard_engines)
+
+def create_shard_tables() -> None:
+    """Crée les tables des utilisateurs sur chaque shard, sans clés étrangères vers le primaire"""
+    for shard_engine in shard_engines:
+        if shard_engine is engine:
+            continue
+        with shard_engine.begin() as connection:
+            existing = set(inspect(connection).get_table_names())
+            for name in sorted(SHARDED_TABLES - existing):
+                table = Base.metadata.tables[name]
+                connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+                for index in table.indexes:
+                    index.create(connection)
+
+def _routed_table(mapper, clause) -> Optional[str]:
+    """Table qui décide du moteur d'une requête : shardée, annuaire ou autre (None)"""
+    if mapper is not None:
+        return getattr(mapper.persist_selectable, "name", None)
+    if clause is not None:
+        for table in find_tables(clause, include_crud=True):
+            if table.name in SHARDED_TABLES or table.name == DIRECTORY_TABLE:
+                return table.name
+    return None
+
+class LocalWriteClock:
+    """Dernière écriture par utilisateur, propre au processus (un seul worker)"""
+
+    def __init__(self):
+        self._last_write_by_user: Dict[int, float] = {}
+
+    def record(self, user_id: int) -> None:
+        now = time.monotonic()
+        self._last_write_by_user[user_id] = now
+        if len(self._last_write_by_user) > 10000:
+            # Purger les entrées expirées pour borner la mémoire
+            for uid, written_at in list(self._last_write_by_user.items()):
+                if now - written_at >= settings.read_your_writes_seconds:
+                    del self._last_write_by_user[uid]
+
+    def is_recent(self, user_id: int) -> bool:
+        written_at = self._last_write_by_user.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < settings.read_your_writes_seconds
+
+class RedisWriteClock:
+    """Dernière écriture par utilisateur partagée entre les workers (clé Redis expirante)"""
+
+    def __init__(self, url: str):
+        import redis
+
+        # Consulté à chaque session des utilisateurs connectés : une panne de Redis ne doit pas la bloquer
+        timeout = settings.read_your_writes_redis_timeout
+        self.client = redis.Redis.from_url(
+            url, decode_responses=True, socket_connect_timeout=timeout, socket_timeout=timeout
+        )
+        self.client.ping()
+
+    def record(self, user_id: int) -> None:
+        try:
+            self.client.set(f"ryw:{user_id}", 1, px=int(settings.read_your_writes_seconds * 1000))
+        except Exception as e:
+            logger.warning("Redis indisponible (%s), écriture de l'utilisateur %d non partagée", e, user_id)
+
+    def is_recent(self, user_id: int) -> bool:
+        try:
+            return bool(self.client.exists(f"ryw:{user_id}"))
+        except Exception:
+            # Dans le doute, lire sur le primaire
+            return True
+
+def create_write_clock():
+    """Suivi des écritures récentes : partagé par Redis avec plusieurs workers (None : indisponible)"""
+    if read_engine is engine or settings.api_workers <= 1:
+        return LocalWriteClock()
+    try:
+        return RedisWriteClock(settings.redis_url)
+    except Exception as e:
+        # La lecture suivante arrive souvent sur un autre worker : sans état partagé, rien ne
+        # garantirait qu'un utilisateur relise ses propres écritures sur le réplica
+        logger.warning("Redis indisponible (%s), lectures des utilisateurs connectés servies par le primaire", e)
+        return None
+
+# Après une écriture, les lectures de l'utilisateur restent sur le primaire
+# pendant settings.read_your_writes_seconds
+write_clock = create_write_clock()
+
+def record_user_write(user_id: int) -> None:
+    """Note qu'un utilisateur vient d'écrire sur le primaire"""
+    if write_clock is not None:
+        write_clock.record(user_id)
+
+def is_user_sticky(user_id: Optional[int]) -> bool:
+    """Indique si les lectures de l'utilisateur doivent encore aller au primaire"""
+    if user_id is None:
+        return False
+    return write_clock is None or write_clock.is_recent(user_id)
+
+class RoutingSession(Session):
+    """Session qui envoie les lectures vers le réplica et les écritures vers le primaire.
+
+    Une session n'utilise le réplica que si elle est marquée en lecture seule
+    (info["read_only"]) et que l'utilisateur (info["user_id"]) n'a pas écrit récemment.
+    Ce dernier point est décidé une fois par session, à sa première lecture après
+    l'authentification (info["sticky"]) : toutes ses lectures vont au même moteur.
+    Avec des shards, les tables des utilisateurs vont au shard info["shard"].
+    """
+
+    def _sticky(self) -> bool:
+        sticky = self.info.get("sticky")
+        if sticky is None:
+            user_id = self.info.get("user_id")
+            if user_id is None:
+                return False
+            sticky = self.info["sticky"] = is_user_sticky(user_id)
+        return sticky
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if shard_engines:
+            table = _routed_table(mapper, clause)
+            if table in SHARDED_TABLES:
+                shard = self.info.get("shard")
+                if shard is None:
+                    raise RuntimeError(f"Table {table} : session non liée au shard d'un utilisateur")
+                return shard_engines[shard]
+            if table == DIRECTORY_TABLE:
+                return engine
+        if read_engine is engine:
+            return engine
+        if self._flushing or not self.info.get("read_only"):
+            return engine
+        if clause is not None and getattr(clause, "is_dml", False):
+            return engine
+        if self._sticky():
+            return engine
+        return read_engine
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_session_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_session_write(session):
+    if session.info.pop("wrote", False) and session.info.get("user_id") is not None:
+        record_user_write(session.info["user_id"])
+        # La suite de la session relit ses propres écritures
+        session.info["sticky"] = True
+
+def _moving_error() -> HTTPException:
+    retry_after = math.ceil(2 * settings.shard_move_grace_seconds) or 1
+    return HTTPException(
+        status_code=503,
+        detail=f"Vos données sont en cours de déplacement, réessayez dans {retry_after} s",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+# Pendant le déplacement de ses données vers un autre shard, l'utilisateur peut lire mais pas écrire
+@event.listens_for(RoutingSession, "before_flush")
+def _refuse_moving_writes(session, flush_context, instances):
+    if session.info.get("moving"):
+        raise _moving_error()
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _refuse_moving_statements(orm_execute_state):
+    if orm_execute_state.session.info.get("moving") and not orm_execute_state.is_select:
+        raise _moving_error()
+
+# Création de la session
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+
+# Base pour les modèles
+Base = declarative_base()
+
+# Fonction pour obtenir la session de base de données.
+# La session est liée à l'utilisateur (réplica, shard) par get_current_user, après l'authentification.
+def get_db(request: Request):
+    # Sous-requête de POST /batch : session partagée, fermée par la requête parente
+    shared = getattr(request.state, "batch_db", None)
+    if shared is not None:
+        yield shared
+        return
+    db = SessionLocal()
+    # Les requêtes GET/HEAD peuvent être servies par le réplica ; le choix du réplica pour
+    # l'utilisateur (lecture de ses propres écritures) est fait une fois, à la première lecture
+    db.info["read_only"] = request.method in ("GET", "HEAD")
+    db.info["sticky"] = None
+    try:
+        yield db
+    finally:
+        db.close()
+
+def refresh_sqlite_replica() -> None:
+    """Copie la base SQLite primaire vers le réplica SQLite (remplaçant local d'un réplica)"""
+    if not settings.database_read_url:
+        raise ValueError("Aucun réplica configuré (DATABASE_READ_URL)")
+    if engine.dialect.name != "sqlite" or read_engine.dialect.name != "sqlite":
+        raise ValueError("La copie de réplica n'est disponible que pour SQLite")
+    source = sqlite3.connect(engine.url.database)
+    target = sqlite3.connect(read_engine.url.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    # Les connexions ouvertes sur l'ancien fichier doivent être renouvelées
+    read_engine.dispose()
@@ -0,0 +1,95 @@
+"""
+Projections des listes (paramètre fields=) et format colonnaire compact.
+
+Un graphique n'a besoin que de quelques champs (date, montant, catégorie) alors
+que schemas.Transaction sérialise aussi la description, created_at et
+updated_at. Avec fields=, seules les colonnes correspondantes sont lues par le
+SELECT et les lignes sont encodées directement en valeurs JSON, sans
+instancier de modèles ni valider la réponse avec Pydantic.
+
+Formats (layout=) :
+- "rows" : liste d'objets, comme sans fields=
+- "columns" : {"count": n, "fields": [...], "columns": {champ: [valeurs]}},
+  les noms de champs n'étant plus répétés à chaque ligne
+"""
+
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+
+from pydantic import BaseModel
+
+from . import models, schemas
+from .category_map import category_map
+from .money import from_minor
+
+LAYOUTS = ("rows", "columns")
+
+
+class FieldSet:
+    """Champs publics d'un schéma de liste et colonnes SQL correspondantes"""
+
+    def __init__(self, model, schema: Type[BaseModel], money: Optional[Dict[str, str]] = None):
+        self.model = model
+        self.names = list(schema.model_fields)
+        self.money = money or {}
+
+    def column(self, field: str) -> str:
+        """Colonne du modèle qui porte un champ de l'API"""
+        if field in self.money:
+            return self.money[field]
+        if field == "category":
+            return "category_id"
+        return field
+
+    def parse(self, fields: Optional[str], layout: str = "rows") -> Optional[List[str]]:
+        """"date,amount,category" -> champs à projeter (None : réponse complète habituelle).
+
+        ValueError si un champ ou le format est inconnu.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Format invalide: {layout}")
+        if not fields:
+            return None if layout == "rows" else list(self.names)
+        requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        invalid = [name for name in requested if name not in self.names]
+        if invalid or not requested:
+            raise ValueError(f"Champs invalides: {', '.join(invalid) or fields}")
+        return requested
+
+    def columns(self, fields: Iterable[str]) -> List[str]:
+        return list(dict.fromkeys(self.column(field) for field in fields))
+
+    def _converter(self, field: str, exponent: int) -> Callable[[Any], Any]:
+        if field in self.money:
+            return lambda value: from_minor(value, exponent)
+        if field == "category":
+            return category_map.name
+        column = getattr(self.model, self.column(field))
+        if issubclass(column.type.python_type, date):
+            return lambda value: value.isoformat() if value is not None else None
+        return lambda value: value
+
+    def encode(self, rows: List[Any], fields: List[str], exponent: int, layout: str = "rows") -> Any:
+        """Encode des lignes (modèles ou lignes projetées) en valeurs JSON"""
+        getters = [(field, self.column(field), self._converter(field, exponent)) for field in fields]
+        if layout == "columns":
+            return {
+                "count": len(rows),
+                "fields": fields,
+                "columns": {
+                    field: [convert(getattr(row, column)) for row in rows]
+                    for field, column, convert in getters
+                },
+            }
+        return [
+            {field: convert(getattr(row, column)) for field, column, convert in getters}
+            for row in rows
+        ]
+
+
+TRANSACTION_FIELDS = FieldSet(models.Transaction, schemas.Transaction, money={"amount": "amount_minor"})
+BUDGET_FIELDS = FieldSet(models.Budget, schemas.Budget, money={"amount": "amount_minor"})
+GOAL_FIELDS = FieldSet(
+    models.Goal, schemas.Goal,
+    money={"target_amount": "target_amount_minor", "current_amount": "current_amount_minor"},
+)
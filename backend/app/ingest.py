@@ -0,0 +1,468 @@
+"""
+Ingestion des flux de transactions (webhooks mobile money, synchronisations).
+
+Les fournisseurs envoient des rafales de transactions isolées ; une insertion
+par transaction (commit, fsync et refresh à chaque ligne) limite le débit.
+POST /transactions/ingest dépose donc les transactions dans la file du worker :
+
+1. une tâche asyncio regroupe les événements, jusqu'à settings.ingest_batch_size
+   lignes ou settings.ingest_flush_ms millisecondes après le premier ;
+2. le lot est ajouté au spool local (une ligne JSON par événement) avec un seul
+   fsync, puis les producteurs reçoivent leur accusé de réception : leurs
+   transactions survivront à un arrêt brutal du worker ;
+3. le lot est inséré en une transaction par shard, avec le point de reprise du
+   spool sur ce shard (table ingest_checkpoints), puis les caches sont invalidés.
+
+Au-delà de settings.ingest_queue_size lignes en attente, les producteurs
+attendent (au plus settings.ingest_max_wait secondes, puis 503 + Retry-After).
+
+Seules les erreurs transitoires (base indisponible, connexion perdue) sont
+réessayées, au plus settings.ingest_max_attempts fois : le lot reste ensuite
+dans le spool, que le worker abandonne pour un nouveau spool, et il est rejoué
+plus tard. Une erreur de données est isolée en coupant le lot en deux jusqu'aux
+lignes fautives, écrites dans le fichier des rejets (dead-letter.jsonl du
+répertoire des spools) ; le point de reprise avance au-delà.
+
+Chaque worker écrit son propre spool (verrouillé par flock). Au démarrage, et
+après une insertion réussie s'il reste des spools abandonnés, les spools qui ne
+sont plus verrouillés (worker arrêté) sont rejoués à partir de leur point de
+reprise, puis supprimés.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, models, schemas
+from .admission import Overloaded
+from .config import settings
+from .database import SessionLocal, shard_router
+from .money import to_minor, user_exponents
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus en développement, pas de verrou
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SPOOL_PREFIX = "spool-"
+SPOOL_SUFFIX = ".jsonl"
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+MAX_RETRY_DELAY = 5.0
+
+# Événement numéroté du spool : (séquence, (user_id, transaction))
+Entry = Tuple[int, Tuple[int, schemas.TransactionCreate]]
+
+
+def _lock(file) -> bool:
+    """Verrou exclusif non bloquant sur un fichier de spool"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _checkpoint(db, spool: str) -> int:
+    return db.query(models.IngestCheckpoint.sequence).filter(models.IngestCheckpoint.spool == spool).scalar() or 0
+
+
+def _is_transient(error: Exception) -> bool:
+    """Base indisponible ou connexion perdue : le même lot peut passer plus tard"""
+    if isinstance(error, (OperationalError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def _check_amounts(user_id: int, transactions: List[schemas.TransactionCreate]) -> None:
+    """AmountError si un montant ne peut pas être stocké dans la devise de l'utilisateur"""
+    exponent = user_exponents.get(user_id)
+    for transaction in transactions:
+        to_minor(transaction.amount, exponent)
+
+
+def _insert(entries: List[Entry], spool: str) -> None:
+    # expire_on_commit=False : les lignes insérées restent lisibles sans un SELECT par ligne
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        shards = shard_router.lookup(db, {user_id for _, (user_id, _) in entries})
+        by_shard: Dict[Optional[int], List[Entry]] = {}
+        for entry in entries:
+            by_shard.setdefault(shards[entry[1][0]][0], []).append(entry)
+        # Une transaction par shard, chacune avec son point de reprise
+        for shard, shard_entries in by_shard.items():
+            db.info["shard"] = shard
+            checkpoint = _checkpoint(db, spool)
+            # Événements déjà insérés (ou rejetés) lors d'un essai précédent
+            events = [event for sequence, event in shard_entries if sequence > checkpoint]
+            if events:
+                crud.ingest_transactions(db, events, spool, shard_entries[-1][0])
+    finally:
+        db.close()
+
+
+def _reject(directory: str, spool: str, entry: Entry, error: Exception) -> None:
+    """Écarte un événement refusé par la base : fichier des rejets, puis point de reprise avancé"""
+    sequence, (user_id, transaction) = entry
+    reason = str(getattr(error, "orig", None) or error)
+    record = {
+        "spool": spool,
+        "seq": sequence,
+        "user_id": user_id,
+        "transaction": transaction.model_dump(mode="json", warnings=False),
+        "error": reason[:500],
+        "rejected_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(directory, DEAD_LETTER_FILE), "ab") as f:
+        # Fichier commun aux workers : une ligne entière à la fois
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        f.write(json.dumps(record).encode() + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    logger.error("Transaction d'ingestion rejetée (spool %s, séquence %d) : %s", spool, sequence, reason)
+
+    db = SessionLocal()
+    try:
+        db.info["shard"] = shard_router.lookup(db, [user_id])[user_id][0]
+        if _checkpoint(db, spool) < sequence:
+            crud.ingest_transactions(db, [], spool, sequence)
+    finally:
+        db.close()
+
+
+def _store(directory: str, entries: List[Entry], spool: str) -> int:
+    """Insère des événements du spool ; retourne le nombre d'événements rejetés.
+
+    Une erreur de données (contrainte, montant invalide...) est isolée en
+    coupant le lot en deux jusqu'aux lignes fautives, qui sont rejetées. Une
+    erreur transitoire est propagée : le lot sera réessayé.
+    """
+    try:
+        _insert(entries, spool)
+        return 0
+    except Exception as error:
+        if _is_transient(error):
+            raise
+        if len(entries) == 1:
+            _reject(directory, spool, entries[0], error)
+            return 1
+    middle = len(entries) // 2
+    return _store(directory, entries[:middle], spool) + _store(directory, entries[middle:], spool)
+
+
+def _read_spool(path: str) -> List[Entry]:
+    """Événements d'un spool ; une dernière ligne tronquée (arrêt pendant l'écriture) est ignorée"""
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            try:
+                transaction = schemas.TransactionCreate(**record["transaction"])
+            except ValidationError:
+                # Écrit par une version moins stricte : rejeté à l'insertion, comme toute ligne fautive
+                transaction = schemas.TransactionCreate.model_construct(**record["transaction"])
+            entries.append((record["seq"], (record["user_id"], transaction)))
+    return entries
+
+
+def _forget_spool(name: str) -> None:
+    db = SessionLocal()
+    try:
+        for shard in shard_router.shards():
+            db.info["shard"] = shard
+            db.query(models.IngestCheckpoint).filter(models.IngestCheckpoint.spool == name).delete()
+            db.commit()
+    finally:
+        db.close()
+
+
+def replay_orphan_spools(directory: str, batch_size: int) -> Dict[str, int]:
+    """Rejoue les spools des workers arrêtés (ou abandonnés).
+
+    Retourne les transactions insérées, les transactions rejetées et les
+    spools conservés faute de base disponible.
+    """
+    report = {"replayed": 0, "rejected": 0, "kept": 0}
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith(SPOOL_PREFIX) and name.endswith(SPOOL_SUFFIX)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            continue  # déjà rejoué par un autre worker
+        with f:
+            if not _lock(f) or os.fstat(f.fileno()).st_nlink == 0:
+                continue  # spool d'un worker en cours d'exécution, ou supprimé entre-temps
+            entries = _read_spool(path)
+            db = SessionLocal()
+            try:
+                shards = shard_router.lookup(db, {user_id for _, (user_id, _) in entries})
+                checkpoints = {}
+                for shard in set(shard for shard, _ in shards.values()):
+                    db.info["shard"] = shard
+                    checkpoints[shard] = _checkpoint(db, name)
+            finally:
+                db.close()
+            # Chaque shard a son propre point de reprise
+            entries = [entry for entry in entries if entry[0] > checkpoints[shards[entry[1][0]][0]]]
+            rejected = 0
+            try:
+                for start in range(0, len(entries), batch_size):
+                    rejected += _store(directory, entries[start:start + batch_size], name)
+            except Exception:
+                # Base indisponible : spool conservé, rejoué par un prochain rejeu
+                logger.exception("Échec du rejeu du spool %s", name)
+                report["kept"] += 1
+                continue
+            report["replayed"] += len(entries) - rejected
+            report["rejected"] += rejected
+            os.remove(path)
+        _forget_spool(name)
+        if entries:
+            logger.warning("Spool %s rejoué : %d transactions, %d rejetées", name, len(entries) - rejected, rejected)
+    return report
+
+
+class IngestQueue:
+    """File d'ingestion du worker : spool durable puis insertions groupées"""
+
+    def __init__(self, directory: str, batch_size: int, flush_ms: int, queue_size: int,
+                 max_wait: float, spool_max_bytes: int):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.spool_max_bytes = spool_max_bytes
+        self.spool_name: Optional[str] = None
+        self._spool = None
+        self._sequence = 0
+        self._inflight = 0  # lignes du lot en cours d'insertion
+        self._orphans = False  # spools abandonnés (base indisponible) en attente de rejeu
+        self._pending: Deque[Tuple[Tuple[int, schemas.TransactionCreate], asyncio.Future]] = deque()
+        self._not_empty: Optional[asyncio.Event] = None
+        self._not_full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_time = 0.01  # durée moyenne d'un lot (s), pour Retry-After
+        self.stats = {
+            "accepted": 0, "inserted": 0, "batches": 0, "rejected": 0, "replayed": 0,
+            "dead_letters": 0, "db_errors": 0, "abandoned_spools": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _open_spool(self) -> None:
+        self.spool_name = f"{SPOOL_PREFIX}{uuid.uuid4().hex}{SPOOL_SUFFIX}"
+        # Verrouillé avant d'être visible : un autre worker ne peut pas le prendre pour un orphelin
+        temporary = os.path.join(self.directory, f".{self.spool_name}.tmp")
+        self._spool = open(temporary, "ab")
+        _lock(self._spool)
+        os.rename(temporary, os.path.join(self.directory, self.spool_name))
+
+    def _rotate_spool(self) -> None:
+        # Le spool fermé (donc déverrouillé) garde le lot non inséré et devient orphelin :
+        # les lots suivants ont un nouveau spool, dont le point de reprise ne le couvre pas
+        self._spool.close()
+        self._open_spool()
+
+    async def _replay(self) -> None:
+        report = await run_in_threadpool(replay_orphan_spools, self.directory, self.batch_size)
+        self.stats["replayed"] += report["replayed"]
+        self.stats["dead_letters"] += report["rejected"]
+        self._orphans = report["kept"] > 0
+
+    async def start(self) -> None:
+        """Rejoue les spools orphelins puis ouvre le spool du worker et lance l'insertion"""
+        os.makedirs(self.directory, exist_ok=True)
+        await self._replay()
+        self._open_spool()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Insère les événements en attente puis supprime le spool (arrêt propre du worker)"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + settings.graceful_timeout
+        while (self._pending or self._inflight) and self.running and time.monotonic() < deadline:
+            await asyncio.sleep(self.flush_interval)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Producteurs encore dans la file : rien n'a été écrit dans le spool pour eux (503)
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(Overloaded("arrêt du worker", 1))
+        self._spool.close()
+        if not self._inflight:
+            os.remove(os.path.join(self.directory, self.spool_name))
+            await run_in_threadpool(_forget_spool, self.spool_name)
+        else:
+            logger.warning("Arrêt avec des transactions non insérées : spool %s conservé", self.spool_name)
+
+    async def submit(self, user_id: int, transactions: List[schemas.TransactionCreate]) -> int:
+        """Ajoute des transactions à la file et attend qu'elles soient écrites dans le spool.
+
+        Lève Overloaded si la file reste pleine plus de max_wait secondes ; les
+        transactions d'un même appel sont toutes acceptées ou toutes refusées.
+        """
+        if not self.running:
+            raise Overloaded("ingestion indisponible", 1)
+        count = len(transactions)
+        if count > self.queue_size:
+            raise ValueError(f"Lot trop volumineux (maximum {self.queue_size} transactions)")
+        # Avant l'accusé de réception : une transaction acceptée doit pouvoir être insérée (AmountError sinon)
+        await run_in_threadpool(_check_amounts, user_id, transactions)
+
+        deadline = time.monotonic() + self.max_wait
+        while len(self._pending) + count > self.queue_size:
+            self._not_full.clear()
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._not_full.wait(), remaining)
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += count
+                batches_ahead = len(self._pending) / self.batch_size + 1
+                raise Overloaded("file d'ingestion pleine", batches_ahead * self._flush_time)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for transaction in transactions:
+            future = loop.create_future()
+            self._pending.append(((user_id, transaction), future))
+            futures.append(future)
+        self._not_empty.set()
+        self.stats["accepted"] += count
+        await asyncio.gather(*futures)
+        return count
+
+    async def _run(self) -> None:
+        while True:
+            await self._not_empty.wait()
+            deadline = time.monotonic() + self.flush_interval
+            # Lot incomplet : laisser arriver d'autres événements pendant au plus T ms
+            while len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                await asyncio.sleep(min(0.005, max(deadline - time.monotonic(), 0)))
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not self._pending:
+                self._not_empty.clear()
+            started = time.monotonic()
+            await self._flush(batch)
+            self._flush_time = 0.8 * self._flush_time + 0.2 * (time.monotonic() - started)
+            self._not_full.set()
+
+    def _append_to_spool(self, lines: List[bytes]) -> None:
+        self._spool.write(b"".join(lines))
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+
+    def _truncate_spool(self) -> None:
+        # Tout le contenu du spool est en base : le point de reprise suffit pour la suite
+        self._spool.truncate(0)
+        os.fsync(self._spool.fileno())
+
+    async def _flush(self, batch: List[Tuple[Tuple[int, schemas.TransactionCreate], asyncio.Future]]) -> None:
+        first = self._sequence + 1
+        lines = []
+        for offset, ((user_id, transaction), _) in enumerate(batch):
+            record = {"seq": first + offset, "user_id": user_id, "transaction": transaction.model_dump(mode="json")}
+            lines.append(json.dumps(record).encode() + b"\n")
+        try:
+            await run_in_threadpool(self._append_to_spool, lines)
+        except Exception as e:
+            logger.exception("Échec de l'écriture du spool d'ingestion")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(Overloaded(f"spool indisponible ({e})", 1))
+            return
+        self._sequence += len(batch)
+        self._inflight = len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+        entries = list(zip(range(first, self._sequence + 1), (event for event, _ in batch)))
+        delay = 0.1
+        attempts = 0
+        while True:
+            try:
+                rejected = await run_in_threadpool(_store, self.directory, entries, self.spool_name)
+                break
+            except Exception:
+                # Erreur transitoire : les événements sont dans le spool, réessayer sans perdre l'ordre
+                attempts += 1
+                self.stats["db_errors"] += 1
+                if attempts >= settings.ingest_max_attempts:
+                    logger.exception("Base indisponible : lot laissé dans le spool %s, rejoué plus tard", self.spool_name)
+                    await run_in_threadpool(self._rotate_spool)
+                    self.stats["abandoned_spools"] += 1
+                    self._orphans = True
+                    self._inflight = 0
+                    return
+                logger.warning(
+                    "Échec de l'insertion d'un lot d'ingestion (essai %d), nouvel essai dans %.1f s",
+                    attempts, delay, exc_info=True,
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        self._inflight = 0
+        self.stats["inserted"] += len(batch) - rejected
+        self.stats["dead_letters"] += rejected
+        self.stats["batches"] += 1
+        if os.fstat(self._spool.fileno()).st_size > self.spool_max_bytes:
+            await run_in_threadpool(self._truncate_spool)
+        if self._orphans:
+            # La base répond de nouveau : rejouer les spools abandonnés
+            await self._replay()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "spool": self.spool_name,
+            "queue_depth": len(self._pending),
+            "queue_size": self.queue_size,
+            "batch_size": self.batch_size,
+            "flush_ms": int(self.flush_interval * 1000),
+            "avg_batch_seconds": round(self._flush_time, 4),
+            "avg_batch_rows": round(self.stats["inserted"] / self.stats["batches"], 1) if self.stats["batches"] else 0,
+            **self.stats,
+        }
+
+
+# File d'ingestion du worker (démarrée avec l'application)
+ingest_queue = IngestQueue(
+    settings.ingest_spool_dir,
+    batch_size=settings.ingest_batch_size,
+    flush_ms=settings.ingest_flush_ms,
+    queue_size=settings.ingest_queue_size,
+    max_wait=settings.ingest_max_wait,
+    spool_max_bytes=settings.ingest_spool_max_bytes,
+)
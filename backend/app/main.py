@@ -1,53 +1,143 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
-from .models import Base
-from .config import settings
-from .api import auth, transactions, budgets, goals, categories
-
-# Créer les tables de la base de données
-Base.metadata.create_all(bind=engine)
-
-# Créer l'application FastAPI
-app = FastAPI(
-    title=settings.app_name,
-    description="API pour l'application Mon Budget Malin",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# Configuration CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Inclure les routers
-app.include_router(auth.router, prefix="/auth", tags=["authentification"])
-app.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
-app.include_router(budgets.router, prefix="/budgets", tags=["budgets"])
-app.include_router(goals.router, prefix="/goals", tags=["objectifs"])
-app.include_router(categories.router, prefix="/categories", tags=["catégories"])
-
-@app.get("/")
-def read_root():
-    """Point d'entrée de l'API"""
-    return {
-        "message": "Bienvenue sur l'API Mon Budget Malin",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "redoc": "/redoc"
-    }
-
-@app.get("/health")
-def health_check():
-    """Point de terminaison pour vérifier la santé de l'API"""
-    return {"status": "healthy", "message": "API opérationnelle"}
-
-if __name__ == "__main__":
-    import uvicorn
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from .database import engine, read_engine, shard_engines, create_shard_tables
+from .cache import analytics_cache
+from .models import Base
+from .config import settings
+from .admission import AdmissionMiddleware, admission_stats, configure_threadpool
+from .ratelimit import RateLimitMiddleware, bucket_backend
+from .ingest import ingest_queue
+from .money import AmountError
+from .alerts import budget_alerts
+from .statements import statement_generator
+from .sqlstats import SQLStatsMiddleware
+from .api import auth, transactions, budgets, goals, categories, batch, analytics, statements
+
+# Créer les tables de la base de données
+Base.metadata.create_all(bind=engine)
+create_shard_tables()
+
+# Créer l'application FastAPI
+app = FastAPI(
+    title=settings.app_name,
+    description="API pour l'application Mon Budget Malin",
+    version="1.0.0",
+    docs_url="/docs",
+    redoc_url="/redoc"
+)
+
+# Requêtes SQL de chaque requête (Server-Timing, dépassements des budgets des routes)
+if settings.sql_stats:
+    app.add_middleware(SQLStatsMiddleware)
+
+# Contrôle d'admission des analyses et alertes (après la limitation de débit)
+app.add_middleware(
+    AdmissionMiddleware,
+    pools=settings.admission_pools,
+    routes=settings.admission_routes,
+)
+
+# Limitation de débit (ajoutée avant CORS : les réponses 429 portent les en-têtes CORS)
+app.add_middleware(
+    RateLimitMiddleware,
+    backend=bucket_backend,
+    limits=settings.rate_limits,
+)
+
+# Configuration CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.allowed_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.exception_handler(AmountError)
+async def amount_error_handler(request, exc: AmountError):
+    """Montant incompatible avec la devise de l'utilisateur (1500.5 FCFA) : erreur de validation"""
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+@app.on_event("startup")
+async def startup():
+    """Dimensionne le pool de threads des routes synchrones et démarre la file d'ingestion"""
+    configure_threadpool()
+    await ingest_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Insère les transactions encore dans la file d'ingestion et arrête le calcul des relevés"""
+    await ingest_queue.stop()
+    statement_generator.shutdown()
+
+# Inclure les routers
+app.include_router(auth.router, prefix="/auth", tags=["authentification"])
+app.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
+app.include_router(budgets.router, prefix="/budgets", tags=["budgets"])
+app.include_router(goals.router, prefix="/goals", tags=["objectifs"])
+app.include_router(categories.router, prefix="/categories", tags=["catégories"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analyses"])
+app.include_router(statements.router, prefix="/statements", tags=["relevés"])
+app.include_router(batch.router, tags=["batch"])
+
+@app.get("/")
+def read_root():
+    """Point d'entrée de l'API"""
+    return {
+        "message": "Bienvenue sur l'API Mon Budget Malin",
+        "version": "1.0.0",
+        "docs": "/docs",
+        "redoc": "/redoc"
+    }
+
+@app.get("/health")
+def health_check():
+    """Point de terminaison pour vérifier la santé de l'API"""
+    return {"status": "healthy", "message": "API opérationnelle"}
+
+@app.get("/health/live")
+def liveness_check():
+    """Sonde de vivacité : le processus worker répond"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Sonde de disponibilité : le worker peut servir des requêtes (base de données joignable)"""
+    try:
+        for db_engine in {engine, read_engine, *shard_engines}:
+            with db_engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+    except Exception:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "database": "down"})
+    return {"status": "ready", "database": "up"}
+
+@app.get("/health/cache")
+def cache_stats():
+    """Statistiques du cache des analyses (hits, misses, taux de succès) pour ce worker"""
+    return analytics_cache.stats()
+
+@app.get("/health/admission")
+def admission_metrics():
+    """Pools d'admission de ce worker : requêtes en cours, profondeur de file, attentes, refus"""
+    return admission_stats()
+
+@app.get("/health/ingest")
+def ingest_metrics():
+    """File d'ingestion de ce worker : profondeur, lots insérés, refus, transactions rejouées"""
+    return ingest_queue.snapshot()
+
+@app.get("/health/alerts")
+def alerts_metrics():
+    """Flux d'alertes de budget ouverts sur ce worker et alertes publiées"""
+    return budget_alerts.snapshot()
+
+@app.get("/health/statements")
+def statements_metrics():
+    """Relevés calculés, en cours, obsolètes ou en échec sur ce worker"""
+    return statement_generator.snapshot()
+
+if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Migrations de schéma en ligne (par lots courts, sans arrêt de l'application).
+"""
+
+from typing import Dict, List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+# Tables dont la colonne texte `category` devient `category_id`
+CATEGORY_TABLES = ("transactions", "budgets")
+# Tables des utilisateurs qui référencent categories.id
+CATEGORY_REFERENCES = ("transactions", "budgets", "budget_spend", "spending_anomalies")
+
+
+def _columns(engine: Engine, table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def _ensure_categories(connection, table: str) -> int:
+    """Ajoute au dictionnaire les noms de catégories encore inconnus.
+
+    Un nom employé par un seul utilisateur devient sa catégorie ; un nom
+    employé par plusieurs utilisateurs devient une catégorie commune (user_id NULL).
+    """
+    type_column = "MIN(t.type)" if table == "transactions" else "'depense'"
+    result = connection.execute(text(f"""
+        INSERT INTO categories (name, type, is_default, user_id)
+        SELECT t.category, {type_column}, :is_default,
+               CASE WHEN COUNT(DISTINCT t.user_id) = 1 THEN MIN(t.user_id) END
+        FROM {table} t
+        WHERE t.category_id IS NULL
+          AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = t.category)
+        GROUP BY t.category
+    """), {"is_default": False})
+    return result.rowcount
+
+
+def _share_categories(connection, table: str, text_column: bool) -> int:
+    """Rend communes les catégories d'un utilisateur employées aussi par d'autres utilisateurs"""
+    others = "t.category_id = categories.id"
+    if text_column:
+        others = f"({others} OR (t.category_id IS NULL AND t.category = categories.name))"
+    result = connection.execute(text(f"""
+        UPDATE categories SET user_id = NULL
+        WHERE user_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = categories.name AND c.user_id IS NULL)
+          AND EXISTS (SELECT 1 FROM {table} t WHERE {others} AND t.user_id <> categories.user_id)
+    """))
+    return result.rowcount
+
+
+def _backfill_batch(connection, table: str, batch_size: int) -> int:
+    """Renseigne category_id pour un lot de lignes (catégorie commune ou de l'utilisateur)"""
+    visible = f"c.name = {table}.category AND (c.user_id IS NULL OR c.user_id = {table}.user_id)"
+    result = connection.execute(text(f"""
+        UPDATE {table}
+        SET category_id = (SELECT MIN(c.id) FROM categories c WHERE {visible})
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE category_id IS NULL
+              AND EXISTS (SELECT 1 FROM categories c WHERE {visible})
+            LIMIT :batch_size
+        )
+    """), {"batch_size": batch_size})
+    return result.rowcount
+
+
+def _per_user_category_names(engine: Engine) -> bool:
+    """Remplace l'unicité globale de categories.name par les index uniques du modèle
+    (noms communs, noms par utilisateur). Retourne True si le schéma a changé."""
+    from .database import Base
+    from .models import Category
+
+    table = Category.__table__
+    inspector = inspect(engine)
+    constraints = [u for u in inspector.get_unique_constraints("categories") if u["column_names"] == ["name"]]
+    existing_indexes = {index["name"] for index in inspector.get_indexes("categories")}
+    if not constraints:
+        with engine.begin() as connection:
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+        return False
+
+    if engine.dialect.name == "sqlite":
+        # SQLite ne sait pas supprimer une contrainte : reconstruction de la table
+        columns = ", ".join(
+            column.name for column in table.columns if column.name in _columns(engine, "categories")
+        )
+        rebuilt = table.to_metadata(Base.metadata, name="categories_new")
+        try:
+            with engine.begin() as connection:
+                connection.execute(CreateTable(rebuilt))
+                connection.execute(text(f"INSERT INTO categories_new ({columns}) SELECT {columns} FROM categories"))
+                connection.execute(text("DROP TABLE categories"))
+                connection.execute(text("ALTER TABLE categories_new RENAME TO categories"))
+                for index in table.indexes:
+                    index.create(connection)
+        finally:
+            Base.metadata.remove(rebuilt)
+    else:
+        with engine.begin() as connection:
+            for constraint in constraints:
+                connection.execute(text(f'ALTER TABLE categories DROP CONSTRAINT "{constraint["name"]}"'))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+    return True
+
+
+def migrate_categories_to_ids(engine: Engine, batch_size: int = 1000, finalize: bool = False) -> Dict[str, int]:
+    """Remplace les noms de catégories des transactions et budgets par des clés vers categories.id.
+
+    Étapes (relançables) :
+    1. ajout des colonnes categories.user_id et {table}.category_id ;
+    2. remplissage de category_id par lots (une transaction courte par lot),
+       pendant que l'ancienne version de l'application continue d'écrire ;
+       une catégorie privée employée par plusieurs utilisateurs devient commune ;
+    3. unicité des noms par propriétaire (commune ou utilisateur) au lieu d'une
+       unicité globale ;
+    4. avec finalize=True, au moment de la bascule : dernier rattrapage puis
+       suppression de l'ancienne colonne texte.
+    """
+    report: Dict[str, int] = {}
+
+    if "user_id" not in _columns(engine, "categories"):
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE categories ADD COLUMN user_id INTEGER REFERENCES users(id)"))
+
+    for table in CATEGORY_TABLES:
+        columns = _columns(engine, table)
+        if "category_id" not in columns:
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN category_id INTEGER REFERENCES categories(id)"
+                ))
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_category_id ON {table} (category_id)"
+            ))
+
+        if "category" not in columns:
+            report[table] = 0
+            continue
+
+        migrated = 0
+        while True:
+            with engine.begin() as connection:
+                _ensure_categories(connection, table)
+                _share_categories(connection, table, text_column=True)
+            while True:
+                with engine.begin() as connection:
+                    updated = _backfill_batch(connection, table, batch_size)
+                migrated += updated
+                if updated == 0:
+                    break
+            with engine.begin() as connection:
+                remaining = connection.execute(text(
+                    f"SELECT COUNT(*) FROM {table} WHERE category_id IS NULL"
+                )).scalar()
+            if not remaining:
+                break
+        report[table] = migrated
+
+        if finalize:
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN category"))
+
+    # Bases migrées par une version qui rattachait un nom à son premier utilisateur
+    existing = set(inspect(engine).get_table_names())
+    report["shared_categories"] = 0
+    for table in CATEGORY_REFERENCES:
+        if table in existing:
+            with engine.begin() as connection:
+                report["shared_categories"] += _share_categories(connection, table, text_column=False)
+    report["category_names_per_user"] = int(_per_user_category_names(engine))
+
+    return report
+
+
+# Montants flottants -> unités mineures entières
+
+# Colonnes monétaires : table -> [(ancienne colonne, nouvelle colonne)]
+MONEY_COLUMNS = {
+    "transactions": [("amount", "amount_minor")],
+    "budgets": [("amount", "amount_minor")],
+    "goals": [("target_amount", "target_amount_minor"), ("current_amount", "current_amount_minor")],
+}
+
+
+def _backfill_minor_batch(connection, table: str, old: str, new: str, exponent: int, batch_size: int) -> int:
+    """Convertit un lot de montants pour les utilisateurs d'un même exposant.
+
+    Conversion en Python avec to_minor : même arrondi (bancaire) que l'API,
+    là où ROUND() en SQL arrondit les demis en s'éloignant de zéro.
+    """
+    from .money import to_minor
+    rows = connection.execute(text(f"""
+        SELECT x.id, x.{old} FROM {table} x
+        LEFT JOIN users u ON u.id = x.user_id
+        WHERE x.{new} IS NULL AND COALESCE(u.currency_exponent, 0) = :exponent
+        LIMIT :batch_size
+    """), {"exponent": exponent, "batch_size": batch_size}).fetchall()
+    if rows:
+        connection.execute(
+            text(f"UPDATE {table} SET {new} = :minor WHERE id = :id"),
+            [{"id": row_id, "minor": to_minor(value or 0, exponent, strict=False)} for row_id, value in rows],
+        )
+    return len(rows)
+
+
+def _backfill_minor(engine: Engine, table: str, old: str, new: str, exponents: List[int], batch_size: int) -> int:
+    migrated = 0
+    for exponent in exponents:
+        while True:
+            with engine.begin() as connection:
+                updated = _backfill_minor_batch(connection, table, old, new, exponent, batch_size)
+            migrated += updated
+            if updated == 0:
+                break
+    return migrated
+
+
+def migrate_amounts_to_minor_units(engine: Engine, batch_size: int = 1000, finalize: bool = False) -> Dict[str, int]:
+    """Remplace les montants flottants par des entiers en unités mineures.
+
+    Étapes (relançables) :
+    1. ajout de users.currency / users.currency_exponent et des colonnes *_minor ;
+    2. conversion par lots, exposant par exposant (XOF : 0, EUR : 2...) ;
+    3. ajout de la colonne amount_minor aux fichiers d'archive ;
+    4. avec finalize=True, au moment de la bascule : dernier rattrapage puis
+       suppression des anciennes colonnes flottantes.
+    """
+    report: Dict[str, int] = {}
+
+    user_columns = _columns(engine, "users")
+    with engine.begin() as connection:
+        if "currency" not in user_columns:
+            connection.execute(text("ALTER TABLE users ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT 'XOF'"))
+        if "currency_exponent" not in user_columns:
+            connection.execute(text("ALTER TABLE users ADD COLUMN currency_exponent INTEGER NOT NULL DEFAULT 0"))
+
+    with engine.begin() as connection:
+        exponents = [row[0] for row in connection.execute(text(
+            "SELECT DISTINCT COALESCE(currency_exponent, 0) FROM users"
+        ))] or [0]
+
+    for table, pairs in MONEY_COLUMNS.items():
+        columns = _columns(engine, table)
+        for old, new in pairs:
+            if new not in columns:
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} BIGINT"))
+
+            key = f"{table}.{new}"
+            if old not in columns:
+                report[key] = 0
+                continue
+
+            report[key] = _backfill_minor(engine, table, old, new, exponents, batch_size)
+
+    from .archive import add_minor_amounts
+    from .money import user_exponents
+    report["archive_files"] = add_minor_amounts(user_exponents.get)
+
+    if finalize:
+        for table, pairs in MONEY_COLUMNS.items():
+            columns = _columns(engine, table)
+            for old, new in pairs:
+                if old not in columns:
+                    continue
+                # Rattrapage des lignes écrites par l'ancienne version depuis la conversion
+                _backfill_minor(engine, table, old, new, exponents, batch_size)
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+
+    return report
@@ -1,81 +1,171 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-from .database import Base
-from datetime import datetime
-
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True)
-    username = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
-    full_name = Column(String)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    # Relations
-    transactions = relationship("Transaction", back_populates="user")
-    budgets = relationship("Budget", back_populates="user")
-    goals = relationship("Goal", back_populates="user")
-
-class Transaction(Base):
-    __tablename__ = "transactions"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Float, nullable=False)
-    type = Column(String, nullable=False)  # 'revenu' ou 'depense'
-    category = Column(String, nullable=False)
-    description = Column(Text)
-    payment_method = Column(String)
-    date = Column(DateTime, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    # Relations
-    user = relationship("User", back_populates="transactions")
-
-class Budget(Base):
-    __tablename__ = "budgets"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    category = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
-    month = Column(String, nullable=False)  # Format: "YYYY-MM"
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    # Relations
-    user = relationship("User", back_populates="budgets")
-
-class Goal(Base):
-    __tablename__ = "goals"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    name = Column(String, nullable=False)
-    target_amount = Column(Float, nullable=False)
-    current_amount = Column(Float, default=0)
-    deadline = Column(DateTime)
-    description = Column(Text)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    # Relations
-    user = relationship("User", back_populates="goals")
-
-class Category(Base):
-    __tablename__ = "categories"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, nullable=False)
-    icon = Column(String)
-    color = Column(String)
-    type = Column(String, nullable=False)  # 'revenu' ou 'depense'
-    is_default = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, Boolean, Float, Index, LargeBinary, text
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from .database import Base
+from .money import money_property
+from datetime import datetime
+
+class CategoryNameMixin:
+    """Expose le nom de la catégorie (chaîne) à partir de category_id"""
+
+    @property
+    def category(self):
+        from .category_map import category_map
+        return category_map.name(self.category_id)
+
+    @category.setter
+    def category(self, name):
+        from .category_map import category_map
+        self.category_id = category_map.id_for(name, user_id=getattr(self, "user_id", None))
+
+class User(Base):
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True)
+    username = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    full_name = Column(String)
+    currency = Column(String, nullable=False, default="XOF")
+    currency_exponent = Column(Integer, nullable=False, default=0)  # décimales de l'unité mineure
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Relations
+    transactions = relationship("Transaction", back_populates="user")
+    budgets = relationship("Budget", back_populates="user")
+    goals = relationship("Goal", back_populates="user")
+
+class Transaction(CategoryNameMixin, Base):
+    __tablename__ = "transactions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    amount_minor = Column(BigInteger, nullable=False)  # unités mineures de la devise de l'utilisateur
+    type = Column(String, nullable=False)  # 'revenu' ou 'depense'
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
+    description = Column(Text)
+    payment_method = Column(String)
+    date = Column(DateTime, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    amount = money_property("amount_minor")
+    
+    # Relations
+    user = relationship("User", back_populates="transactions")
+
+class Budget(CategoryNameMixin, Base):
+    __tablename__ = "budgets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
+    amount_minor = Column(BigInteger, nullable=False)
+    month = Column(String, nullable=False)  # Format: "YYYY-MM"
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    amount = money_property("amount_minor")
+    
+    # Relations
+    user = relationship("User", back_populates="budgets")
+
+class Goal(Base):
+    __tablename__ = "goals"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    name = Column(String, nullable=False)
+    target_amount_minor = Column(BigInteger, nullable=False)
+    current_amount_minor = Column(BigInteger, default=0)
+    deadline = Column(DateTime)
+    description = Column(Text)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    target_amount = money_property("target_amount_minor")
+    current_amount = money_property("current_amount_minor")
+    
+    # Relations
+    user = relationship("User", back_populates="goals")
+
+class UserShard(Base):
+    """Annuaire des shards : base qui contient les données d'un utilisateur"""
+    __tablename__ = "user_shards"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    shard = Column(Integer, nullable=False)  # indice dans settings.shard_urls
+    pinned = Column(Boolean, nullable=False, default=False)  # placé à la main : ignoré par le rééquilibrage
+    moving = Column(Boolean, nullable=False, default=False)  # déplacement en cours : écritures refusées
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class BudgetSpend(Base):
+    """Dépenses du mois d'une catégorie budgétée, tenues à jour à chaque écriture"""
+    __tablename__ = "budget_spend"
+    __table_args__ = (Index("ix_budget_spend_user_month_category", "user_id", "month", "category_id", unique=True),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    month = Column(String, nullable=False)  # Format: "YYYY-MM"
+    spent_minor = Column(BigInteger, nullable=False)  # archive comprise
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class IngestCheckpoint(Base):
+    """Dernier numéro de séquence d'un spool d'ingestion inséré en base"""
+    __tablename__ = "ingest_checkpoints"
+    
+    spool = Column(String, primary_key=True)  # nom du fichier de spool
+    sequence = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Category(Base):
+    __tablename__ = "categories"
+    # Noms uniques parmi les catégories communes, et parmi celles de chaque utilisateur
+    __table_args__ = (
+        Index("ix_categories_shared_name", "name", unique=True,
+              sqlite_where=text("user_id IS NULL"), postgresql_where=text("user_id IS NULL")),
+        Index("ix_categories_user_name", "user_id", "name", unique=True,
+              sqlite_where=text("user_id IS NOT NULL"), postgresql_where=text("user_id IS NOT NULL")),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    icon = Column(String)
+    color = Column(String)
+    type = Column(String, nullable=False)  # 'revenu' ou 'depense'
+    is_default = Column(Boolean, default=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL : catégorie commune
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SpendingAnomaly(CategoryNameMixin, Base):
+    __tablename__ = "spending_anomalies"
+    __table_args__ = (Index("ix_spending_anomalies_user_month", "user_id", "month"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    month = Column(String, nullable=False, index=True)  # Format: "YYYY-MM"
+    amount_minor = Column(BigInteger, nullable=False)  # dépenses du mois
+    baseline_minor = Column(BigInteger, nullable=False)  # médiane des mois précédents
+    score = Column(Float, nullable=False)  # écart robuste (en MAD)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    amount = money_property("amount_minor")
+    baseline = money_property("baseline_minor")
+
+class PeerSketch(Base):
+    """t-digest des parts de dépenses d'une cohorte pour une catégorie commune et un mois"""
+    __tablename__ = "peer_sketches"
+    __table_args__ = (Index("ix_peer_sketches_month_cohort", "month", "cohort"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(String, nullable=False)  # Format: "YYYY-MM"
+    cohort = Column(String, nullable=False)  # ex. "XOF:r11", "XOF:*" ou "*"
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    count = Column(Integer, nullable=False)  # utilisateurs résumés
+    sketch = Column(LargeBinary, nullable=False)  # TDigest.to_bytes()
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,127 @@
+"""
+Montants en unités mineures entières.
+
+Les montants sont stockés en BigInteger dans l'unité mineure de la devise de
+l'utilisateur (1 FCFA pour le XOF, 1 centime pour l'EUR) et convertis en
+nombre décimal uniquement à la frontière des schémas de l'API. Les sommes
+restent ainsi exactes et calculées en arithmétique entière par la base.
+"""
+
+import threading
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Dict, Optional, Union
+
+from .database import SessionLocal
+
+DEFAULT_CURRENCY = "XOF"
+
+# Montant maximal accepté par l'API (en unités de la devise) : même en centimes
+# et une fois sommé sur des millions de lignes, loin de la limite d'un BIGINT
+MAX_AMOUNT = 10 ** 12
+
+# Écart toléré avec l'unité mineure : bruit de représentation des flottants
+# (0.1 + 0.2), pas une vraie fraction d'unité mineure
+FLOAT_NOISE = Decimal("1e-6")
+
+# Nombre de décimales de l'unité mineure (ISO 4217)
+CURRENCY_EXPONENTS = {
+    "XOF": 0,
+    "XAF": 0,
+    "GNF": 0,
+    "EUR": 2,
+    "USD": 2,
+    "GBP": 2,
+    "MAD": 2,
+    "NGN": 2,
+    "GHS": 2,
+    "CDF": 2,
+}
+
+
+class AmountError(ValueError):
+    """Montant refusé : hors bornes ou plus précis que l'unité mineure de la devise"""
+
+
+def currency_exponent(currency: str) -> int:
+    """Exposant d'une devise (ValueError si la devise n'est pas prise en charge)"""
+    try:
+        return CURRENCY_EXPONENTS[currency.upper()]
+    except KeyError:
+        raise ValueError(f"Devise non prise en charge : {currency}")
+
+
+def to_minor(value: Union[float, int, Decimal, None], exponent: int, strict: bool = True) -> Optional[int]:
+    """Convertit un montant en unités mineures (arrondi bancaire).
+
+    En mode strict (montants reçus par l'API), AmountError si le montant est
+    hors bornes ou plus précis que l'unité mineure (1500.5 FCFA, 10.005 EUR) ;
+    sinon (conversion des anciens montants flottants) il est arrondi.
+    """
+    if value is None:
+        return None
+    amount = Decimal(str(value))
+    if not amount.is_finite():
+        raise AmountError(f"Montant invalide : {value}")
+    if strict and abs(amount) > MAX_AMOUNT:
+        raise AmountError(f"Montant hors limites : {value} (maximum {MAX_AMOUNT})")
+    scaled = amount.scaleb(exponent)
+    minor = scaled.quantize(Decimal(1), rounding=ROUND_HALF_EVEN)
+    if strict and abs(scaled - minor) > FLOAT_NOISE:
+        if exponent == 0:
+            raise AmountError(f"Montant invalide : {value} (la devise n'a pas de décimales)")
+        raise AmountError(f"Montant invalide : {value} (au plus {exponent} décimales pour la devise)")
+    return int(minor)
+
+
+def from_minor(value: Optional[int], exponent: int) -> Optional[float]:
+    """Convertit des unités mineures en montant décimal pour l'API"""
+    if value is None:
+        return None
+    if exponent == 0:
+        return float(value)
+    return float(Decimal(int(value)).scaleb(-exponent))
+
+
+class UserExponents:
+    """Cache de l'exposant monétaire de chaque utilisateur"""
+
+    def __init__(self):
+        self._exponents: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[int]) -> int:
+        if user_id is None:
+            return currency_exponent(DEFAULT_CURRENCY)
+        exponent = self._exponents.get(user_id)
+        if exponent is None:
+            from . import models
+            db = SessionLocal()
+            try:
+                exponent = db.query(models.User.currency_exponent).filter(models.User.id == user_id).scalar()
+            finally:
+                db.close()
+            if exponent is None:
+                return currency_exponent(DEFAULT_CURRENCY)
+            with self._lock:
+                self._exponents[user_id] = exponent
+        return exponent
+
+    def remember(self, user_id: int, exponent: int) -> None:
+        with self._lock:
+            self._exponents[user_id] = exponent
+
+
+# Instance globale du cache des exposants
+user_exponents = UserExponents()
+
+
+def money_property(column: str) -> property:
+    """Propriété exposant une colonne en unités mineures comme un montant décimal"""
+
+    def getter(self):
+        return from_minor(getattr(self, column), user_exponents.get(self.user_id))
+
+    def setter(self, value):
+        setattr(self, column, to_minor(value, user_exponents.get(self.user_id)))
+
+    return property(getter, setter)
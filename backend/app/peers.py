@@ -0,0 +1,244 @@
+"""
+Comparaisons avec les utilisateurs semblables (« les utilisateurs comme vous
+consacrent X % de leurs dépenses à la Nourriture »).
+
+Une tâche périodique (compute_peer_benchmarks.py) parcourt en flux, par
+requête agrégée, les dépenses mensuelles de chaque utilisateur par catégorie
+et ajoute sa part de dépenses (en %, comparable d'une devise à l'autre) au
+t-digest de sa cohorte et de la catégorie. Les utilisateurs sont répartis
+entre plusieurs processus (user_id modulo le nombre de processus, pour chaque
+shard) dont les t-digests partiels sont fusionnés, puis enregistrés dans
+`peer_sketches`.
+
+Cohortes, de la plus précise à la plus large :
+- "XOF:r11" : même devise, revenus du mois dans la même demi-décade
+  (10^5,5 à 10^6 unités pour r11, "r-" sans revenu) ;
+- "XOF:*" : même devise ;
+- "*" : tous les utilisateurs.
+GET /analytics/peers lit les t-digests du mois pour la cohorte de
+l'utilisateur et retient, pour chaque catégorie, la cohorte la plus précise
+qui compte au moins settings.peers_min_users utilisateurs : aucune valeur
+individuelle n'est conservée ni exposée.
+
+Seules les catégories communes sont comparées ; une catégorie commune sans
+dépense compte pour 0 %. Les mois archivés ne sont pas relus.
+"""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .category_map import category_map
+from .config import settings
+from .database import shard_router
+from .sketches import TDigest
+
+FETCH_BATCH_SIZE = 100_000
+GLOBAL_COHORT = "*"
+
+
+def month_range(month: str) -> Tuple[datetime, datetime]:
+    year, number = int(month[:4]), int(month[5:7])
+    return datetime(year, number, 1), datetime(year + number // 12, number % 12 + 1, 1)
+
+
+def revenue_band(revenue_minor: int, exponent: int) -> str:
+    """Demi-décade des revenus du mois en unités de la devise ("r-" sans revenu)"""
+    if revenue_minor <= 0:
+        return "r-"
+    return f"r{math.floor(2 * math.log10(revenue_minor / 10 ** exponent))}"
+
+
+def cohorts_of(currency: str, band: str) -> List[str]:
+    """Cohortes d'un utilisateur, de la plus précise à la plus large"""
+    return [f"{currency}:{band}", f"{currency}:*", GLOBAL_COHORT]
+
+
+def user_shares(
+    rows: Iterable[Tuple[str, int, int]], categories: Iterable[int]
+) -> Tuple[int, Optional[Dict[int, float]]]:
+    """(revenus, part en % de chaque catégorie commune) à partir des totaux (type, category_id, total) du mois.
+
+    Les parts sont None si l'utilisateur n'a aucune dépense ce mois-là.
+    """
+    revenue = 0
+    spent: Dict[int, int] = {}
+    for kind, category_id, total in rows:
+        if kind == "revenu":
+            revenue += total
+        else:
+            spent[category_id] = spent.get(category_id, 0) + total
+    total_spent = sum(spent.values())
+    if total_spent <= 0:
+        return revenue, None
+    return revenue, {category_id: 100 * spent.get(category_id, 0) / total_spent for category_id in categories}
+
+
+def common_expense_categories(db: Session) -> List[int]:
+    """Catégories de dépenses communes (les catégories personnelles restent privées)"""
+    generic = set(settings.classifier_generic_categories)
+    return [
+        category_id for category_id, name in db.query(models.Category.id, models.Category.name).filter(
+            models.Category.user_id.is_(None), models.Category.type == "depense"
+        )
+        if name not in generic
+    ]
+
+
+def partial_sketches(month: str, workers: int = 1, index: int = 0, shard: Optional[int] = None) -> Dict[Tuple[str, int], bytes]:
+    """t-digests (cohorte, catégorie) des utilisateurs d'un shard tels que user_id % workers == index"""
+    from .database import SessionLocal, engine, shard_engines
+
+    # Processus enfant : ne pas réutiliser les connexions héritées du parent
+    for db_engine in {engine, *shard_engines}:
+        db_engine.dispose(close=False)
+    start, end = month_range(month)
+    db = SessionLocal()
+    db.info["shard"] = shard
+    try:
+        categories = common_expense_categories(db)
+        # Devise des utilisateurs lue à part : avec des shards, elle n'est pas dans la base des transactions
+        profiles_query = db.query(models.User.id, models.User.currency, models.User.currency_exponent)
+        query = db.query(
+            models.Transaction.user_id,
+            models.Transaction.type,
+            models.Transaction.category_id,
+            func.sum(models.Transaction.amount_minor),
+        ).filter(
+            models.Transaction.date >= start,
+            models.Transaction.date < end,
+        )
+        if workers > 1:
+            profiles_query = profiles_query.filter(models.User.id % workers == index)
+            query = query.filter(models.Transaction.user_id % workers == index)
+        profiles = {user_id: (currency, exponent) for user_id, currency, exponent in profiles_query}
+        query = query.group_by(
+            models.Transaction.user_id, models.Transaction.type, models.Transaction.category_id,
+        ).order_by(models.Transaction.user_id)
+
+        sketches: Dict[Tuple[str, int], TDigest] = {}
+
+        def add_user(user_id: int, rows: list) -> None:
+            revenue, shares = user_shares(rows, categories)
+            if shares is None or user_id not in profiles:
+                return
+            currency, exponent = profiles[user_id]
+            for cohort in cohorts_of(currency, revenue_band(revenue, exponent)):
+                for category_id, share in shares.items():
+                    sketch = sketches.get((cohort, category_id))
+                    if sketch is None:
+                        sketch = sketches[(cohort, category_id)] = TDigest(settings.peers_compression)
+                    sketch.add(share)
+
+        # Lignes triées par utilisateur : une seule série en mémoire à la fois
+        current, rows = None, []
+        result = db.execute(query.statement)
+        for chunk in result.partitions(FETCH_BATCH_SIZE):
+            for user_id, kind, category_id, total in chunk:
+                if user_id != current:
+                    if rows:
+                        add_user(current, rows)
+                    current, rows = user_id, []
+                rows.append((kind, category_id, int(total)))
+        if rows:
+            add_user(current, rows)
+        return {key: sketch.to_bytes() for key, sketch in sketches.items()}
+    finally:
+        db.close()
+
+
+def compute_peer_benchmarks(db: Session, month: str, workers: int = 1) -> Dict[str, int]:
+    """Recalcule et enregistre les t-digests d'un mois (YYYY-MM), en parallèle sur `workers` processus"""
+    shards = shard_router.shards()
+    if workers > 1:
+        # Une tâche par (shard, tranche d'utilisateurs)
+        tasks = [(shard, index) for shard in shards for index in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(
+                partial_sketches,
+                [month] * len(tasks), [workers] * len(tasks), [index for _, index in tasks], [shard for shard, _ in tasks],
+            ))
+    else:
+        partials = [partial_sketches(month, shard=shard) for shard in shards]
+
+    merged: Dict[Tuple[str, int], TDigest] = {}
+    for partial in partials:
+        for key, data in partial.items():
+            sketch = TDigest.from_bytes(data)
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = sketch
+
+    rows = [
+        {
+            "month": month,
+            "cohort": cohort,
+            "category_id": category_id,
+            "count": int(sketch.count),
+            "sketch": sketch.to_bytes(),
+        }
+        for (cohort, category_id), sketch in merged.items()
+    ]
+    db.query(models.PeerSketch).filter(models.PeerSketch.month == month).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(models.PeerSketch), rows)
+    db.commit()
+    users = max((row["count"] for row in rows if row["cohort"] == GLOBAL_COHORT), default=0)
+    return {"users": users, "sketches": len(rows)}
+
+
+def latest_month(db: Session) -> Optional[str]:
+    return db.query(func.max(models.PeerSketch.month)).scalar()
+
+
+def peer_comparison(db: Session, user: models.User, month: Optional[str] = None) -> Dict[str, Any]:
+    """Parts de dépenses de l'utilisateur comparées à celles de sa cohorte pour un mois calculé"""
+    month = month or latest_month(db)
+    if month is None:
+        return {"month": None, "categories": []}
+    start, end = month_range(month)
+    rows = db.query(
+        models.Transaction.type, models.Transaction.category_id, func.sum(models.Transaction.amount_minor)
+    ).filter(
+        models.Transaction.user_id == user.id,
+        models.Transaction.date >= start,
+        models.Transaction.date < end,
+    ).group_by(models.Transaction.type, models.Transaction.category_id).all()
+    categories = common_expense_categories(db)
+    revenue, shares = user_shares([(kind, category_id, int(total)) for kind, category_id, total in rows], categories)
+    cohorts = cohorts_of(user.currency, revenue_band(revenue, user.currency_exponent))
+
+    sketches = {
+        (sketch.cohort, sketch.category_id): sketch
+        for sketch in db.query(models.PeerSketch).filter(
+            models.PeerSketch.month == month,
+            models.PeerSketch.cohort.in_(cohorts),
+            models.PeerSketch.count >= settings.peers_min_users,
+        )
+    }
+    comparisons = []
+    for category_id in categories:
+        stored = next((sketches[(c, category_id)] for c in cohorts if (c, category_id) in sketches), None)
+        if stored is None:
+            continue
+        digest = TDigest.from_bytes(stored.sketch)
+        share = shares.get(category_id) if shares is not None else None
+        comparisons.append({
+            "category": category_map.name(category_id),
+            "cohort": stored.cohort,
+            "peers": stored.count,
+            "peer_p25": round(digest.quantile(0.25), 1),
+            "peer_median": round(digest.quantile(0.5), 1),
+            "peer_p75": round(digest.quantile(0.75), 1),
+            "your_share": round(share, 1) if share is not None else None,
+            # Part des utilisateurs de la cohorte qui consacrent autant ou moins à cette catégorie (en %)
+            "percentile": round(100 * digest.cdf(share)) if share is not None else None,
+        })
+    comparisons.sort(key=lambda item: item["peer_median"], reverse=True)
+    return {"month": month, "cohort": cohorts[0], "categories": comparisons}
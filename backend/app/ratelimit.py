@@ -0,0 +1,164 @@
+"""
+Limitation de débit par seau à jetons (token bucket).
+
+Chaque règle de settings.rate_limits ("MÉTHODE chemin" ou "MÉTHODE *")
+fixe une capacité et une période : "10/60" autorise 10 requêtes en rafale,
+puis une nouvelle toutes les 6 secondes. Le seau est propre à l'utilisateur
+quand la requête porte un jeton JWT valide, à l'adresse IP du client sinon
+(connexion, inscription). Derrière un proxy, l'adresse IP est celle fournie
+par uvicorn (--forwarded-allow-ips).
+
+Au-delà de la limite, la requête reçoit une réponse 429 avec l'en-tête
+Retry-After, sans atteindre la route ni la base de données.
+
+Backends (settings.rate_limit_backend) :
+- "memory" : seaux du processus (dictionnaire LRU borné)
+- "redis" : seaux partagés entre les workers (script Lua atomique)
+- "none" : limitation désactivée
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_limit(value: str) -> Tuple[int, float]:
+    """"capacité/période" -> (capacité, jetons par seconde)"""
+    capacity, period = value.split("/")
+    return int(capacity), int(capacity) / float(period)
+
+
+class MemoryBucketBackend:
+    """Seaux en mémoire, évincés selon l'ordre LRU au-delà de max_keys"""
+
+    def __init__(self, max_keys: int = 100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        """Consomme un jeton ; retourne 0 si la requête passe, sinon l'attente en secondes"""
+        now = self.clock()
+        tokens, updated_at = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # Le seau le moins récemment utilisé est (presque toujours) plein : l'oublier est sans effet
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketBackend:
+    """Seaux partagés dans Redis (un hash par seau, mis à jour par un script Lua)"""
+
+    _TAKE_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+        self._take = self.client.register_script(self._TAKE_SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        return float(await self._take(keys=[f"rl:{key}"], args=[capacity, rate]))
+
+
+def create_bucket_backend(name: str):
+    if name == "none":
+        return None
+    if name == "redis":
+        try:
+            return RedisBucketBackend(settings.redis_url)
+        except Exception as e:
+            logger.warning("Redis indisponible (%s), limitation de débit en mémoire", e)
+    return MemoryBucketBackend(settings.rate_limit_max_keys)
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI appliquant settings.rate_limits avant le routage"""
+
+    def __init__(self, app, backend=None, limits: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.backend = backend
+        self.limits = {rule: parse_limit(value) for rule, value in (limits or {}).items()}
+
+    def _rule(self, method: str, path: str) -> Optional[Tuple[str, int, float]]:
+        for rule in (f"{method} {path}", f"{method} *"):
+            limit = self.limits.get(rule)
+            if limit is not None:
+                return (rule,) + limit
+        return None
+
+    @staticmethod
+    def _client_key(scope) -> str:
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization" and value[:7].lower() == b"bearer ":
+                try:
+                    payload = jwt.decode(value[7:].decode("latin-1"), settings.secret_key, algorithms=[settings.algorithm])
+                except JWTError:
+                    break
+                if payload.get("sub"):
+                    return f"user:{payload['sub']}"
+                break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'inconnu'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.backend is None:
+            await self.app(scope, receive, send)
+            return
+        rule = self._rule(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        name, capacity, rate = rule
+        try:
+            wait = await self.backend.take(f"{name}|{self._client_key(scope)}", capacity, rate)
+        except Exception:
+            # Backend partagé indisponible : laisser passer plutôt que tout bloquer
+            logger.exception("Limitation de débit indisponible")
+            wait = 0.0
+
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait))
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Trop de requêtes, réessayez dans {retry_after} s"},
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+# Seaux du worker, partagés par le middleware et les sous-requêtes de POST /batch
+bucket_backend = create_bucket_backend(settings.rate_limit_backend)
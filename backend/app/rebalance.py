@@ -0,0 +1,193 @@
+"""
+Déplacement des données d'un utilisateur d'un shard à l'autre, service en marche.
+
+1. l'annuaire marque l'utilisateur « en déplacement » : ses écritures reçoivent
+   503 + Retry-After, ses lectures continuent sur l'ancien shard ;
+2. après settings.shard_move_grace_seconds (requêtes déjà commencées), ses lignes
+   sont copiées sur le nouveau shard en une transaction ; si l'ancien shard a
+   changé pendant la copie, la copie est annulée et recommencée ;
+3. l'annuaire désigne le nouveau shard : l'utilisateur peut de nouveau écrire ;
+4. après un second délai (lectures en cours, lots de la file d'ingestion dont le
+   shard a été résolu avant la bascule), les lignes arrivées entre-temps sur
+   l'ancien shard sont copiées à leur tour, puis l'ancien shard est purgé.
+
+Les lignes copiées reçoivent des identifiants supérieurs à tous ceux des deux
+shards : pas de collision avec les lignes du nouveau shard ni avec celles déjà
+archivées pour l'utilisateur. La plage est réservée avant l'insertion, table du
+nouveau shard verrouillée en écriture jusqu'au commit de la copie (SQLite :
+BEGIN IMMEDIATE ; PostgreSQL : LOCK TABLE, séquence avancée au-delà de la plage) :
+les autres utilisateurs du shard attendent la copie au lieu d'entrer en collision
+avec elle. Les identifiants vus par les clients changent ;
+les instantanés colonnaires et le classifieur de l'utilisateur sont invalidés
+(dans tous les workers avec CACHE_BACKEND=redis).
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import models
+from .cache import analytics_cache
+from .classifier import classifier_tag
+from .columnar import snapshot_tag
+from .config import settings
+from .database import Base, SessionLocal, shard_engines, shard_router
+
+# Tables déplacées avec l'utilisateur (les points de reprise d'ingestion restent sur leur shard)
+USER_TABLES = ("transactions", "budgets", "budget_spend", "goals", "spending_anomalies")
+
+
+def _tables() -> list:
+    return [Base.metadata.tables[name] for name in USER_TABLES]
+
+
+def _fingerprint(engine: Engine, user_id: int) -> Dict[str, Tuple[int, int]]:
+    """(nombre de lignes, plus grand id) de l'utilisateur par table"""
+    with engine.connect() as connection:
+        return {
+            table.name: tuple(connection.execute(
+                select(func.count(), func.coalesce(func.max(table.c.id), 0)).where(table.c.user_id == user_id)
+            ).one())
+            for table in _tables()
+        }
+
+
+def _max_id(connection: Connection, table) -> int:
+    return connection.execute(select(func.max(table.c.id))).scalar() or 0
+
+
+def _reserve_ids(dst: Connection, table, floor: int, count: int) -> int:
+    """Réserve count identifiants au-delà de floor sur le shard cible ; retourne le dernier id avant la plage.
+
+    La table reste verrouillée en écriture jusqu'au commit de dst : aucune
+    insertion concurrente ne peut prendre un id de la plage.
+    """
+    if dst.dialect.name != "postgresql":
+        # SQLite : verrou d'écriture pris par BEGIN IMMEDIATE à l'ouverture de la copie
+        return max(floor, _max_id(dst, table))
+    dst.execute(text(f"LOCK TABLE {table.name} IN EXCLUSIVE MODE"))
+    sequence = f"pg_get_serial_sequence('{table.name}', 'id')"
+    issued = dst.execute(text(f"SELECT pg_sequence_last_value({sequence}::regclass)")).scalar() or 0
+    base = max(floor, _max_id(dst, table), issued)
+    # Les prochains nextval() des autres utilisateurs partent après la plage
+    dst.execute(text(f"SELECT setval({sequence}, {base + count})"))
+    return base
+
+
+def _copy(source: Engine, target: Engine, user_id: int, after: Dict[str, int]) -> Dict[str, Tuple[int, int]]:
+    """Copie les lignes de l'utilisateur d'id > after[table] ; {table: (lignes copiées, dernier id source)}"""
+    copied = {}
+    with source.connect() as src, target.connect() as dst:
+        if dst.dialect.name == "sqlite":
+            dst.exec_driver_sql("BEGIN IMMEDIATE")
+        for table in _tables():
+            start = after.get(table.name, 0)
+            rows = [dict(row._mapping) for row in src.execute(
+                select(table).where(table.c.user_id == user_id, table.c.id > start).order_by(table.c.id)
+            )]
+            if rows:
+                last = rows[-1]["id"]
+                base = _reserve_ids(dst, table, _max_id(src, table), len(rows))
+                for offset, row in enumerate(rows, 1):
+                    row["id"] = base + offset
+                dst.execute(insert(table), rows)
+            else:
+                last = start
+            copied[table.name] = (len(rows), last)
+        dst.commit()
+    return copied
+
+
+def _purge(engine: Engine, user_id: int) -> None:
+    with engine.begin() as connection:
+        for table in _tables():
+            connection.execute(delete(table).where(table.c.user_id == user_id))
+
+
+def _set_directory(user_id: int, shard: int, moving: bool, pinned: Optional[bool] = None) -> None:
+    db = SessionLocal()
+    try:
+        entry = db.get(models.UserShard, user_id) or models.UserShard(user_id=user_id, pinned=False)
+        entry.shard = shard
+        entry.moving = moving
+        if pinned is not None:
+            entry.pinned = pinned
+        db.add(entry)
+        db.commit()
+    finally:
+        db.close()
+
+
+def move_user(user_id: int, target: int, pinned: Optional[bool] = None, attempts: int = 3) -> Dict[str, int]:
+    """Déplace les données d'un utilisateur vers le shard target ; pinned l'exclut du rééquilibrage"""
+    if not shard_router.enabled:
+        raise ValueError("Aucun shard configuré (SHARD_URLS)")
+    if not 0 <= target < len(shard_engines):
+        raise ValueError(f"Shard inconnu: {target}")
+    db = SessionLocal()
+    try:
+        source, _ = shard_router.lookup(db, [user_id])[user_id]
+    finally:
+        db.close()
+    if source == target or shard_engines[source] is shard_engines[target]:
+        _set_directory(user_id, target, moving=False, pinned=pinned)
+        return {"moved": 0, "late": 0}
+
+    grace = settings.shard_move_grace_seconds
+    _set_directory(user_id, source, moving=True)
+    try:
+        # Restes d'un déplacement interrompu : l'ancien shard fait foi
+        _purge(shard_engines[target], user_id)
+        time.sleep(grace)
+        for _ in range(attempts):
+            before = _fingerprint(shard_engines[source], user_id)
+            copied = _copy(shard_engines[source], shard_engines[target], user_id, {})
+            if _fingerprint(shard_engines[source], user_id) == before:
+                break
+            _purge(shard_engines[target], user_id)
+        else:
+            raise RuntimeError(f"Utilisateur {user_id} : données modifiées pendant chaque copie, déplacement abandonné")
+    except BaseException:
+        _purge(shard_engines[target], user_id)
+        _set_directory(user_id, source, moving=False)
+        raise
+    _set_directory(user_id, target, moving=False, pinned=pinned)
+
+    time.sleep(grace)
+    late = _copy(shard_engines[source], shard_engines[target], user_id, {name: last for name, (_, last) in copied.items()})
+    _purge(shard_engines[source], user_id)
+    # Instantanés et modèles du classifieur gardent les anciens identifiants
+    analytics_cache.invalidate([snapshot_tag(user_id), classifier_tag(user_id)])
+    return {"moved": sum(count for count, _ in copied.values()), "late": sum(count for count, _ in late.values())}
+
+
+def rebalance_plan() -> List[Tuple[int, int, int]]:
+    """(user_id, shard actuel, shard cible) des utilisateurs non épinglés hors de leur shard cible.
+
+    Les utilisateurs absents de l'annuaire (créés avant l'activation des shards)
+    y sont d'abord inscrits sur le shard 0, où se trouvent leurs données.
+    """
+    if not shard_router.enabled:
+        raise ValueError("Aucun shard configuré (SHARD_URLS)")
+    db = SessionLocal()
+    try:
+        placed = {
+            user_id: (shard, pinned)
+            for user_id, shard, pinned in db.query(models.UserShard.user_id, models.UserShard.shard, models.UserShard.pinned)
+        }
+        user_ids = [user_id for (user_id,) in db.query(models.User.id).order_by(models.User.id)]
+        unplaced = [user_id for user_id in user_ids if user_id not in placed]
+        if unplaced:
+            db.add_all(models.UserShard(user_id=user_id, shard=0, pinned=False, moving=False) for user_id in unplaced)
+            db.commit()
+    finally:
+        db.close()
+    plan = []
+    for user_id in user_ids:
+        shard, pinned = placed.get(user_id, (0, False))
+        target = shard_router.target(user_id)
+        if not pinned and shard != target:
+            plan.append((user_id, shard, target))
+    return plan
@@ -1,155 +1,231 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
-
-# Schémas pour les utilisateurs
-class UserBase(BaseModel):
-    email: EmailStr
-    username: str
-    full_name: Optional[str] = None
-
-class UserCreate(UserBase):
-    password: str
-
-class UserUpdate(BaseModel):
-    email: Optional[EmailStr] = None
-    username: Optional[str] = None
-    full_name: Optional[str] = None
-
-class User(UserBase):
-    id: int
-    is_active: bool
-    created_at: datetime
-    
-    class Config:
-        from_attributes = True
-
-# Schémas pour les transactions
-class TransactionBase(BaseModel):
-    amount: float
-    type: str  # 'revenu' ou 'depense'
-    category: str
-    description: Optional[str] = None
-    payment_method: Optional[str] = None
-    date: datetime
-
-class TransactionCreate(TransactionBase):
-    pass
-
-class TransactionUpdate(BaseModel):
-    amount: Optional[float] = None
-    type: Optional[str] = None
-    category: Optional[str] = None
-    description: Optional[str] = None
-    payment_method: Optional[str] = None
-    date: Optional[datetime] = None
-
-class Transaction(TransactionBase):
-    id: int
-    user_id: int
-    created_at: datetime
-    updated_at: Optional[datetime] = None
-    
-    class Config:
-        from_attributes = True
-
-# Schémas pour les budgets
-class BudgetBase(BaseModel):
-    category: str
-    amount: float
-    month: str  # Format: "YYYY-MM"
-
-class BudgetCreate(BudgetBase):
-    pass
-
-class BudgetUpdate(BaseModel):
-    amount: Optional[float] = None
-    month: Optional[str] = None
-
-class Budget(BudgetBase):
-    id: int
-    user_id: int
-    created_at: datetime
-    updated_at: Optional[datetime] = None
-    
-    class Config:
-        from_attributes = True
-
-# Schémas pour les objectifs
-class GoalBase(BaseModel):
-    name: str
-    target_amount: float
-    current_amount: Optional[float] = 0
-    deadline: Optional[datetime] = None
-    description: Optional[str] = None
-
-class GoalCreate(GoalBase):
-    pass
-
-class GoalUpdate(BaseModel):
-    name: Optional[str] = None
-    target_amount: Optional[float] = None
-    current_amount: Optional[float] = None
-    deadline: Optional[datetime] = None
-    description: Optional[str] = None
-    is_active: Optional[bool] = None
-
-class Goal(GoalBase):
-    id: int
-    user_id: int
-    is_active: bool
-    created_at: datetime
-    updated_at: Optional[datetime] = None
-    
-    class Config:
-        from_attributes = True
-
-# Schémas pour les catégories
-class CategoryBase(BaseModel):
-    name: str
-    icon: Optional[str] = None
-    color: Optional[str] = None
-    type: str  # 'revenu' ou 'depense'
-
-class CategoryCreate(CategoryBase):
-    pass
-
-class Category(CategoryBase):
-    id: int
-    is_default: bool
-    created_at: datetime
-    
-    class Config:
-        from_attributes = True
-
-# Schémas pour l'authentification
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
-
-# Schémas pour les analyses
-class AnalyticsSummary(BaseModel):
-    total_revenues: float
-    total_expenses: float
-    balance: float
-    monthly_average_revenues: float
-    monthly_average_expenses: float
-    top_categories: List[dict]
-    monthly_trend: List[dict]
-
-class BudgetAlert(BaseModel):
-    category: str
-    budget_amount: float
-    spent_amount: float
-    percentage: float
-    status: str  # 'ok', 'warning', 'exceeded'
-
-# Schémas pour les réponses API
-class Message(BaseModel):
-    message: str
-
-class ErrorResponse(BaseModel):
+from pydantic import BaseModel, EmailStr, Field
+from typing import Annotated, Any, Optional, List
+from datetime import datetime
+from .money import MAX_AMOUNT
+
+# Montant reçu par l'API : borné (422 au-delà) et fini ; la précision selon la devise est vérifiée à l'écriture
+Amount = Annotated[float, Field(ge=-MAX_AMOUNT, le=MAX_AMOUNT, allow_inf_nan=False)]
+
+# Schémas pour les utilisateurs
+class UserBase(BaseModel):
+    email: EmailStr
+    username: str
+    full_name: Optional[str] = None
+
+class UserCreate(UserBase):
+    password: str
+    currency: str = "XOF"  # devise des montants (code ISO 4217)
+
+class UserUpdate(BaseModel):
+    email: Optional[EmailStr] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+
+class User(UserBase):
+    id: int
+    currency: str
+    is_active: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour les transactions
+class TransactionBase(BaseModel):
+    amount: Amount
+    type: str  # 'revenu' ou 'depense'
+    category: str
+    description: Optional[str] = None
+    payment_method: Optional[str] = None
+    date: datetime
+
+class TransactionCreate(TransactionBase):
+    pass
+
+class TransactionUpdate(BaseModel):
+    amount: Optional[Amount] = None
+    type: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    payment_method: Optional[str] = None
+    date: Optional[datetime] = None
+
+class Transaction(TransactionBase):
+    id: int
+    user_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour l'ingestion des flux de transactions
+class IngestRequest(BaseModel):
+    transactions: List[TransactionCreate]
+
+class IngestResult(BaseModel):
+    accepted: int  # transactions écrites dans le spool, insérées en base peu après
+
+# Schémas pour la catégorisation automatique
+class CategorizeItem(BaseModel):
+    amount: Amount
+    type: str  # 'revenu' ou 'depense'
+    description: Optional[str] = None
+    payment_method: Optional[str] = None
+
+class CategorizeRequest(BaseModel):
+    transactions: List[CategorizeItem]
+
+class CategoryPrediction(BaseModel):
+    category: Optional[str] = None  # None si aucune transaction n'a encore été apprise
+    confidence: float
+
+# Schémas pour les budgets
+class BudgetBase(BaseModel):
+    category: str
+    amount: Amount
+    month: str  # Format: "YYYY-MM"
+
+class BudgetCreate(BudgetBase):
+    pass
+
+class BudgetUpdate(BaseModel):
+    amount: Optional[Amount] = None
+    month: Optional[str] = None
+
+class Budget(BudgetBase):
+    id: int
+    user_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour les objectifs
+class GoalBase(BaseModel):
+    name: str
+    target_amount: Amount
+    current_amount: Optional[Amount] = 0
+    deadline: Optional[datetime] = None
+    description: Optional[str] = None
+
+class GoalCreate(GoalBase):
+    pass
+
+class GoalUpdate(BaseModel):
+    name: Optional[str] = None
+    target_amount: Optional[Amount] = None
+    current_amount: Optional[Amount] = None
+    deadline: Optional[datetime] = None
+    description: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class Goal(GoalBase):
+    id: int
+    user_id: int
+    is_active: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour les catégories
+class CategoryBase(BaseModel):
+    name: str
+    icon: Optional[str] = None
+    color: Optional[str] = None
+    type: str  # 'revenu' ou 'depense'
+
+class CategoryCreate(CategoryBase):
+    pass
+
+class Category(CategoryBase):
+    id: int
+    is_default: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour l'authentification
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+
+class TokenData(BaseModel):
+    username: Optional[str] = None
+
+class StreamTicket(BaseModel):
+    ticket: str  # à passer en paramètre ?ticket= du flux SSE
+    expires_in: int  # secondes
+
+# Schémas pour les analyses
+class AnalyticsSummary(BaseModel):
+    total_revenues: float
+    total_expenses: float
+    balance: float
+    monthly_average_revenues: float
+    monthly_average_expenses: float
+    top_categories: List[dict]
+    monthly_trend: List[dict]
+
+class BudgetAlert(BaseModel):
+    category: str
+    budget_amount: float
+    spent_amount: float
+    percentage: float
+    status: str  # 'ok', 'warning', 'exceeded'
+
+class SpendingAnomaly(BaseModel):
+    category: str
+    month: str
+    amount: float
+    baseline: float  # médiane des mois précédents
+    score: float
+    detected_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# Schémas pour les comparaisons entre utilisateurs (GET /analytics/peers)
+class PeerCategory(BaseModel):
+    category: str
+    cohort: str  # cohorte retenue, la plus précise assez nombreuse
+    peers: int
+    peer_p25: float  # parts de dépenses (%) de la cohorte
+    peer_median: float
+    peer_p75: float
+    your_share: Optional[float] = None  # part de vos dépenses (%)
+    percentile: Optional[int] = None  # part de la cohorte qui y consacre autant ou moins que vous (%)
+
+class PeerBenchmarks(BaseModel):
+    month: Optional[str] = None
+    cohort: Optional[str] = None
+    categories: List[PeerCategory]
+
+# Schémas pour les requêtes groupées (POST /batch)
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None  # identifiant libre, renvoyé dans la réponse
+    method: str = "GET"
+    path: str  # ex. "/budgets/alerts?month=2024-05"
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+
+class BatchSubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Any = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchSubResponse]
+
+# Schémas pour les réponses API
+class Message(BaseModel):
+    message: str
+
+class ErrorResponse(BaseModel):
     detail: str 
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Résumé de quantiles fusionnable (t-digest) pour les comparaisons entre utilisateurs.
+
+Un t-digest résume une distribution par des centroïdes (moyenne, poids) :
+serrés aux extrémités, plus larges autour de la médiane, leur nombre est borné
+par la compression quelle que soit la quantité de valeurs ajoutées. Deux
+t-digests se fusionnent en concaténant leurs centroïdes puis en recompressant,
+ce qui permet de calculer des résumés partiels dans plusieurs processus.
+
+La compression est vectorisée : chaque centroïde trié reçoit l'indice
+floor(k(q)) de la fonction d'échelle k1 (arcsinus) évaluée en son quantile,
+et les centroïdes de même indice sont fusionnés.
+"""
+
+import math
+from typing import Iterable
+
+import numpy as np
+
+
+class TDigest:
+    """t-digest (fonction d'échelle k1), sérialisable en octets"""
+
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: list = []
+
+    @property
+    def count(self) -> float:
+        self._flush()
+        return float(self.weights.sum())
+
+    def add(self, value: float) -> None:
+        self._buffer.append(value)
+        if len(self._buffer) >= 20 * self.compression:
+            self._flush()
+
+    def add_many(self, values: Iterable[float]) -> None:
+        self._buffer.extend(values)
+        if len(self._buffer) >= 20 * self.compression:
+            self._flush()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Ajoute les centroïdes d'un autre t-digest (résumé partiel d'un autre processus)"""
+        other._flush()
+        self._flush()
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        values = np.asarray(self._buffer, dtype=np.float64)
+        self._buffer = []
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        if len(means) == 0:
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        groups = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def _positions(self) -> np.ndarray:
+        # Quantile du centre de chaque centroïde, bornes min et max aux extrémités
+        return np.r_[0.0, (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum(), 1.0]
+
+    def quantile(self, q: float) -> float:
+        self._flush()
+        if not len(self.means):
+            return math.nan
+        return float(np.interp(q, self._positions(), np.r_[self.min, self.means, self.max]))
+
+    def cdf(self, value: float) -> float:
+        """Part des valeurs inférieures ou égales à value"""
+        self._flush()
+        if not len(self.means):
+            return math.nan
+        if value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+        return float(np.interp(value, np.r_[self.min, self.means, self.max], self._positions()))
+
+    def to_bytes(self) -> bytes:
+        self._flush()
+        header = np.array([self.compression, self.min, self.max, len(self.means)], dtype=np.float64)
+        return np.concatenate([header, self.means, self.weights]).astype(np.float64).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        values = np.frombuffer(data, dtype=np.float64)
+        digest = cls(compression=float(values[0]))
+        digest.min, digest.max = float(values[1]), float(values[2])
+        size = int(values[3])
+        digest.means = values[4:4 + size].copy()
+        digest.weights = values[4 + size:4 + 2 * size].copy()
+        return digest
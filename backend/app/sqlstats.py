@@ -0,0 +1,130 @@
+"""
+Comptage et chronométrage des requêtes SQL (événements des moteurs SQLAlchemy).
+
+    with count_statements() as stats:
+        crud.get_budget_alerts(db, user_id, "2024-05")
+    stats.count, stats.seconds, stats.statements  # [(sql, durée), ...]
+
+Les compteurs suivent le contexte (contextvars) : une requête HTTP ne compte
+que ses propres requêtes SQL, y compris celles de ses dépendances exécutées
+dans le pool de threads, sur tous les moteurs (primaire, réplica, shards).
+
+Chaque route de app/api/ déclare avec @statement_budget(n) le nombre de
+requêtes SQL qu'elle exécute, cache des analyses désactivé, sur le jeu de
+données de check_query_budgets.py ; son budget est n + BUDGET_HEADROOM. Avec
+SQL_STATS=true, SQLStatsMiddleware mesure chaque requête (en-tête
+Server-Timing) et signale les dépassements.
+
+Dans les tests : fixture `sql_statements` (tests/conftest.py).
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Marge des budgets au-delà des requêtes mesurées : deux requêtes absorbent un chargement
+# paresseux ou la lecture de l'annuaire des shards (get_current_user, absente du jeu de
+# référence) sans faire échouer un déploiement ; une boucle N+1 en ajoute au moins trois sur
+# le jeu de référence (3 objectifs, 5 budgets, 20 transactions par mois), et reste repérée.
+BUDGET_HEADROOM = 2
+
+
+class StatementStats:
+    """Requêtes SQL exécutées pendant une mesure"""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, float]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def seconds(self) -> float:
+        return sum(duration for _, duration in self.statements)
+
+    def report(self) -> str:
+        lines = [f"{self.count} requêtes SQL en {self.seconds * 1000:.1f} ms"]
+        lines += [f"  {duration * 1000:7.2f} ms  {' '.join(sql.split())}" for sql, duration in self.statements]
+        return "\n".join(lines)
+
+
+# Mesures en cours dans le contexte courant (imbriquées : chacune compte tout)
+_active: ContextVar[Tuple[StatementStats, ...]] = ContextVar("sql_statement_stats", default=())
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get() and context is not None:
+        context.sqlstats_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    active = _active.get()
+    started = getattr(context, "sqlstats_started", None)
+    if not active or started is None:
+        return
+    duration = time.perf_counter() - started
+    for stats in active:
+        stats.statements.append((statement, duration))
+
+
+@contextmanager
+def count_statements() -> Iterator[StatementStats]:
+    """Compte les requêtes SQL exécutées dans le bloc"""
+    stats = StatementStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+
+def statement_budget(expected: int) -> Callable:
+    """Déclare les requêtes SQL mesurées d'une route (à placer sous @router.xxx) ; budget : + BUDGET_HEADROOM"""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.statement_budget = expected + BUDGET_HEADROOM
+        return endpoint
+    return decorator
+
+
+def budget_of(endpoint: Optional[Callable]) -> Optional[int]:
+    return getattr(endpoint, "statement_budget", None)
+
+
+class SQLStatsMiddleware:
+    """Middleware ASGI : requêtes SQL de chaque requête HTTP, dépassements de budget journalisés"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_statements() as stats:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} SQL"'
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        # Le routeur a renseigné scope["endpoint"] en trouvant la route
+        limit = budget_of(scope.get("endpoint"))
+        if limit is not None and stats.count > limit:
+            logger.warning(
+                "%s %s : %d requêtes SQL pour un budget de %d\n%s",
+                scope["method"], scope["path"], stats.count, limit, stats.report(),
+            )
+
@@ -0,0 +1,305 @@
+"""
+Relevés mensuels (GET /statements/{YYYY-MM}) : totaux, dépenses par catégorie,
+respect des budgets et transactions du mois.
+
+Les objectifs n'y figurent pas : seul leur montant actuel est connu, sans
+historique, et leur progression à la fin d'un mois passé ne peut pas être
+reconstituée (elle serait figée à la date du calcul du relevé).
+
+Un mois terminé ne change plus, sauf transaction ou budget saisi après coup :
+chaque relevé est donc calculé une fois, hors des threads de l'API, par un
+pool de processus, puis enregistré sur disque en JSON, CSV et HTML
+(`{statements_dir}/{user_id}/{YYYY-MM}.{format}`), servi tel quel ensuite.
+
+Invalidation : une écriture dont la date (ou le mois du budget) tombe dans un
+mois terminé supprime les relevés de ce mois et date le marqueur
+`{YYYY-MM}.stale`. Un calcul commencé avant ce marqueur jette son résultat :
+un relevé enregistré reflète toujours toutes les écritures validées avant lui.
+Le relevé est recalculé à la demande suivante (ou par generate_statements.py).
+"""
+
+import csv
+import html
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_FORMATS = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "html": "text/html",
+}
+MONTH_PATTERN = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+
+def is_closed(month: str, now: Optional[datetime] = None) -> bool:
+    """Vrai si le mois (YYYY-MM) est terminé"""
+    return month < (now or datetime.now()).strftime("%Y-%m")
+
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(settings.statements_dir, str(user_id))
+
+
+def statement_path(user_id: int, month: str, fmt: str) -> str:
+    return os.path.join(_user_dir(user_id), f"{month}.{fmt}")
+
+
+def _stale_path(user_id: int, month: str) -> str:
+    return os.path.join(_user_dir(user_id), f"{month}.stale")
+
+
+def _remove(paths: Iterable[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def invalidate(user_id: int, months: Iterable[str]) -> None:
+    """Supprime les relevés des mois terminés touchés par une écriture (appelé après le commit)"""
+    for month in set(months):
+        if not is_closed(month):
+            continue
+        stale = _stale_path(user_id, month)
+        os.makedirs(_user_dir(user_id), exist_ok=True)
+        # Marqueur d'abord : un calcul en cours voit qu'il est dépassé
+        with open(stale, "w"):
+            pass
+        now = time.time_ns()
+        os.utime(stale, ns=(now, now))
+        _remove(statement_path(user_id, month, fmt) for fmt in STATEMENT_FORMATS)
+
+
+def read_statement(user_id: int, month: str, fmt: str) -> Optional[Tuple[bytes, str]]:
+    """(contenu, ETag) du relevé enregistré, None s'il reste à calculer"""
+    try:
+        with open(statement_path(user_id, month, fmt), "rb") as f:
+            stat = os.fstat(f.fileno())
+            return f.read(), f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    except FileNotFoundError:
+        return None
+
+
+def build_statement(db, user_id: int, month: str) -> Dict[str, Any]:
+    """Contenu du relevé d'un mois (montants en unités de la devise de l'utilisateur)"""
+    from . import crud, models
+    from .money import from_minor
+
+    user = db.get(models.User, user_id)
+    exponent = user.currency_exponent
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+
+    transactions = crud.get_user_transactions(
+        db, user_id, limit=2 ** 62, start_date=start, end_date=end - timedelta(microseconds=1)
+    )
+    totals = {"revenu": 0, "depense": 0}
+    by_category: Dict[Tuple[str, str], int] = {}
+    for transaction in transactions:
+        totals[transaction.type] = totals.get(transaction.type, 0) + transaction.amount_minor
+        key = (transaction.category, transaction.type)
+        by_category[key] = by_category.get(key, 0) + transaction.amount_minor
+
+    categories = [
+        {
+            "category": category,
+            "type": kind,
+            "amount": from_minor(amount, exponent),
+            "share": round(amount / totals[kind] * 100, 1) if totals[kind] else 0.0,
+        }
+        for (category, kind), amount in sorted(by_category.items(), key=lambda item: (item[0][1], -item[1]))
+    ]
+    return {
+        "month": month,
+        "currency": user.currency,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "totals": {
+            "income": from_minor(totals["revenu"], exponent),
+            "expenses": from_minor(totals["depense"], exponent),
+            "balance": from_minor(totals["revenu"] - totals["depense"], exponent),
+            "transactions": len(transactions),
+        },
+        "categories": categories,
+        "budgets": crud._compute_budget_alerts(db, user_id, month),
+        "transactions": [
+            {
+                "date": transaction.date.strftime("%Y-%m-%d"),
+                "description": transaction.description or "",
+                "category": transaction.category,
+                "type": transaction.type,
+                "payment_method": transaction.payment_method or "",
+                "amount": from_minor(transaction.amount_minor, exponent),
+            }
+            for transaction in sorted(transactions, key=lambda t: (t.date, t.id))
+        ],
+    }
+
+
+def render_csv(statement: Dict[str, Any]) -> str:
+    """Une ligne par élément du relevé ; la colonne section indique sa nature"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["section", "date", "libelle", "categorie", "type", "montant", "reference", "pourcentage", "statut"])
+    totals = statement["totals"]
+    writer.writerow(["total", "", "Revenus", "", "revenu", totals["income"], "", "", ""])
+    writer.writerow(["total", "", "Dépenses", "", "depense", totals["expenses"], "", "", ""])
+    writer.writerow(["total", "", "Solde", "", "", totals["balance"], "", "", ""])
+    for row in statement["categories"]:
+        writer.writerow(["categorie", "", "", row["category"], row["type"], row["amount"], "", row["share"], ""])
+    for row in statement["budgets"]:
+        writer.writerow(["budget", "", "", row["category"], "depense", row["spent_amount"], row["budget_amount"],
+                         round(row["percentage"], 1), row["status"]])
+    for row in statement["transactions"]:
+        writer.writerow(["transaction", row["date"], row["description"], row["category"], row["type"],
+                         row["amount"], row["payment_method"], "", ""])
+    return output.getvalue()
+
+
+def _table(headers: List[str], rows: List[List[Any]]) -> str:
+    head = "".join(f"<th>{html.escape(str(cell))}</th>" for cell in headers)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>" for row in rows
+    )
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+
+def render_html(statement: Dict[str, Any]) -> str:
+    """Relevé autonome, imprimable"""
+    currency = html.escape(statement["currency"])
+    totals = statement["totals"]
+    sections = [
+        ("Synthèse", _table(["Revenus", "Dépenses", "Solde", "Transactions"], [
+            [totals["income"], totals["expenses"], totals["balance"], totals["transactions"]]
+        ])),
+        ("Par catégorie", _table(["Catégorie", "Type", f"Montant ({currency})", "Part (%)"], [
+            [row["category"], row["type"], row["amount"], row["share"]] for row in statement["categories"]
+        ])),
+        ("Budgets", _table(["Catégorie", "Budget", "Dépensé", "Utilisé (%)", "Statut"], [
+            [row["category"], row["budget_amount"], row["spent_amount"], round(row["percentage"], 1), row["status"]]
+            for row in statement["budgets"]
+        ])),
+        ("Transactions", _table(["Date", "Description", "Catégorie", "Type", "Moyen de paiement", "Montant"], [
+            [row["date"], row["description"], row["category"], row["type"], row["payment_method"], row["amount"]]
+            for row in statement["transactions"]
+        ])),
+    ]
+    body = "".join(f"<h2>{title}</h2>{table}" for title, table in sections)
+    return (
+        '<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8">'
+        f"<title>Relevé {statement['month']}</title>"
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:1.5em}"
+        "th,td{border:1px solid #ccc;padding:4px 8px;text-align:left}</style></head><body>"
+        f"<h1>Relevé de {statement['month']}</h1>"
+        f"<p>Montants en {currency}, généré le {html.escape(statement['generated_at'])}</p>"
+        f"{body}</body></html>"
+    )
+
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def render_statement(user_id: int, month: str, shard: Optional[int] = None) -> bool:
+    """Calcule et enregistre le relevé dans les trois formats (processus du pool).
+
+    Retourne False si une écriture l'a rendu obsolète pendant le calcul.
+    """
+    from .database import SessionLocal, engine, shard_engines
+
+    # Processus enfant : ne pas réutiliser les connexions héritées du parent
+    for db_engine in {engine, *shard_engines}:
+        db_engine.dispose(close=False)
+    started = time.time_ns()
+    db = SessionLocal()
+    db.info["read_only"] = True
+    db.info["shard"] = shard
+    try:
+        statement = build_statement(db, user_id, month)
+    finally:
+        db.close()
+
+    os.makedirs(_user_dir(user_id), exist_ok=True)
+    rendered = {
+        "json": json.dumps(statement, ensure_ascii=False),
+        "csv": render_csv(statement),
+        "html": render_html(statement),
+    }
+    paths = [statement_path(user_id, month, fmt) for fmt in rendered]
+    for path, content in zip(paths, rendered.values()):
+        _write_atomic(path, content)
+    try:
+        stale = os.stat(_stale_path(user_id, month)).st_mtime_ns >= started
+    except FileNotFoundError:
+        stale = False
+    if stale:
+        _remove(paths)
+    return not stale
+
+
+class StatementGenerator:
+    """Pool de processus du worker : au plus un calcul en cours par (utilisateur, mois)"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[Tuple[int, str], Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"scheduled": 0, "generated": 0, "stale": 0, "failed": 0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn : les processus ne doivent pas hériter des threads ni des connexions du serveur
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def schedule(self, user_id: int, month: str, shard: Optional[int] = None) -> None:
+        """Lance le calcul du relevé s'il n'est pas déjà en cours"""
+        key = (user_id, month)
+        with self._lock:
+            if key in self._pending:
+                return
+            future = self._executor().submit(render_statement, user_id, month, shard)
+            self._pending[key] = future
+            self.stats["scheduled"] += 1
+        future.add_done_callback(lambda done: self._finished(key, done))
+
+    def _finished(self, key: Tuple[int, str], future: Future) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception() is not None:
+                self.stats["failed"] += 1
+                logger.error("Relevé %s de l'utilisateur %s impossible : %s", key[1], key[0], future.exception())
+            elif future.result():
+                self.stats["generated"] += 1
+            else:
+                self.stats["stale"] += 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"workers": self.workers, "pending": len(self._pending), **self.stats}
+
+
+# Instance globale : pool de calcul des relevés de ce worker
+statement_generator = StatementGenerator(settings.statements_workers)
@@ -0,0 +1,193 @@
+"""
+Séries temporelles des graphiques (GET /transactions/timeseries).
+
+Une requête SQL agrégée par (jour, type, catégorie) charge la période, une
+autre le solde d'ouverture ; l'archive est lue en colonnes si la période la
+recouvre. Les totaux journaliers sont ensuite répartis en périodes (jour,
+semaine, mois) continues, périodes vides comprises : revenus, dépenses,
+solde cumulé et, sur demande, dépenses empilées par catégorie.
+
+Au-delà de max_points périodes, la courbe est réduite par LTTB (Largest
+Triangle Three Buckets) appliqué au solde cumulé : les points gardés sont
+ceux qui préservent la forme de la courbe. Les flux (revenus, dépenses,
+catégories) de chaque point couvrent les périodes depuis le point précédent,
+si bien que les sommes restent exactes et que le solde d'un point vaut
+toujours le solde précédent plus ses revenus moins ses dépenses.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import numpy as np
+from sqlalchemy import extract, func
+from sqlalchemy.orm import Session
+
+from . import archive, models
+from .category_map import category_map
+from .columnar import EPOCH, MICROS_PER_DAY, bucket_ids, bucket_label
+from .money import user_exponents
+
+BUCKETS = ("day", "week", "month")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices des points gardés par Largest Triangle Three Buckets (premier et dernier inclus)"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        # Moyenne du seau suivant : troisième sommet du triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def _day_numbers(years: np.ndarray, months: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Jours depuis 1970 à partir des colonnes (année, mois, jour) renvoyées par SQL"""
+    month_numbers = (years - 1970) * 12 + months - 1
+    return month_numbers.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + days - 1
+
+
+def _bucket_start(bucket: str, value: int) -> datetime:
+    """Début d'une période numérotée par bucket_ids"""
+    if bucket == "day":
+        return EPOCH + timedelta(days=value)
+    if bucket == "week":
+        return EPOCH + timedelta(days=value * 7 - 3)
+    return datetime(1970 + value // 12, value % 12 + 1, 1)
+
+
+def _load_days(db: Session, user_id: int, start: datetime, end: datetime):
+    """(jour, revenu ?, catégorie, total) des transactions de la table chaude sur [start, end)"""
+    year = extract("year", models.Transaction.date)
+    month = extract("month", models.Transaction.date)
+    day = extract("day", models.Transaction.date)
+    rows = db.query(
+        year, month, day,
+        models.Transaction.type,
+        models.Transaction.category_id,
+        func.sum(models.Transaction.amount_minor),
+    ).filter(
+        models.Transaction.user_id == user_id,
+        models.Transaction.date >= start,
+        models.Transaction.date < end,
+    ).group_by(year, month, day, models.Transaction.type, models.Transaction.category_id).all()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, bool), [], np.empty(0, np.int64)
+    # Conversion en tuples d'abord : NumPy est bien plus lent sur les objets Row
+    data = np.array([(r[0], r[1], r[2], r[5]) for r in rows], dtype=np.int64)
+    return (
+        _day_numbers(data[:, 0], data[:, 1], data[:, 2]),
+        np.array([r[3] == "revenu" for r in rows]),
+        [category_map.name(r[4]) for r in rows],
+        data[:, 3],
+    )
+
+
+def _opening_balance(db: Session, user_id: int, start: datetime) -> int:
+    """Solde (unités mineures) des transactions de la table chaude antérieures à start"""
+    totals = dict(db.query(models.Transaction.type, func.sum(models.Transaction.amount_minor)).filter(
+        models.Transaction.user_id == user_id,
+        models.Transaction.date < start,
+    ).group_by(models.Transaction.type).all())
+    return int(totals.get("revenu") or 0) - int(totals.get("depense") or 0)
+
+
+def _to_amounts(values: np.ndarray, exponent: int) -> list:
+    if exponent == 0:
+        return values.astype(np.float64).tolist()
+    return (values / 10 ** exponent).round(exponent).tolist()
+
+
+def compute_timeseries(
+    db: Session,
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    bucket: str = "day",
+    by_category: bool = False,
+    max_points: int = 300,
+) -> Dict[str, Any]:
+    """Revenus, dépenses et solde cumulé par période sur [start, end), réduits à max_points points"""
+    # La première période est complète : start est ramené au début de sa période
+    first = int(bucket_ids(np.array([(start - EPOCH) // timedelta(microseconds=1)]), bucket)[0])
+    start = _bucket_start(bucket, first)
+    start_us = (start - EPOCH) // timedelta(microseconds=1)
+    end_us = (end - EPOCH) // timedelta(microseconds=1)
+    last = int(bucket_ids(np.array([end_us - 1]), bucket)[0])
+    size = max(last - first + 1, 0)
+
+    days, is_revenue, categories, amounts = _load_days(db, user_id, start, end)
+    opening = _opening_balance(db, user_id, start)
+
+    if archive.archive_end(user_id) is not None:
+        cold = archive.load_columns(user_id, ("date", "amount_minor", "type", "category"))
+        cold_dates = np.array(cold["date"], dtype=np.int64)
+        cold_amounts = np.array(cold["amount_minor"], dtype=np.int64)
+        cold_revenue = np.array([kind == "revenu" for kind in cold["type"]], dtype=bool)
+        before = cold_dates < start_us
+        opening += int(cold_amounts[before & cold_revenue].sum() - cold_amounts[before & ~cold_revenue].sum())
+        inside = ~before & (cold_dates < end_us)
+        days = np.concatenate([days, cold_dates[inside] // MICROS_PER_DAY])
+        is_revenue = np.concatenate([is_revenue, cold_revenue[inside]])
+        categories = categories + [name for name, keep in zip(cold["category"], inside) if keep]
+        amounts = np.concatenate([amounts, cold_amounts[inside]])
+
+    periods = bucket_ids(days * MICROS_PER_DAY, bucket) - first
+    revenues = np.zeros(size, dtype=np.int64)
+    expenses = np.zeros(size, dtype=np.int64)
+    np.add.at(revenues, periods[is_revenue], amounts[is_revenue])
+    np.add.at(expenses, periods[~is_revenue], amounts[~is_revenue])
+    balance = opening + np.cumsum(revenues - expenses)
+
+    stacks = None
+    if by_category:
+        spent = np.flatnonzero(~is_revenue)
+        names = sorted({categories[i] for i in spent})
+        codes = {name: code for code, name in enumerate(names)}
+        stacks = np.zeros((len(names), size), dtype=np.int64)
+        np.add.at(stacks, (np.array([codes[categories[i]] for i in spent], dtype=np.int64), periods[spent]), amounts[spent])
+
+    indices = np.arange(size)
+    downsampled = size > max_points
+    if downsampled:
+        indices = lttb(indices, balance, max_points)
+        # Chaque point garde les flux des périodes écoulées depuis le point précédent
+        starts = np.concatenate([[0], indices[:-1] + 1])
+        revenues = np.add.reduceat(revenues, starts)
+        expenses = np.add.reduceat(expenses, starts)
+        if stacks is not None:
+            stacks = np.add.reduceat(stacks, starts, axis=1)
+        balance = balance[indices]
+
+    exponent = user_exponents.get(user_id)
+    result = {
+        "bucket": bucket,
+        "count": len(indices),
+        "total_periods": size,
+        "downsampled": downsampled,
+        "opening_balance": _to_amounts(np.array([opening]), exponent)[0],
+        "periods": [bucket_label(bucket, first + int(i)) for i in indices],
+        "revenues": _to_amounts(revenues, exponent),
+        "expenses": _to_amounts(expenses, exponent),
+        "balance": _to_amounts(balance, exponent),
+    }
+    if stacks is not None:
+        result["categories"] = {
+            name: _to_amounts(row, exponent) for name, row in zip(names, stacks) if row.any()
+        }
+    return result
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Archivage des transactions froides (à planifier, par exemple une fois par mois)
+"""
+
+from app.database import SessionLocal, shard_router
+from app.archive import archive_closed_years
+from app.config import settings
+
+def run_archive():
+    """Déplace les années closes au-delà de l'horizon vers l'archive colonnaire"""
+    db = SessionLocal()
+    try:
+        report = []
+        for shard in shard_router.shards():
+            db.info["shard"] = shard
+            report += archive_closed_years(db)
+        for entry in report:
+            print(f"✅ Utilisateur {entry['user_id']} - {entry['year']} : "
+                  f"{entry['archived']} transactions archivées ({entry['total']} au total)")
+            if entry["kept"]:
+                print(f"   {entry['kept']} transactions modifiées pendant l'archivage, archivées au prochain passage")
+        if not report:
+            print("✅ Aucune transaction à archiver")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'archivage: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print(f"🗄️ Archivage des transactions de plus de {settings.archive_horizon_days} jours "
+          f"dans {settings.archive_dir}...")
+    run_archive()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Mesure de débit HTTP pour comparer les lanceurs (run.py / serve.py).
+
+Usage :
+    python bench.py --url http://127.0.0.1:8000/health --concurrency 64 --duration 10
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, url: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, concurrency: int, duration: float):
+    latencies: list = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[
+            worker(client, url, deadline, latencies, errors) for _ in range(concurrency)
+        ])
+
+    latencies.sort()
+    count = len(latencies)
+    print(f"URL          : {url}")
+    print(f"Concurrence  : {concurrency}")
+    print(f"Requêtes     : {count} en {duration:.0f}s ({len(errors)} erreurs)")
+    print(f"Débit        : {count / duration:.0f} req/s")
+    if count:
+        print(f"Latence p50  : {latencies[count // 2] * 1000:.1f} ms")
+        print(f"Latence p99  : {latencies[min(int(count * 0.99), count - 1)] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure de débit de l'API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/health")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.duration))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Vérification des budgets de requêtes SQL des routes (à lancer avant chaque déploiement)
+
+Chaque route de app/api/ est appelée sur un jeu de données de référence, dans une
+base SQLite temporaire, cache des analyses désactivé. Le nombre de requêtes SQL
+de chaque appel (en-tête Server-Timing de SQLStatsMiddleware) est comparé au
+budget déclaré par la route (@statement_budget, marge BUDGET_HEADROOM comprise).
+La commande échoue si une route dépasse son budget, n'en déclare pas ou n'est
+pas appelée ici. tests/test_query_budgets.py fait les mêmes vérifications sous pytest.
+
+Usage :
+    python check_query_budgets.py            # tableau des routes
+    python check_query_budgets.py --verbose  # requêtes SQL des routes en dépassement
+"""
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Jeu de données : mois en cours et deux mois précédents
+CATEGORIES = ["Nourriture", "Transport", "Logement", "Communication", "Loisirs"]
+TRANSACTIONS_PER_MONTH = 20
+SERVER_TIMING = re.compile(r'desc="(\d+) SQL"')
+
+
+def configure(directory: str) -> None:
+    """Base, archive, spool et relevés dans un répertoire temporaire ; mesure SQL activée"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'budgets.db')}",
+        "SHARD_URLS": "[]",
+        "CACHE_BACKEND": "none",
+        "RATE_LIMIT_BACKEND": "none",
+        "ALERTS_BACKEND": "memory",
+        "ARCHIVE_DIR": os.path.join(directory, "archive"),
+        "INGEST_SPOOL_DIR": os.path.join(directory, "spool"),
+        "STATEMENTS_DIR": os.path.join(directory, "statements"),
+        "SQL_STATS": "true",
+    })
+    os.environ.pop("DATABASE_READ_URL", None)
+
+
+def month_start(months_ago: int) -> datetime:
+    start = datetime.now().replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+    for _ in range(months_ago):
+        start = (start - timedelta(days=1)).replace(day=1)
+    return start
+
+
+def seed(client) -> dict:
+    """Utilisateur de référence avec transactions, budgets, objectifs, relevé et comparaisons du mois clos ; ids utilisés par les appels"""
+    from app.database import SessionLocal
+    from app.peers import compute_peer_benchmarks
+    from app.statements import render_statement
+
+    client.post("/auth/register", json={"email": "budget@example.com", "username": "budget", "password": "budget"})
+    token = client.post("/auth/token", data={"username": "budget", "password": "budget"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transaction_ids = []
+    for months_ago in range(3):
+        start = month_start(months_ago)
+        client.post("/transactions/", headers=headers, json={
+            "amount": 300000, "type": "revenu", "category": "Salaire", "description": "Salaire", "date": start.isoformat()
+        })
+        for index in range(TRANSACTIONS_PER_MONTH):
+            response = client.post("/transactions/", headers=headers, json={
+                "amount": 1000 + 250 * index,
+                "type": "depense",
+                "category": CATEGORIES[index % len(CATEGORIES)],
+                "description": f"Achat {index}",
+                "payment_method": "mobile money",
+                "date": (start + timedelta(days=index % 27)).isoformat(),
+            })
+            transaction_ids.append(response.json()["id"])
+
+    month = month_start(0).strftime("%Y-%m")
+    budget_ids = [
+        client.post("/budgets/", headers=headers, json={"category": category, "amount": 20000, "month": month}).json()["id"]
+        for category in CATEGORIES
+    ]
+    goal_ids = [
+        client.post("/goals/", headers=headers, json={
+            "name": f"Objectif {index}", "target_amount": 100000, "current_amount": 10000 * index,
+            "deadline": (datetime.now() + timedelta(days=365)).isoformat()
+        }).json()["id"]
+        for index in range(3)
+    ]
+    # Relevé déjà calculé : la route le sert depuis le disque
+    closed_month = month_start(1).strftime("%Y-%m")
+    render_statement(client.get("/auth/me", headers=headers).json()["id"], closed_month)
+    # Comparaisons du mois clos calculées : la route les lit (sans elles, elle répond sans requête)
+    db = SessionLocal()
+    try:
+        compute_peer_benchmarks(db, closed_month)
+    finally:
+        db.close()
+    return {
+        "token": token,
+        "headers": headers,
+        "month": month,
+        "closed_month": closed_month,
+        "transactions": transaction_ids,
+        "budgets": budget_ids,
+        "goals": goal_ids,
+    }
+
+
+def cases(data: dict) -> list:
+    """(méthode, chemin de la route, appel) : un appel par route, mêmes paramètres que le client web"""
+    month = data["month"]
+    new_transaction = {
+        "amount": 5000, "type": "depense", "category": "Nourriture", "description": "Marché",
+        "date": datetime.now().isoformat()
+    }
+    return [
+        ("POST", "/auth/register", dict(json={"email": "autre@example.com", "username": "autre", "password": "autre"}, auth=False)),
+        ("POST", "/auth/token", dict(data={"username": "budget", "password": "budget"}, auth=False)),
+        ("GET", "/auth/me", {}),
+        ("PUT", "/auth/me", dict(json={"full_name": "Compte de référence"})),
+        ("POST", "/transactions/", dict(json=new_transaction)),
+        ("POST", "/transactions/ingest", dict(json={"transactions": [new_transaction] * 10})),
+        ("POST", "/transactions/categorize", dict(json={"transactions": [
+            {"amount": 2500, "type": "depense", "description": f"Achat {index}"} for index in range(10)
+        ]})),
+        ("POST", "/transactions/categorize/pending", {}),
+        ("GET", "/transactions/", dict(params={"limit": 50})),
+        ("GET", "/transactions/anomalies", {}),
+        ("GET", "/transactions/timeseries", dict(params={"bucket": "week", "by_category": True})),
+        ("GET", "/transactions/{transaction_id}", dict(ids={"transaction_id": data["transactions"][0]})),
+        ("PUT", "/transactions/{transaction_id}", dict(ids={"transaction_id": data["transactions"][1]}, json={"amount": 4200})),
+        ("DELETE", "/transactions/{transaction_id}", dict(ids={"transaction_id": data["transactions"][2]})),
+        ("GET", "/transactions/summary/analytics", dict(params={"months": 6})),
+        ("GET", "/transactions/summary/query", dict(params={"group_by": "category", "bucket": "month"})),
+        ("POST", "/budgets/", dict(json={"category": "Santé", "amount": 15000, "month": month})),
+        ("GET", "/budgets/", dict(params={"month": month})),
+        ("PUT", "/budgets/{budget_id}", dict(ids={"budget_id": data["budgets"][0]}, json={"amount": 25000})),
+        ("DELETE", "/budgets/{budget_id}", dict(ids={"budget_id": data["budgets"][1]})),
+        ("GET", "/budgets/alerts", dict(params={"month": month})),
+        ("POST", "/budgets/alerts/stream/ticket", {}),
+        ("GET", "/budgets/alerts/stream", dict(stream=True)),
+        ("POST", "/goals/", dict(json={"name": "Moto", "target_amount": 500000, "deadline": datetime.now().isoformat()})),
+        ("GET", "/goals/", {}),
+        ("GET", "/goals/{goal_id}", dict(ids={"goal_id": data["goals"][0]})),
+        ("PUT", "/goals/{goal_id}", dict(ids={"goal_id": data["goals"][1]}, json={"current_amount": 50000})),
+        ("DELETE", "/goals/{goal_id}", dict(ids={"goal_id": data["goals"][2]})),
+        ("GET", "/categories/", {}),
+        ("POST", "/categories/", dict(json={"name": "Cotisations", "type": "depense"})),
+        ("GET", "/analytics/peers", {}),
+        ("GET", "/statements/{month}", dict(ids={"month": data["closed_month"]}, params={"format": "csv"})),
+        ("POST", "/batch", dict(json={"requests": [
+            {"id": "alerts", "path": f"/budgets/alerts?month={month}"},
+            {"id": "goals", "path": "/goals/"},
+        ]})),
+    ]
+
+
+def measure_stream(client, data: dict) -> int:
+    """Requêtes SQL d'ouverture d'un flux SSE : le client de test ne rend la main qu'en fin de réponse"""
+    from starlette.requests import Request
+
+    from app.api import budgets
+    from app.sqlstats import count_statements
+
+    ticket = client.post("/budgets/alerts/stream/ticket", headers=data["headers"]).json()["ticket"]
+    with count_statements() as stats:
+        user = budgets.get_stream_user(Request({"type": "http", "headers": [], "state": {}}), None, ticket)
+        budgets._current_alerts(user.id, data["month"])
+    return stats.count
+
+
+def api_routes(app) -> dict:
+    """(méthode, chemin) -> fonction de chaque route de app/api/"""
+    from fastapi.routing import APIRoute
+
+    return {
+        (method, route.path): route.endpoint
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.endpoint.__module__.startswith("app.api.")
+        for method in route.methods
+    }
+
+
+def measure_routes(client, data: dict) -> dict:
+    """(méthode, chemin) -> (requêtes SQL, statut HTTP) de chaque appel, dans l'ordre de cases()"""
+    measured = {}
+    for method, path, call in cases(data):
+        if call.get("stream"):
+            measured[(method, path)] = (measure_stream(client, data), 200)
+            continue
+        response = client.request(
+            method, path.format(**call.get("ids", {})),
+            headers=data["headers"] if call.get("auth", True) else {},
+            json=call.get("json"), data=call.get("data"), params=call.get("params"),
+        )
+        count = int(SERVER_TIMING.search(response.headers["server-timing"]).group(1))
+        measured[(method, path)] = (count, response.status_code)
+    return measured
+
+
+def run_checks(verbose: bool = False) -> bool:
+    from fastapi.testclient import TestClient
+
+    import init_data
+    from app.main import app
+    from app.sqlstats import budget_of
+
+    logging.basicConfig(level=logging.WARNING if verbose else logging.ERROR, format="%(message)s")
+    init_data.init_database()
+    routes = api_routes(app)
+
+    with TestClient(app) as client:
+        measured = measure_routes(client, seed(client))
+
+    ok = True
+    print(f"{'Route':<45} {'Requêtes':>8} {'Budget':>7}")
+    for (method, path), (count, status) in measured.items():
+        budget = budget_of(routes.get((method, path)))
+        if status >= 400:
+            verdict = f"❌ statut {status}"
+        elif budget is None:
+            verdict = "❌ aucun budget déclaré"
+        elif count > budget:
+            verdict = "❌ budget dépassé"
+        else:
+            verdict = "✅"
+        ok = ok and verdict == "✅"
+        print(f"{method + ' ' + path:<45} {count:>8} {budget if budget is not None else '-':>7}  {verdict}")
+
+    for method, path in sorted(set(routes) - set(measured)):
+        ok = False
+        print(f"{method + ' ' + path:<45} {'-':>8} {'-':>7}  ❌ route non appelée par check_query_budgets.py")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérifie les budgets de requêtes SQL des routes")
+    parser.add_argument("--verbose", action="store_true", help="Affiche les requêtes SQL des routes en dépassement")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="query-budgets-")
+    configure(directory)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        print("🔎 Vérification des budgets de requêtes SQL...")
+        passed = run_checks(args.verbose)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print("✅ Tous les budgets sont respectés" if passed else "❌ Budgets de requêtes SQL non respectés")
+    sys.exit(0 if passed else 1)
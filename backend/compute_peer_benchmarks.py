@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Calcul des comparaisons entre utilisateurs (à planifier chaque mois)
+
+Usage :
+    python compute_peer_benchmarks.py              # mois précédent
+    python compute_peer_benchmarks.py 2024-09      # mois donné
+    python compute_peer_benchmarks.py 2024-09 8    # sur 8 processus
+"""
+
+import sys
+import time
+from datetime import date
+
+from app.config import settings
+from app.database import SessionLocal
+from app.peers import compute_peer_benchmarks
+
+def previous_month():
+    today = date.today()
+    return f"{today.year - (today.month == 1)}-{(today.month - 2) % 12 + 1:02d}"
+
+def run_benchmarks(month=None, workers=None):
+    """Recalcule les t-digests du mois pour toutes les cohortes"""
+    month = month or previous_month()
+    workers = workers or settings.peers_workers
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        report = compute_peer_benchmarks(db, month, workers)
+        print(f"✅ {month} : {report['users']} utilisateurs, {report['sketches']} t-digests "
+              f"en {time.perf_counter() - started:.1f} s ({workers} processus)")
+    except Exception as e:
+        print(f"❌ Erreur lors du calcul: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("👥 Calcul des comparaisons entre utilisateurs...")
+    run_benchmarks(
+        sys.argv[1] if len(sys.argv) > 1 else None,
+        int(sys.argv[2]) if len(sys.argv) > 2 else None,
+    )
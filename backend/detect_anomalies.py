@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Détection des dépenses inhabituelles (à planifier chaque nuit)
+
+Usage :
+    python detect_anomalies.py            # mois en cours
+    python detect_anomalies.py 2024-09    # mois donné
+"""
+
+import sys
+import time
+
+from app.database import SessionLocal, shard_router
+from app.anomalies import detect_anomalies
+
+def run_detection(month=None):
+    """Recalcule les anomalies du mois pour tous les utilisateurs"""
+    db = SessionLocal()
+    try:
+        # Un passage par shard : les séries d'un utilisateur sont toutes sur son shard
+        for shard in shard_router.shards():
+            db.info["shard"] = shard
+            started = time.perf_counter()
+            report = detect_anomalies(db, month)
+            label = "" if shard is None else f"Shard {shard} : "
+            print(f"✅ {label}{report['series']} séries analysées, {report['anomalies']} anomalies "
+                  f"en {time.perf_counter() - started:.1f} s")
+    except Exception as e:
+        print(f"❌ Erreur lors de la détection: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("🔎 Détection des dépenses inhabituelles...")
+    run_detection(sys.argv[1] if len(sys.argv) > 1 else None)
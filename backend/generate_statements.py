@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Calcul des relevés mensuels (à planifier au début de chaque mois)
+
+Usage :
+    python generate_statements.py              # mois précédent
+    python generate_statements.py 2024-09      # mois donné
+    python generate_statements.py 2024-09 8    # sur 8 processus
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal, shard_router
+from app.peers import month_range
+from app.statements import is_closed, render_statement
+
+def previous_month():
+    today = date.today()
+    return f"{today.year - (today.month == 1)}-{(today.month - 2) % 12 + 1:02d}"
+
+def run_statements(month=None, workers=None):
+    """Calcule les relevés du mois pour tous les utilisateurs ayant une transaction ce mois-là"""
+    month = month or previous_month()
+    workers = workers or settings.statements_workers
+    if not is_closed(month):
+        print(f"❌ Le mois {month} n'est pas terminé")
+        return
+    start, end = month_range(month)
+    db = SessionLocal()
+    tasks = []
+    try:
+        for shard in shard_router.shards():
+            db.info["shard"] = shard
+            user_ids = db.query(models.Transaction.user_id).filter(
+                models.Transaction.date >= start,
+                models.Transaction.date < end
+            ).distinct()
+            tasks += [(user_id, shard) for (user_id,) in user_ids]
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            render_statement, [user_id for user_id, _ in tasks], [month] * len(tasks), [shard for _, shard in tasks]
+        ))
+    print(f"✅ {month} : {sum(results)} relevés calculés en {time.perf_counter() - started:.1f} s "
+          f"({workers} processus)")
+    if len(results) > sum(results):
+        print(f"⚠️ {len(results) - sum(results)} relevés modifiés pendant le calcul, recalculés à la demande")
+
+if __name__ == "__main__":
+    print("🧾 Calcul des relevés mensuels...")
+    run_statements(
+        sys.argv[1] if len(sys.argv) > 1 else None,
+        int(sys.argv[2]) if len(sys.argv) > 2 else None,
+    )
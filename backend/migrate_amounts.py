@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Migration des montants flottants vers des entiers en unités mineures
+
+Usage :
+    python migrate_amounts.py              # conversion en ligne, relançable
+    python migrate_amounts.py --finalize   # à la bascule : rattrapage et suppression des anciennes colonnes
+"""
+
+import argparse
+
+from app.database import engine
+from app.migrations import migrate_amounts_to_minor_units
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migration des montants vers les unités mineures")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--finalize", action="store_true",
+                        help="Supprime les colonnes flottantes (l'ancienne version de l'API doit être arrêtée)")
+    args = parser.parse_args()
+
+    print("🚀 Migration des montants...")
+    report = migrate_amounts_to_minor_units(engine, batch_size=args.batch_size, finalize=args.finalize)
+    for column, migrated in report.items():
+        print(f"✅ {column} : {migrated}")
+    if args.finalize:
+        print("✅ Anciennes colonnes flottantes supprimées")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Migration des catégories texte vers des clés entières (categories.id)
+
+Usage :
+    python migrate_categories.py              # remplissage en ligne, relançable
+    python migrate_categories.py --finalize   # à la bascule : rattrapage et suppression de l'ancienne colonne
+"""
+
+import argparse
+
+from app.database import engine
+from app.migrations import migrate_categories_to_ids
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migration des catégories vers categories.id")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--finalize", action="store_true",
+                        help="Supprime la colonne texte (l'ancienne version de l'API doit être arrêtée)")
+    args = parser.parse_args()
+
+    print("🚀 Migration des catégories...")
+    report = migrate_categories_to_ids(engine, batch_size=args.batch_size, finalize=args.finalize)
+    shared = report.pop("shared_categories")
+    per_user = report.pop("category_names_per_user")
+    for table, migrated in report.items():
+        print(f"✅ {table} : {migrated} lignes migrées")
+    if shared:
+        print(f"✅ {shared} catégories employées par plusieurs utilisateurs rendues communes")
+    if per_user:
+        print("✅ Noms de catégories uniques par utilisateur (et non plus globalement)")
+    if args.finalize:
+        print("✅ Anciennes colonnes texte supprimées")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Rééquilibrage des utilisateurs entre les shards (SHARD_URLS), service en marche
+
+Usage :
+    python rebalance_shards.py --dry-run         # utilisateurs hors de leur shard cible
+    python rebalance_shards.py                   # les déplacer vers leur shard cible
+    python rebalance_shards.py --user 42 --to 1  # déplacer (et épingler) un utilisateur
+"""
+
+import argparse
+
+from app.rebalance import move_user, rebalance_plan
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rééquilibrage des utilisateurs entre les shards")
+    parser.add_argument("--dry-run", action="store_true", help="Affiche les déplacements sans les effectuer")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre maximal d'utilisateurs déplacés")
+    parser.add_argument("--user", type=int, default=None, help="Utilisateur à déplacer")
+    parser.add_argument("--to", type=int, default=None, help="Shard de destination de --user")
+    parser.add_argument("--unpin", action="store_true",
+                        help="Avec --user : rendre l'utilisateur au rééquilibrage (shard cible si --to est omis)")
+    args = parser.parse_args()
+
+    if args.user is not None:
+        from app.database import shard_router
+
+        target = args.to if args.to is not None else shard_router.target(args.user)
+        print(f"🚚 Déplacement de l'utilisateur {args.user} vers le shard {target}...")
+        report = move_user(args.user, target, pinned=not args.unpin)
+        print(f"✅ {report['moved']} lignes déplacées ({report['late']} arrivées pendant le déplacement)")
+    else:
+        plan = rebalance_plan()[:args.limit]
+        print(f"⚖️ {len(plan)} utilisateurs hors de leur shard cible")
+        for user_id, source, target in plan:
+            if args.dry_run:
+                print(f"   - Utilisateur {user_id} : shard {source} -> {target}")
+                continue
+            report = move_user(user_id, target)
+            print(f"✅ Utilisateur {user_id} : shard {source} -> {target}, {report['moved'] + report['late']} lignes")
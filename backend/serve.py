@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Lanceur de production : plusieurs workers uvicorn supervisés par gunicorn.
+
+run.py reste le lanceur de développement (un seul processus, rechargement
+automatique). Ce script lit sa configuration dans config.Settings (voir
+env_example.txt) :
+- WORKERS : nombre de workers (0 = un par cœur CPU)
+- KEEP_ALIVE / BACKLOG : paramètres des connexions HTTP
+- MAX_REQUESTS / MAX_REQUESTS_JITTER : recyclage des workers pour borner la mémoire
+- GRACEFUL_TIMEOUT : délai laissé aux requêtes en cours sur SIGTERM
+"""
+
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from app.config import settings
+
+
+class ProductionWorker(UvicornWorker):
+    """Worker uvicorn avec boucle uvloop et parseur httptools"""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def get_worker_count() -> int:
+    """Nombre de workers à lancer"""
+    if settings.workers > 0:
+        return settings.workers
+    return max(multiprocessing.cpu_count(), 1)
+
+
+def get_gunicorn_options() -> dict:
+    """Options gunicorn construites à partir des paramètres de l'application"""
+    return {
+        "bind": f"{settings.server_host}:{settings.server_port}",
+        "workers": get_worker_count(),
+        "worker_class": "serve.ProductionWorker",
+        "keepalive": settings.keep_alive,
+        "backlog": settings.backlog,
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests_jitter,
+        # SIGTERM : gunicorn arrête d'accepter les connexions et laisse
+        # graceful_timeout secondes aux workers pour terminer leurs requêtes
+        "graceful_timeout": settings.graceful_timeout,
+        "timeout": settings.graceful_timeout + 30,
+        "accesslog": "-" if settings.debug else None,
+        "errorlog": "-",
+        "loglevel": "info",
+    }
+
+
+class ProductionApplication(BaseApplication):
+    """Application gunicorn configurée sans fichier externe"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None and key in self.cfg.settings:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Import dans chaque worker (pas de preload) pour que chaque processus
+        # ouvre ses propres connexions à la base de données
+        from app.main import app
+        return app
+
+
+if __name__ == "__main__":
+    options = get_gunicorn_options()
+    # Hérité par les workers (fork) : ils choisissent leurs backends partagés selon leur nombre
+    settings.api_workers = options["workers"]
+    os.environ["API_WORKERS"] = str(options["workers"])
+    ProductionApplication(options).run()
@@ -0,0 +1,64 @@
+"""
+Configuration des tests : base SQLite, archive, spool et relevés dans un
+répertoire temporaire, posés avant le premier import de l'application.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from typing import Iterator
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import check_query_budgets  # noqa: E402
+
+_directory = tempfile.mkdtemp(prefix="budget-malin-tests-")
+check_query_budgets.configure(_directory)
+
+from app.sqlstats import StatementStats, count_statements  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_directory, ignore_errors=True)
+
+
+@pytest.fixture
+def sql_statements() -> Iterator[StatementStats]:
+    """Requêtes SQL exécutées pendant le test (dans le thread du test)"""
+    with count_statements() as stats:
+        yield stats
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Client de l'application, tables et catégories créées"""
+    from fastapi.testclient import TestClient
+
+    import init_data
+    from app.main import app
+
+    init_data.init_database()
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def reference_data(client) -> dict:
+    """Jeu de données de référence de check_query_budgets.py (token, en-têtes, ids)"""
+    return check_query_budgets.seed(client)
+
+
+@pytest.fixture(scope="session")
+def register(client):
+    """Inscrit un utilisateur (mot de passe = nom) et renvoie ses en-têtes d'authentification"""
+    def register_user(username: str, currency: str = "XOF") -> dict:
+        response = client.post("/auth/register", json={
+            "email": f"{username}@example.com", "username": username, "password": username, "currency": currency,
+        })
+        assert response.status_code == 200, response.text
+        token = client.post("/auth/token", data={"username": username, "password": username}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return register_user
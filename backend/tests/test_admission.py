@@ -0,0 +1,139 @@
+"""Contrôle d'admission : file bornée, délestage, passage de relais et middleware (503, Retry-After)"""
+
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionMiddleware, AdmissionPool, Overloaded, threads_needed
+from app.config import settings
+
+
+def test_pool_admits_up_to_concurrency_then_queues_in_order():
+    async def scenario():
+        pool = AdmissionPool("test", 1, 4, 10)
+        assert await pool.acquire() == 0.0
+        order = []
+
+        async def waiter(name):
+            await pool.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert pool.snapshot()["queue_depth"] == 2
+        pool.release(0.01)
+        await asyncio.sleep(0)
+        pool.release(0.01)
+        await asyncio.gather(*tasks)
+        pool.release(0.01)
+        return pool, order
+
+    pool, order = asyncio.run(scenario())
+    assert order == ["a", "b"]
+    assert pool.in_flight == 0
+    assert pool.stats["admitted"] == 3 and pool.stats["queued"] == 2
+
+
+def test_pool_rejects_when_queue_full():
+    async def scenario():
+        pool = AdmissionPool("test", 1, 0, 10)
+        await pool.acquire()
+        with pytest.raises(Overloaded, match="file pleine"):
+            await pool.acquire()
+        return pool
+
+    assert asyncio.run(scenario()).stats["rejected_queue_full"] == 1
+
+
+def test_pool_rejects_when_expected_wait_too_long():
+    async def scenario():
+        pool = AdmissionPool("test", 1, 10, 1)
+        pool.service_time = 2.0
+        await pool.acquire()
+        with pytest.raises(Overloaded, match="attente estimée") as excinfo:
+            await pool.acquire()
+        return pool, excinfo.value
+
+    pool, error = asyncio.run(scenario())
+    assert error.retry_after == 2.0
+    assert pool.stats["rejected_deadline"] == 1
+
+
+def test_pool_times_out_and_forgets_waiter():
+    async def scenario():
+        pool = AdmissionPool("test", 1, 10, 0.05)
+        pool.service_time = 0.01
+        await pool.acquire()
+        with pytest.raises(Overloaded, match="délai"):
+            await pool.acquire()
+        # La place libérée ne va pas à la requête abandonnée
+        pool.release(0.01)
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.in_flight == 0
+    assert pool.stats["timed_out"] == 1
+
+
+def test_pool_cancelled_waiter_releases_its_place():
+    async def scenario():
+        pool = AdmissionPool("test", 1, 10, 10)
+        await pool.acquire()
+        task = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        pool.release(0.01)
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.in_flight == 0 and pool.snapshot()["queue_depth"] == 0
+
+
+def test_threads_needed_counts_batch_pool(monkeypatch):
+    monkeypatch.setattr(settings, "batch_concurrency", 4)
+    pools = {"default": "20/1024/10", "ingest": "512/4096/5", "analytics": "6/32/2", "batch": "2/32/2"}
+    assert threads_needed(pools, {"POST /batch": "batch"}) == 20 + 6 + 2 * 5
+    # Sans pool dédié, les lots passent par le pool par défaut
+    assert threads_needed(pools, {}) == 20 * 5 + 6 + 2
+
+
+def test_middleware_returns_503_and_skips_health(monkeypatch):
+    # Pools de test, hors de ceux de l'application exposés par /health/admission
+    monkeypatch.setattr("app.admission.admission_pools", {})
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await gate.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionMiddleware(app, pools={"default": "1/0/1"})
+        messages = []
+
+        async def call(path):
+            scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            await middleware(scope, None, send)
+            messages.append((path, sent[0]))
+
+        first = asyncio.create_task(call("/analytics/summary"))
+        await asyncio.sleep(0)
+        await call("/analytics/summary")
+        health = asyncio.create_task(call("/health"))
+        gate.set()
+        await asyncio.gather(first, health)
+        return middleware, messages
+
+    middleware, messages = asyncio.run(scenario())
+    statuses = [(path, message["status"]) for path, message in messages]
+    assert statuses == [("/analytics/summary", 503), ("/health", 200), ("/analytics/summary", 200)]
+    assert (b"retry-after", b"1") in messages[0][1]["headers"]
+    assert middleware.default.in_flight == 0
@@ -0,0 +1,73 @@
+"""Relais Redis des alertes : l'abonnement survit aux coupures et aux messages illisibles"""
+
+import asyncio
+import json
+
+from app import alerts
+from app.alerts import CHANNEL_PREFIX, MemoryBroker, RedisBroker
+
+
+class FakePubSub:
+    """Abonnement qui rejoue une liste de messages, puis lève l'erreur donnée (ou reste ouvert)"""
+
+    def __init__(self, messages, error=None):
+        self.messages = messages
+        self.error = error
+        self.closed = False
+
+    async def psubscribe(self, pattern):
+        pass
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+        if self.error is not None:
+            raise self.error
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeAsyncRedis:
+    def __init__(self, *pubsubs):
+        self.pubsubs = list(pubsubs)
+
+    def pubsub(self):
+        return self.pubsubs.pop(0)
+
+
+def _message(user_id, data) -> dict:
+    return {"type": "pmessage", "channel": f"{CHANNEL_PREFIX}{user_id}", "data": data}
+
+
+def _broker(client) -> RedisBroker:
+    broker = RedisBroker.__new__(RedisBroker)
+    MemoryBroker.__init__(broker, queue_size=10)
+    broker.async_client = client
+    broker._listener = None
+    broker.stats.update(reconnections=0, malformed=0)
+    return broker
+
+
+def test_listener_survives_disconnect_and_bad_messages(monkeypatch):
+    monkeypatch.setattr(alerts, "LISTEN_RETRY_MIN_SECONDS", 0.01)
+    first = FakePubSub([
+        _message(1, "pas du json"),
+        {"type": "pmessage", "channel": f"{CHANNEL_PREFIX}abc", "data": "[]"},
+        _message(1, json.dumps([{"category": "Transport", "status": "warning"}])),
+    ], error=ConnectionError("Redis redémarré"))
+    second = FakePubSub([_message(1, json.dumps([{"category": "Loisirs", "status": "exceeded"}]))])
+    broker = _broker(FakeAsyncRedis(first, second))
+
+    async def scenario():
+        subscription = broker.subscribe(1)
+        received = [await asyncio.wait_for(subscription.get(), 2) for _ in range(2)]
+        broker._listener.cancel()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [event["category"] for event in received] == ["Transport", "Loisirs"]
+    assert broker.stats["malformed"] == 2
+    assert broker.stats["reconnections"] == 1
+    assert first.closed
@@ -0,0 +1,63 @@
+"""Détection des dépenses inhabituelles : écart robuste et tâche nocturne"""
+
+import numpy as np
+import pytest
+
+from app.anomalies import detect_anomalies, robust_scores
+from app.database import SessionLocal
+from check_query_budgets import month_start
+
+
+def test_robust_scores_flags_spike():
+    matrix = np.array([
+        [100, 110, 90, 100, 400],
+        [100, 110, 90, 100, 105],
+    ])
+    baseline, scores = robust_scores(matrix, min_history=3)
+    assert baseline.tolist() == [100, 100]
+    assert scores[0] > 3.5
+    assert abs(scores[1]) < 1
+
+
+def test_robust_scores_ignore_months_before_first_activity():
+    # Deux mois d'activité seulement : historique insuffisant, score nul
+    matrix = np.array([[0, 0, 100, 100, 900]])
+    baseline, scores = robust_scores(matrix, min_history=3)
+    assert baseline.tolist() == [0]
+    assert scores.tolist() == [0]
+
+    # Mois vide après le premier mois actif : compté dans l'historique
+    matrix = np.array([[0, 100, 0, 100, 900]])
+    baseline, scores = robust_scores(matrix, min_history=3)
+    assert baseline.tolist() == [100]
+    assert scores[0] > 3.5
+
+
+@pytest.fixture(scope="module")
+def anomaly_headers(client, register):
+    headers = register("anomalies")
+    for months_ago in range(4, -1, -1):
+        transport = 60000 if months_ago == 0 else 10000 + 500 * months_ago
+        for category, amount in (("Transport", transport), ("Loisirs", 5000)):
+            response = client.post("/transactions/", headers=headers, json={
+                "amount": amount, "type": "depense", "category": category,
+                "date": month_start(months_ago).isoformat(),
+            })
+            assert response.status_code == 200, response.text
+    return headers
+
+
+def test_detect_anomalies_flags_unusual_category(client, anomaly_headers):
+    month = month_start(0).strftime("%Y-%m")
+    db = SessionLocal()
+    try:
+        detect_anomalies(db, month)
+        # Relance : les anomalies du mois sont remplacées, pas dupliquées
+        report = detect_anomalies(db, month)
+    finally:
+        db.close()
+    assert report["anomalies"] >= 1
+
+    anomalies = client.get("/transactions/anomalies", headers=anomaly_headers, params={"month": month}).json()
+    assert [(a["category"], a["amount"], a["baseline"]) for a in anomalies] == [("Transport", 60000, 11250)]
+    assert anomalies[0]["score"] > 3.5
@@ -0,0 +1,91 @@
+"""Archivage : une transaction n'est jamais à la fois dans la table chaude et dans l'archive publiée"""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from app import archive, crud, models
+from app.database import SessionLocal
+
+YEAR = datetime.now().year - 4
+
+
+@pytest.fixture
+def archived_user(client, register):
+    """Utilisateur avec trois transactions d'une année close au-delà de l'horizon"""
+    def create(username: str) -> int:
+        headers = register(username)
+        for day in (1, 2, 3):
+            response = client.post("/transactions/", headers=headers, json={
+                "amount": 1000 * day, "type": "depense", "category": "Transport",
+                "date": datetime(YEAR, 3, day, 12).isoformat(),
+            })
+            assert response.status_code == 200
+        return client.get("/auth/me", headers=headers).json()["id"]
+    return create
+
+
+def _state(user_id: int):
+    """(ids chauds de l'année, ids archivés publiés, ids lus par la liste)"""
+    db = SessionLocal()
+    try:
+        hot = {id_ for (id_,) in db.query(models.Transaction.id).filter(
+            models.Transaction.user_id == user_id, models.Transaction.date < datetime(YEAR + 1, 1, 1)
+        )}
+        listed = [t.id for t in crud.get_user_transactions(db, user_id, limit=1000)]
+    finally:
+        db.close()
+    cold = set(archive.load_columns(user_id, ("id",))["id"])
+    return hot, cold, listed
+
+
+def _archive(commit=None):
+    db = SessionLocal()
+    if commit is not None:
+        db.commit = commit
+    try:
+        return archive.archive_closed_years(db)
+    finally:
+        db.close()
+
+
+def test_failed_commit_publishes_nothing(archived_user):
+    user_id = archived_user("archive-commit")
+
+    def failing_commit():
+        raise RuntimeError("commit impossible")
+
+    with pytest.raises(RuntimeError):
+        _archive(failing_commit)
+    hot, cold, listed = _state(user_id)
+    assert len(hot) == 3 and not cold
+    assert not os.path.exists(archive._pending_path(user_id, YEAR))
+
+    _archive()
+    hot, cold, listed = _state(user_id)
+    assert not hot and len(cold) == 3 and len(listed) == len(set(listed)) == 3
+
+
+def test_interrupted_publish_recovered(archived_user, monkeypatch):
+    user_id = archived_user("archive-publish")
+    replace = os.replace
+
+    def crash(src, dst):
+        if src.endswith(".pending"):
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    # Interruption entre le commit et la publication : les lignes ne sont plus lisibles qu'après reprise
+    monkeypatch.setattr(archive.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        _archive()
+    monkeypatch.setattr(archive.os, "replace", replace)
+    hot, cold, listed = _state(user_id)
+    assert not hot and not cold
+    assert os.path.exists(archive._pending_path(user_id, YEAR))
+
+    _archive()
+    hot, cold, listed = _state(user_id)
+    assert not hot and len(cold) == 3 and len(listed) == len(set(listed)) == 3
+    assert not os.path.exists(archive._pending_path(user_id, YEAR))
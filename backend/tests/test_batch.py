@@ -0,0 +1,63 @@
+"""POST /batch : réponses dans l'ordre du lot, écritures visibles des lectures suivantes, erreurs par sous-requête"""
+
+from datetime import datetime
+
+import pytest
+
+from app.config import settings
+
+
+@pytest.fixture(scope="module")
+def batch_headers(register):
+    return register("lots")
+
+
+def _transaction(amount: int) -> dict:
+    return {"amount": amount, "type": "depense", "category": "Transport", "date": datetime.now().isoformat()}
+
+
+@pytest.mark.parametrize("concurrency", [4, 1])
+def test_batch_reads_follow_writes_in_order(client, batch_headers, monkeypatch, concurrency):
+    monkeypatch.setattr(settings, "batch_concurrency", concurrency)
+    before = len(client.get("/transactions/", headers=batch_headers).json())
+    response = client.post("/batch", headers=batch_headers, json={"requests": [
+        {"id": "moi", "path": "/auth/me"},
+        {"id": "ajout", "method": "POST", "path": "/transactions/", "body": _transaction(2500)},
+        {"id": "liste", "path": "/transactions/?limit=1000"},
+        {"id": "categories", "path": "/categories/"},
+    ]})
+    assert response.status_code == 200, response.text
+    responses = response.json()["responses"]
+    assert [(r["id"], r["status"]) for r in responses] == [
+        ("moi", 200), ("ajout", 200), ("liste", 200), ("categories", 200),
+    ]
+    assert responses[0]["body"]["username"] == "lots"
+    assert len(responses[2]["body"]) == before + 1
+    assert responses[1]["body"]["id"] in {t["id"] for t in responses[2]["body"]}
+
+
+def test_batch_errors_stay_in_their_sub_response(client, batch_headers):
+    response = client.post("/batch", headers=batch_headers, json={"requests": [
+        {"id": "inconnue", "path": "/inexistant"},
+        {"id": "invalide", "method": "POST", "path": "/transactions/", "body": {"amount": "beaucoup"}},
+        {"id": "absente", "path": "/transactions/999999999"},
+        {"id": "moi", "path": "/auth/me"},
+    ]})
+    assert response.status_code == 200, response.text
+    assert [(r["id"], r["status"]) for r in response.json()["responses"]] == [
+        ("inconnue", 404), ("invalide", 422), ("absente", 404), ("moi", 200),
+    ]
+
+
+def test_batch_rejects_invalid_batches(client, batch_headers, monkeypatch):
+    for path in ("/batch", "/budgets/alerts/stream", "auth/me"):
+        response = client.post("/batch", headers=batch_headers, json={"requests": [{"path": path}]})
+        assert response.status_code == 422, path
+
+    monkeypatch.setattr(settings, "batch_max_requests", 2)
+    response = client.post("/batch", headers=batch_headers, json={"requests": [{"path": "/auth/me"}] * 3})
+    assert response.status_code == 413
+
+
+def test_batch_requires_authentication(client):
+    assert client.post("/batch", json={"requests": [{"path": "/auth/me"}]}).status_code == 401
@@ -0,0 +1,128 @@
+"""Cache des analyses : TTL, invalidation par tags, calcul unique, backend qui tombe en route"""
+
+import threading
+
+import pytest
+
+from app.cache import MemoryBackend, ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Counter:
+    """Fonction de calcul qui compte ses appels"""
+
+    def __init__(self, result=None):
+        self.calls = 0
+        self.result = result
+
+    def __call__(self):
+        self.calls += 1
+        return self.result if self.result is not None else {"total": self.calls}
+
+
+class BrokenBackend(MemoryBackend):
+    """Backend dont les opérations listées échouent, comme un Redis qui tombe après la première lecture"""
+
+    def __init__(self, failing=(), **kwargs):
+        super().__init__(**kwargs)
+        self.failing = set(failing)
+
+    def _fail(self, operation: str) -> None:
+        if operation in self.failing:
+            raise ConnectionError(f"{operation} : connexion perdue")
+
+    def acquire_lock(self, name, ttl):
+        self._fail("acquire_lock")
+        return super().acquire_lock(name, ttl)
+
+    def release_lock(self, name, token):
+        self._fail("release_lock")
+        super().release_lock(name, token)
+
+    def get(self, key):
+        self._fail("get")
+        return super().get(key)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(MemoryBackend(clock=clock), ttl=300)
+    compute = Counter()
+    assert cache.get_or_compute("analytics", "1", ["tx:1:2024-05"], compute) == {"total": 1}
+    clock.now = 299
+    assert cache.get_or_compute("analytics", "1", ["tx:1:2024-05"], compute) == {"total": 1}
+    clock.now = 301
+    assert cache.get_or_compute("analytics", "1", ["tx:1:2024-05"], compute) == {"total": 2}
+    assert cache.stats()["namespaces"]["analytics"]["hits"] == 1
+
+
+def test_invalidation_only_touches_dependent_entries(clock):
+    cache = ResultCache(MemoryBackend(clock=clock))
+    may, june = Counter(), Counter()
+    cache.get_or_compute("alerts", "1:2024-05", ["tx:1:2024-05"], may)
+    cache.get_or_compute("alerts", "1:2024-06", ["tx:1:2024-06"], june)
+    cache.invalidate(["tx:1:2024-05"])
+    assert cache.get_or_compute("alerts", "1:2024-05", ["tx:1:2024-05"], may) == {"total": 2}
+    assert cache.get_or_compute("alerts", "1:2024-06", ["tx:1:2024-06"], june) == {"total": 1}
+
+
+def test_concurrent_requests_compute_once(clock):
+    cache = ResultCache(MemoryBackend(clock=clock))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"total": 42}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("analytics", "1", ["tx:1:2024-05"], slow)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [{"total": 42}] * 5
+
+
+def test_waits_for_other_worker_computation(clock):
+    backend = MemoryBackend(clock=clock)
+    cache = ResultCache(backend, lock_timeout=5)
+    key = cache._versioned_key("analytics", "1", ["tx:1:2024-05"])
+    # Un autre worker tient le verrou puis publie son résultat
+    token = backend.acquire_lock(f"lock:{key}", 5)
+    timer = threading.Timer(0.05, lambda: (backend.set(key, '{"total": 7}', 300), backend.release_lock(f"lock:{key}", token)))
+    timer.start()
+    compute = Counter()
+    assert cache.get_or_compute("analytics", "1", ["tx:1:2024-05"], compute) == {"total": 7}
+    assert compute.calls == 0
+    timer.join()
+
+
+@pytest.mark.parametrize("failing", [("acquire_lock",), ("release_lock",), ("acquire_lock", "get")])
+def test_backend_failure_falls_back_to_direct_computation(clock, failing):
+    backend = BrokenBackend(clock=clock)
+    cache = ResultCache(backend)
+    compute = Counter({"total": 3})
+    backend.failing = set(failing)
+    assert cache.get_or_compute("alerts", "1", ["budget:1:2024-05"], compute) == {"total": 3}
+    assert compute.calls == 1
+    assert cache.stats()["namespaces"]["alerts"]["errors"] >= 1
@@ -0,0 +1,37 @@
+"""Catégories privées : POST /categories/ ne crée ni catégorie commune ni doublon"""
+
+from datetime import datetime
+
+
+def _spent(client, headers, category: str, month: str) -> float:
+    alerts = client.get("/budgets/alerts", headers=headers, params={"month": month}).json()
+    return next(alert["spent_amount"] for alert in alerts if alert["category"] == category)
+
+
+def test_created_category_stays_private(client, register):
+    bob, alice = register("bob"), register("alice")
+    month = datetime.now().strftime("%Y-%m")
+    expense = {"amount": 100, "type": "depense", "category": "Loyer perso", "date": datetime.now().isoformat()}
+
+    assert client.post("/transactions/", headers=bob, json=expense).status_code == 200
+    assert client.post("/budgets/", headers=bob, json={"category": "Loyer perso", "amount": 500, "month": month}).status_code == 200
+
+    response = client.post("/categories/", headers=alice, json={"name": "Loyer perso", "type": "depense"})
+    assert response.status_code == 200
+
+    # Les écritures de Bob restent sur sa propre catégorie
+    assert client.post("/transactions/", headers=bob, json=expense).status_code == 200
+    assert _spent(client, bob, "Loyer perso", month) == 200
+    for headers in (alice, bob):
+        names = [category["name"] for category in client.get("/categories/", headers=headers).json()]
+        assert names.count("Loyer perso") == 1
+    names = [category["name"] for category in client.get("/categories/").json()]
+    assert "Loyer perso" not in names
+
+
+def test_duplicate_category_conflicts(client, register):
+    carol = register("carol")
+    assert client.post("/categories/", headers=carol, json={"name": "Tontine", "type": "depense"}).status_code == 200
+    # Nom déjà pris par une catégorie de l'utilisateur, puis par une catégorie commune
+    assert client.post("/categories/", headers=carol, json={"name": "Tontine", "type": "depense"}).status_code == 409
+    assert client.post("/categories/", headers=carol, json={"name": "Salaire", "type": "revenu"}).status_code == 409
@@ -0,0 +1,60 @@
+"""Classifieur : le modèle d'un utilisateur n'est mis à jour en place que si l'écriture suit sa version"""
+
+from datetime import datetime
+
+import pytest
+
+from app.cache import MemoryBackend, analytics_cache
+from app.category_map import category_map
+from app.classifier import CategoryClassifier, classifier_tag
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    """Cache des analyses en mémoire : versions partagées comme avec Redis"""
+    monkeypatch.setattr(analytics_cache, "backend", MemoryBackend())
+
+
+@pytest.fixture(scope="module")
+def classifier_user(client, register):
+    headers = register("classifieur")
+    for description in ("Taxi moto", "Bus", "Taxi"):
+        client.post("/transactions/", headers=headers, json={
+            "amount": 1500, "type": "depense", "category": "Transport", "description": description,
+            "date": datetime.now().isoformat(),
+        })
+    return client.get("/auth/me", headers=headers).json()["id"]
+
+
+def _model(classifier: CategoryClassifier, user_id: int):
+    db = SessionLocal()
+    try:
+        return classifier._user_model(db, user_id)
+    finally:
+        db.close()
+
+
+def _learn(classifier: CategoryClassifier, user_id: int) -> None:
+    row = ("Taxi aéroport", 5000, 0, "depense", None)
+    classifier.record_write(user_id, added=[(row, category_map.id_for("Transport"))])
+
+
+def test_write_applied_in_place(shared_cache, classifier_user):
+    classifier = CategoryClassifier(10)
+    counts = _model(classifier, classifier_user)
+    _learn(classifier, classifier_user)
+    assert classifier._users[classifier_user] == (
+        counts, analytics_cache.current_versions([classifier_tag(classifier_user)])
+    )
+    assert _model(classifier, classifier_user) is counts
+
+
+def test_interleaved_write_drops_model(shared_cache, classifier_user):
+    classifier = CategoryClassifier(10)
+    counts = _model(classifier, classifier_user)
+    # Écriture d'un autre worker, que ce modèle n'a pas apprise
+    analytics_cache.invalidate([classifier_tag(classifier_user)])
+    _learn(classifier, classifier_user)
+    assert classifier_user not in classifier._users
+    assert _model(classifier, classifier_user) is not counts
@@ -0,0 +1,57 @@
+"""Instantanés colonnaires : une écriture n'est appliquée en place que si elle suit la version de l'instantané"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.cache import MemoryBackend, analytics_cache
+from app.columnar import SnapshotStore, snapshot_tag
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    """Cache des analyses en mémoire : versions partagées comme avec Redis"""
+    monkeypatch.setattr(analytics_cache, "backend", MemoryBackend())
+
+
+@pytest.fixture(scope="module")
+def snapshot_user(client, register):
+    headers = register("instantane")
+    for amount in (1000, 2000):
+        client.post("/transactions/", headers=headers, json={
+            "amount": amount, "type": "depense", "category": "Transport", "date": datetime.now().isoformat()
+        })
+    return client.get("/auth/me", headers=headers).json()["id"]
+
+
+def _transaction(transaction_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=transaction_id, date=datetime.now(), amount_minor=500, type="depense", category="Transport")
+
+
+def _load(store: SnapshotStore, user_id: int):
+    db = SessionLocal()
+    try:
+        return store.get(db, user_id)
+    finally:
+        db.close()
+
+
+def test_write_applied_in_place(shared_cache, snapshot_user):
+    store = SnapshotStore(10)
+    snapshot = _load(store, snapshot_user)
+    store.record_write(snapshot_user, added=[_transaction(10 ** 9)])
+    assert store._snapshots[snapshot_user] is snapshot
+    assert snapshot.version == analytics_cache.current_versions([snapshot_tag(snapshot_user)])
+    assert len(snapshot.position) == 3
+
+
+def test_interleaved_write_drops_snapshot(shared_cache, snapshot_user):
+    store = SnapshotStore(10)
+    snapshot = _load(store, snapshot_user)
+    # Écriture d'un autre worker, que cet instantané ne contient pas
+    analytics_cache.invalidate([snapshot_tag(snapshot_user)])
+    store.record_write(snapshot_user, added=[_transaction(10 ** 9)])
+    assert snapshot_user not in store._snapshots
+    assert _load(store, snapshot_user) is not snapshot
@@ -0,0 +1,61 @@
+"""Routage primaire / réplica : lecture des écritures de l'utilisateur décidée une fois par session"""
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from app import database, models
+
+
+class FlakyClock:
+    """Suivi des écritures dont la réponse change à chaque appel"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def is_recent(self, user_id: int) -> bool:
+        self.calls += 1
+        return self.answers[min(self.calls, len(self.answers)) - 1]
+
+    def record(self, user_id: int) -> None:
+        pass
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setattr(database, "read_engine", replica_engine)
+    yield replica_engine
+    replica_engine.dispose()
+
+
+def _session(clock, monkeypatch, user_id=1):
+    monkeypatch.setattr(database, "write_clock", clock)
+    db = database.SessionLocal()
+    db.info.update(read_only=True, sticky=None, user_id=user_id)
+    return db
+
+
+@pytest.mark.parametrize("answers", [(True, False), (False, True)])
+def test_stickiness_decided_once(replica, monkeypatch, answers):
+    clock = FlakyClock(*answers)
+    db = _session(clock, monkeypatch)
+    try:
+        binds = {db.get_bind(clause=select(models.Transaction.id)) for _ in range(5)}
+    finally:
+        db.close()
+    assert binds == {database.engine if answers[0] else replica}
+    assert clock.calls == 1
+
+
+def test_anonymous_reads_do_not_query_clock(replica, monkeypatch):
+    clock = FlakyClock(True)
+    db = _session(clock, monkeypatch, user_id=None)
+    try:
+        assert db.get_bind(clause=select(models.User.id)) is replica
+        # Utilisateur authentifié ensuite : décision prise à sa première lecture
+        db.info["user_id"] = 1
+        assert db.get_bind(clause=select(models.Transaction.id)) is database.engine
+    finally:
+        db.close()
+    assert clock.calls == 1
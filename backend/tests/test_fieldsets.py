@@ -0,0 +1,72 @@
+"""Projections fields= et format colonnaire des listes"""
+
+from datetime import datetime
+
+import pytest
+
+from app import crud
+from app.database import SessionLocal
+from app.fieldsets import TRANSACTION_FIELDS
+
+
+def test_parse_fields():
+    assert TRANSACTION_FIELDS.parse(None) is None
+    assert TRANSACTION_FIELDS.parse(" date, amount,date ") == ["date", "amount"]
+    assert TRANSACTION_FIELDS.parse(None, "columns") == TRANSACTION_FIELDS.names
+    assert TRANSACTION_FIELDS.columns(["amount", "category", "date"]) == ["amount_minor", "category_id", "date"]
+    for fields, layout in (("date,secret", "rows"), (",", "rows"), ("date", "xml")):
+        with pytest.raises(ValueError):
+            TRANSACTION_FIELDS.parse(fields, layout)
+
+
+@pytest.fixture(scope="module")
+def euro_headers(client, register):
+    headers = register("projections", currency="EUR")
+    for amount, category in ((12.5, "Transport"), (3.99, "Loisirs")):
+        response = client.post("/transactions/", headers=headers, json={
+            "amount": amount, "type": "depense", "category": category,
+            "description": "détail", "date": datetime.now().isoformat(),
+        })
+        assert response.status_code == 200, response.text
+    return headers
+
+
+def test_projection_matches_full_response(client, euro_headers):
+    full = client.get("/transactions/", headers=euro_headers).json()
+    rows = client.get("/transactions/", headers=euro_headers, params={"fields": "id,date,amount,category"}).json()
+    assert rows == [{field: t[field] for field in ("id", "date", "amount", "category")} for t in full]
+    assert sorted(t["amount"] for t in rows) == [3.99, 12.5]
+
+
+def test_columns_layout(client, euro_headers):
+    full = client.get("/transactions/", headers=euro_headers).json()
+    body = client.get("/transactions/", headers=euro_headers, params={"fields": "amount,category", "layout": "columns"}).json()
+    assert body == {
+        "count": len(full),
+        "fields": ["amount", "category"],
+        "columns": {"amount": [t["amount"] for t in full], "category": [t["category"] for t in full]},
+    }
+    # Sans fields= : tous les champs du schéma
+    body = client.get("/transactions/", headers=euro_headers, params={"layout": "columns"}).json()
+    assert body["fields"] == TRANSACTION_FIELDS.names
+    assert body["columns"]["description"] == [t["description"] for t in full]
+
+
+def test_invalid_fields_rejected(client, euro_headers):
+    for params in ({"fields": "amount,password"}, {"layout": "xml"}):
+        response = client.get("/transactions/", headers=euro_headers, params=params)
+        assert response.status_code == 400
+    assert client.get("/budgets/", headers=euro_headers, params={"fields": "inconnu"}).status_code == 400
+    assert client.get("/goals/", headers=euro_headers, params={"fields": "inconnu"}).status_code == 400
+
+
+def test_projection_selects_only_requested_columns(client, euro_headers, sql_statements):
+    user_id = client.get("/auth/me", headers=euro_headers).json()["id"]
+    db = SessionLocal()
+    try:
+        rows = crud.get_user_transactions(db=db, user_id=user_id, columns=TRANSACTION_FIELDS.columns(["date", "amount"]))
+    finally:
+        db.close()
+    assert len(rows) == 2
+    select = next(sql for sql, _ in sql_statements.statements if "FROM transactions" in sql)
+    assert "amount_minor" in select and "description" not in select
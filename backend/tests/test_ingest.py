@@ -0,0 +1,86 @@
+"""Ingestion : accusé de réception puis insertion groupée, rejeu des spools et rejet des lignes fautives"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import ingest, schemas
+from app.ingest import DEAD_LETTER_FILE, replay_orphan_spools
+
+
+@pytest.fixture(scope="module")
+def ingest_user(client, register):
+    headers = register("ingestion")
+    return headers, client.get("/auth/me", headers=headers).json()["id"]
+
+
+def _transaction(amount, description: str) -> dict:
+    return {
+        "amount": amount, "type": "depense", "category": "Transport",
+        "description": description, "date": datetime.now().replace(microsecond=0).isoformat(),
+    }
+
+
+def _descriptions(client, headers) -> list:
+    return sorted(t["description"] for t in client.get("/transactions/", headers=headers).json())
+
+
+def test_ingest_acknowledges_then_inserts(client, ingest_user):
+    headers, _ = ingest_user
+    transactions = [_transaction(1000 + i, f"flux {i}") for i in range(3)]
+    response = client.post("/transactions/ingest", headers=headers, json={"transactions": transactions})
+    assert response.status_code == 202
+    assert response.json() == {"accepted": 3}
+
+    deadline = time.monotonic() + 5
+    while len(_descriptions(client, headers)) < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert [d for d in _descriptions(client, headers) if d.startswith("flux")] == ["flux 0", "flux 1", "flux 2"]
+
+
+def test_ingest_rejects_amount_before_acknowledging(client, ingest_user):
+    headers, _ = ingest_user
+    # XOF sans décimales : refusé avant l'écriture dans le spool
+    response = client.post("/transactions/ingest", headers=headers, json={"transactions": [_transaction(10.5, "x")]})
+    assert response.status_code == 422
+
+
+def _write_spool(directory: str, name: str, user_id: int, amounts) -> None:
+    with open(os.path.join(directory, name), "w") as f:
+        for sequence, amount in enumerate(amounts, start=1):
+            transaction = schemas.TransactionCreate.model_construct(**_transaction(amount, f"spool {sequence}"))
+            record = {"seq": sequence, "user_id": user_id, "transaction": transaction.model_dump(mode="json", warnings=False)}
+            f.write(json.dumps(record) + "\n")
+        # Dernière ligne tronquée par un arrêt brutal : ignorée
+        f.write('{"seq": 4, "user_')
+
+
+def test_replay_isolates_poison_row(client, ingest_user, tmp_path):
+    headers, user_id = ingest_user
+    _write_spool(str(tmp_path), "spool-orphelin.jsonl", user_id, [500, 0.5, 700])
+
+    report = replay_orphan_spools(str(tmp_path), batch_size=10)
+    assert report == {"replayed": 2, "rejected": 1, "kept": 0}
+    assert not (tmp_path / "spool-orphelin.jsonl").exists()
+    assert [d for d in _descriptions(client, headers) if d.startswith("spool")] == ["spool 1", "spool 3"]
+
+    rejected = [json.loads(line) for line in (tmp_path / DEAD_LETTER_FILE).read_text().splitlines()]
+    assert [(r["spool"], r["seq"], r["user_id"]) for r in rejected] == [("spool-orphelin.jsonl", 2, user_id)]
+
+
+def test_replay_keeps_spool_when_database_is_down(client, ingest_user, tmp_path, monkeypatch):
+    _, user_id = ingest_user
+    _write_spool(str(tmp_path), "spool-en-attente.jsonl", user_id, [900])
+
+    def unavailable(entries, spool):
+        raise OperationalError("INSERT", {}, Exception("base indisponible"))
+
+    monkeypatch.setattr(ingest, "_insert", unavailable)
+    report = replay_orphan_spools(str(tmp_path), batch_size=10)
+    assert report == {"replayed": 0, "rejected": 0, "kept": 1}
+    assert (tmp_path / "spool-en-attente.jsonl").exists()
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()
@@ -0,0 +1,137 @@
+"""Montants en unités mineures : conversions, bornes et migration des colonnes flottantes"""
+
+import math
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.migrations import migrate_amounts_to_minor_units
+from app.money import MAX_AMOUNT, AmountError, from_minor, to_minor
+
+
+@pytest.mark.parametrize("value, exponent, minor", [
+    (1500, 0, 1500),
+    (1500.0, 0, 1500),
+    (-250, 0, -250),
+    (10.01, 2, 1001),
+    (0.1 + 0.2, 2, 30),
+    (-19.99, 2, -1999),
+    (Decimal("19.99"), 2, 1999),
+    (MAX_AMOUNT, 0, MAX_AMOUNT),
+    (-MAX_AMOUNT, 2, -MAX_AMOUNT * 100),
+])
+def test_to_minor_exact(value, exponent, minor):
+    assert to_minor(value, exponent) == minor
+
+
+@pytest.mark.parametrize("value, exponent", [
+    (1500.5, 0),
+    (10.005, 2),
+    (0.001, 2),
+    (MAX_AMOUNT + 1, 0),
+    (-MAX_AMOUNT - 0.01, 2),
+    (math.inf, 0),
+    (math.nan, 2),
+])
+def test_to_minor_rejects(value, exponent):
+    with pytest.raises(AmountError):
+        to_minor(value, exponent)
+
+
+@pytest.mark.parametrize("value, exponent, minor", [
+    # Arrondi bancaire : le demi va vers le pair
+    (2.5, 0, 2),
+    (3.5, 0, 4),
+    (-2.5, 0, -2),
+    (10.005, 2, 1000),
+    (10.015, 2, 1002),
+    (MAX_AMOUNT * 10, 0, MAX_AMOUNT * 10),
+])
+def test_to_minor_rounds_legacy_amounts(value, exponent, minor):
+    assert to_minor(value, exponent, strict=False) == minor
+
+
+def test_non_finite_rejected_even_for_legacy_amounts():
+    with pytest.raises(AmountError):
+        to_minor(math.inf, 0, strict=False)
+
+
+@pytest.mark.parametrize("minor, exponent, value", [
+    (1500, 0, 1500.0),
+    (1999, 2, 19.99),
+    (-5, 2, -0.05),
+    (MAX_AMOUNT * 100, 2, float(MAX_AMOUNT)),
+    (None, 2, None),
+])
+def test_from_minor(minor, exponent, value):
+    assert from_minor(minor, exponent) == value
+
+
+@pytest.mark.parametrize("value", [0.07, 19.99, 1234.56, 0.1 + 0.2])
+def test_round_trip_two_decimals(value):
+    assert from_minor(to_minor(round(value, 2), 2), 2) == round(value, 2)
+
+
+def test_api_rejects_out_of_range_amounts(client, register):
+    headers = register("montants", currency="EUR")
+    base = {"type": "depense", "category": "Transport", "date": "2024-05-02T08:00:00"}
+    assert client.post("/transactions/", headers=headers, json={**base, "amount": 10.5}).status_code == 200
+    assert client.post("/transactions/", headers=headers, json={**base, "amount": 10.005}).status_code == 422
+    assert client.post("/transactions/", headers=headers, json={**base, "amount": MAX_AMOUNT * 10}).status_code == 422
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """Base au schéma d'avant la migration : montants flottants"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, "
+            "currency VARCHAR(3) NOT NULL DEFAULT 'XOF', currency_exponent INTEGER NOT NULL DEFAULT 0)"
+        ))
+        connection.execute(text("CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER, amount FLOAT)"))
+        connection.execute(text("CREATE TABLE budgets (id INTEGER PRIMARY KEY, user_id INTEGER, amount FLOAT)"))
+        connection.execute(text(
+            "CREATE TABLE goals (id INTEGER PRIMARY KEY, user_id INTEGER, target_amount FLOAT, current_amount FLOAT)"
+        ))
+        connection.execute(text(
+            "INSERT INTO users (id, username, currency, currency_exponent) VALUES (1, 'awa', 'XOF', 0), (2, 'lea', 'EUR', 2)"
+        ))
+        connection.execute(text("INSERT INTO transactions (user_id, amount) VALUES (:user_id, :amount)"), [
+            {"user_id": 1, "amount": 1500.0}, {"user_id": 1, "amount": 2.5}, {"user_id": 1, "amount": 3.5},
+            {"user_id": 2, "amount": 19.99}, {"user_id": 2, "amount": 0.1 + 0.2}, {"user_id": 2, "amount": 10.005},
+            {"user_id": 2, "amount": None},
+        ])
+        connection.execute(text("INSERT INTO budgets (user_id, amount) VALUES (1, 50000), (2, 300.5)"))
+        connection.execute(text("INSERT INTO goals (user_id, target_amount, current_amount) VALUES (2, 1000, 12.34)"))
+    yield engine
+    engine.dispose()
+
+
+def test_migration_round_trip(legacy_engine):
+    report = migrate_amounts_to_minor_units(legacy_engine, batch_size=2)
+    assert report["transactions.amount_minor"] == 7
+    assert report["goals.current_amount_minor"] == 1
+
+    with legacy_engine.connect() as connection:
+        rows = connection.execute(text(
+            "SELECT t.amount, t.amount_minor, u.currency_exponent FROM transactions t JOIN users u ON u.id = t.user_id ORDER BY t.id"
+        )).fetchall()
+        assert [minor for _, minor, _ in rows] == [1500, 2, 4, 1999, 30, 1000, 0]
+        # Retour en montant décimal : identique à l'ancien flottant, sauf fraction d'unité mineure arrondie
+        assert [from_minor(minor, exponent) for _, minor, exponent in rows[:5]] == [1500.0, 2.0, 4.0, 19.99, 0.3]
+        assert connection.execute(text("SELECT amount_minor FROM budgets ORDER BY id")).scalars().all() == [50000, 30050]
+        assert connection.execute(text("SELECT target_amount_minor, current_amount_minor FROM goals")).one() == (100000, 1234)
+
+    # Relançable : rien à convertir, puis suppression des colonnes flottantes à la bascule
+    assert migrate_amounts_to_minor_units(legacy_engine)["transactions.amount_minor"] == 0
+    # Ligne écrite par l'ancienne version après la conversion : rattrapée à la bascule
+    with legacy_engine.begin() as connection:
+        connection.execute(text("INSERT INTO transactions (user_id, amount) VALUES (2, 7.25)"))
+    migrate_amounts_to_minor_units(legacy_engine, finalize=True)
+    with legacy_engine.connect() as connection:
+        columns = [row[1] for row in connection.execute(text("PRAGMA table_info(transactions)"))]
+        late = connection.execute(text("SELECT amount_minor FROM transactions ORDER BY id DESC")).scalars().first()
+    assert "amount" not in columns and "amount_minor" in columns
+    assert late == 725
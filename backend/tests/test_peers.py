@@ -0,0 +1,107 @@
+"""Comparaisons entre utilisateurs : t-digest, cohortes et GET /analytics/peers"""
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.database import SessionLocal
+from app.peers import compute_peer_benchmarks, revenue_band, user_shares
+from app.sketches import TDigest
+from check_query_budgets import month_start
+
+
+def test_tdigest_quantiles_and_bounded_size():
+    values = np.random.default_rng(0).uniform(0, 100, 20000)
+    digest = TDigest(compression=100)
+    digest.add_many(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert abs(digest.quantile(q) - np.quantile(values, q)) < 1
+    assert abs(digest.cdf(30) - 0.3) < 0.01
+    assert digest.cdf(-1) == 0 and digest.cdf(100) == 1
+    assert digest.count == 20000
+    assert len(digest.means) <= 100
+
+
+def test_tdigest_merge_and_serialization():
+    values = np.random.default_rng(1).exponential(10, 10000)
+    whole = TDigest()
+    whole.add_many(values)
+    left, right = TDigest(), TDigest()
+    left.add_many(values[:3000])
+    right.add_many(values[3000:])
+    merged = TDigest.from_bytes(left.merge(right).to_bytes())
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    for q in (0.1, 0.5, 0.9):
+        assert abs(merged.quantile(q) - whole.quantile(q)) < 0.5
+
+
+def test_revenue_band_and_shares():
+    assert revenue_band(0, 0) == "r-"
+    assert revenue_band(300000, 0) == "r10"
+    assert revenue_band(300000_00, 2) == "r10"
+    revenue, shares = user_shares([("revenu", None, 500), ("depense", 1, 30), ("depense", 2, 70)], [1, 2, 3])
+    assert revenue == 500 and shares == {1: 30.0, 2: 70.0, 3: 0.0}
+    assert user_shares([("revenu", None, 500)], [1]) == (500, None)
+
+
+MONTH_START = month_start(8)
+MONTH = MONTH_START.strftime("%Y-%m")
+
+
+@pytest.fixture(scope="module")
+def peers_headers(client, register):
+    headers = {}
+    for username, revenue, food, transport in (("pairs_a", 300000, 6000, 4000), ("pairs_b", 0, 2000, 8000)):
+        headers[username] = register(username)
+        rows = [("revenu", "Salaire", revenue), ("depense", "Nourriture", food), ("depense", "Transport", transport)]
+        for kind, category, amount in rows:
+            if amount:
+                client.post("/transactions/", headers=headers[username], json={
+                    "amount": amount, "type": kind, "category": category, "date": MONTH_START.isoformat(),
+                })
+    return headers
+
+
+def _compute(workers: int = 1) -> dict:
+    db = SessionLocal()
+    try:
+        return compute_peer_benchmarks(db, MONTH, workers=workers)
+    finally:
+        db.close()
+
+
+def _categories(client, headers) -> dict:
+    body = client.get("/analytics/peers", headers=headers, params={"month": MONTH}).json()
+    return {item["category"]: item for item in body["categories"]}
+
+
+def test_peers_use_most_precise_large_enough_cohort(client, peers_headers, monkeypatch):
+    assert _compute()["users"] == 2
+
+    monkeypatch.setattr(settings, "peers_min_users", 1)
+    food = _categories(client, peers_headers["pairs_a"])["Nourriture"]
+    assert (food["cohort"], food["peers"], food["your_share"]) == ("XOF:r10", 1, 60.0)
+
+    monkeypatch.setattr(settings, "peers_min_users", 2)
+    categories = _categories(client, peers_headers["pairs_a"])
+    assert (categories["Nourriture"]["cohort"], categories["Nourriture"]["peers"]) == ("XOF:*", 2)
+    assert categories["Nourriture"]["peer_median"] == 40.0
+    # Catégorie commune sans dépense : 0 %
+    assert categories["Logement"]["your_share"] == 0.0
+
+    # Cohorte trop petite : rien n'est exposé
+    monkeypatch.setattr(settings, "peers_min_users", 3)
+    assert _categories(client, peers_headers["pairs_a"]) == {}
+
+
+def test_parallel_computation_matches_serial(client, peers_headers, monkeypatch):
+    monkeypatch.setattr(settings, "peers_min_users", 2)
+    serial = _compute()
+    expected = _categories(client, peers_headers["pairs_b"])
+    assert _compute(workers=2) == serial
+    assert _categories(client, peers_headers["pairs_b"]) == expected
+
+
+def test_invalid_month_rejected(client, peers_headers):
+    assert client.get("/analytics/peers", headers=peers_headers["pairs_a"], params={"month": "2024-13"}).status_code == 400
@@ -0,0 +1,40 @@
+"""Budgets de requêtes SQL des routes (@statement_budget), sur le jeu de données de référence"""
+
+import pytest
+
+import check_query_budgets
+from app import crud, models
+from app.database import SessionLocal
+from app.main import app
+from app.sqlstats import BUDGET_HEADROOM, budget_of
+
+ROUTES = check_query_budgets.api_routes(app)
+
+
+@pytest.fixture(scope="module")
+def measurements(client, reference_data) -> dict:
+    """(requêtes SQL, statut) de chaque route, appelées une fois dans l'ordre de check_query_budgets.py"""
+    return check_query_budgets.measure_routes(client, reference_data)
+
+
+@pytest.mark.parametrize("method, path", sorted(ROUTES), ids=[f"{method} {path}" for method, path in sorted(ROUTES)])
+def test_route_within_budget(measurements, method, path):
+    budget = budget_of(ROUTES[(method, path)])
+    assert budget is not None, "aucun budget déclaré (@statement_budget)"
+    assert (method, path) in measurements, "route non appelée par check_query_budgets.py"
+    count, status = measurements[(method, path)]
+    assert status < 400
+    assert count <= budget, f"{count} requêtes SQL pour un budget de {budget}"
+
+
+def test_budget_alerts_read_tracked_totals(reference_data, sql_statements):
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == "budget").one()
+        before = sql_statements.count
+        alerts = crud._compute_budget_alerts(db, user.id, reference_data["month"])
+    finally:
+        db.close()
+    assert len(alerts) == len(reference_data["budgets"])
+    # Budgets du mois et totaux suivis (budget_spend) : pas de requête par budget
+    assert sql_statements.count - before <= 2 + BUDGET_HEADROOM
@@ -0,0 +1,89 @@
+"""Limitation de débit : seaux à jetons et middleware (429, Retry-After, clé du client)"""
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth import create_access_token
+from app.ratelimit import MemoryBucketBackend, RateLimitMiddleware, parse_limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BrokenBucketBackend:
+    async def take(self, key, capacity, rate):
+        raise ConnectionError("redis indisponible")
+
+
+def _take(backend, key="k", limit="2/10"):
+    return asyncio.run(backend.take(key, *parse_limit(limit)))
+
+
+def test_parse_limit():
+    assert parse_limit("10/60") == (10, 10 / 60)
+
+
+def test_bucket_burst_then_refill():
+    clock = Clock()
+    backend = MemoryBucketBackend(clock=clock)
+    assert [_take(backend) for _ in range(3)] == [0, 0, 5.0]
+    # Un jeton toutes les 5 secondes
+    clock.now += 5
+    assert _take(backend) == 0
+    assert _take(backend) == 5.0
+
+
+def test_bucket_lru_eviction():
+    backend = MemoryBucketBackend(max_keys=2, clock=Clock())
+    for key in ("a", "b", "a", "c"):
+        _take(backend, key)
+    assert list(backend._buckets) == ["a", "c"]
+
+
+def _client(backend) -> TestClient:
+    app = FastAPI()
+
+    @app.post("/auth/token")
+    def token():
+        return {}
+
+    @app.get("/items")
+    def items():
+        return {}
+
+    app.add_middleware(RateLimitMiddleware, backend=backend, limits={"POST /auth/token": "2/60"})
+    return TestClient(app)
+
+
+def test_middleware_returns_429_with_retry_after():
+    client = _client(MemoryBucketBackend())
+    assert [client.post("/auth/token").status_code for _ in range(2)] == [200, 200]
+    response = client.post("/auth/token")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+    # Route sans règle : jamais limitée
+    assert all(client.get("/items").status_code == 200 for _ in range(5))
+
+
+def test_middleware_buckets_per_user():
+    client = _client(MemoryBucketBackend())
+    alice = {"Authorization": f"Bearer {create_access_token({'sub': 'alice'})}"}
+    bob = {"Authorization": f"Bearer {create_access_token({'sub': 'bob'})}"}
+    for _ in range(2):
+        client.post("/auth/token", headers=alice)
+    assert client.post("/auth/token", headers=alice).status_code == 429
+    assert client.post("/auth/token", headers=bob).status_code == 200
+    # Jeton invalide : seau de l'adresse IP
+    assert client.post("/auth/token", headers={"Authorization": "Bearer invalide"}).status_code == 200
+
+
+def test_middleware_lets_requests_through_when_backend_fails():
+    client = _client(BrokenBucketBackend())
+    assert all(client.post("/auth/token").status_code == 200 for _ in range(5))
@@ -0,0 +1,126 @@
+"""Shards SQLite locaux : routage des utilisateurs et déplacement avec écriture tardive"""
+
+import os
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app import models, rebalance
+from app.config import settings
+from app.database import _create_engine, create_shard_tables, engine, shard_engines, shard_router
+
+TRANSACTIONS = models.Transaction.__table__
+
+
+@pytest.fixture
+def two_shards(tmp_path, monkeypatch):
+    """Shard 0 : la base primaire ; shard 1 : un second fichier SQLite"""
+    second = _create_engine(f"sqlite:///{os.path.join(tmp_path, 'shard1.db')}")
+    saved = list(shard_engines)
+    shard_engines[:] = [engine, second]
+    create_shard_tables()
+    monkeypatch.setattr(settings, "shard_move_grace_seconds", 0)
+    yield shard_engines
+    shard_engines[:] = saved
+    second.dispose()
+
+
+def _ids(shard_engine, user_id: int) -> list:
+    with shard_engine.connect() as connection:
+        return [id_ for (id_,) in connection.execute(
+            select(TRANSACTIONS.c.id).where(TRANSACTIONS.c.user_id == user_id).order_by(TRANSACTIONS.c.id)
+        )]
+
+
+def _expense(amount: int) -> dict:
+    return {"amount": amount, "type": "depense", "category": "Transport", "date": datetime.now().isoformat()}
+
+
+def _register_on(client, register, shard: int, prefix: str):
+    """Inscrit des utilisateurs jusqu'à en obtenir un placé sur ce shard : (en-têtes, id)"""
+    for index in range(50):
+        headers = register(f"{prefix}-{index}")
+        user_id = client.get("/auth/me", headers=headers).json()["id"]
+        if shard_router.target(user_id) == shard:
+            return headers, user_id
+    raise AssertionError(f"aucun utilisateur placé sur le shard {shard}")
+
+
+def test_users_routed_to_their_shard(client, register, two_shards):
+    for shard in (0, 1):
+        headers, user_id = _register_on(client, register, shard, f"routage{shard}")
+        assert client.post("/transactions/", headers=headers, json=_expense(1500)).status_code == 200
+        assert len(_ids(two_shards[shard], user_id)) == 1
+        assert _ids(two_shards[1 - shard], user_id) == []
+        assert len(client.get("/transactions/", headers=headers).json()) == 1
+
+
+def test_move_user_copies_late_write(client, register, two_shards, monkeypatch):
+    headers, user_id = _register_on(client, register, 0, "demenage")
+    for amount in (1000, 2000, 3000):
+        assert client.post("/transactions/", headers=headers, json=_expense(amount)).status_code == 200
+    # Autre utilisateur du shard cible : ses identifiants ne doivent pas entrer en collision avec la copie
+    neighbour, neighbour_id = _register_on(client, register, 1, "voisin")
+    assert client.post("/transactions/", headers=neighbour, json=_expense(500)).status_code == 200
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            # Après la bascule : lot d'ingestion résolu vers l'ancien shard, arrivé en retard
+            with two_shards[0].begin() as connection:
+                category_id = connection.execute(
+                    select(TRANSACTIONS.c.category_id).where(TRANSACTIONS.c.user_id == user_id)
+                ).scalars().first()
+                connection.execute(insert(TRANSACTIONS), [{
+                    "user_id": user_id, "amount_minor": 4000, "type": "depense",
+                    "category_id": category_id, "date": datetime.now(),
+                }])
+
+    monkeypatch.setattr(rebalance.time, "sleep", sleep)
+    source_ids = _ids(two_shards[0], user_id)
+    report = rebalance.move_user(user_id, 1)
+
+    assert report == {"moved": 3, "late": 1}
+    assert _ids(two_shards[0], user_id) == []
+    moved = _ids(two_shards[1], user_id)
+    assert len(moved) == 4 and min(moved) > max(source_ids)
+    assert len(set(moved) | set(_ids(two_shards[1], neighbour_id))) == 5
+    listed = client.get("/transactions/", headers=headers).json()
+    assert sorted(t["amount"] for t in listed) == [1000, 2000, 3000, 4000]
+
+    # Les insertions suivantes sur le shard cible partent après la plage copiée
+    assert client.post("/transactions/", headers=neighbour, json=_expense(600)).status_code == 200
+    with two_shards[1].connect() as connection:
+        assert connection.execute(select(func.count(func.distinct(TRANSACTIONS.c.id)))).scalar() == 6
+
+
+def test_copy_waits_for_concurrent_writer(client, register, two_shards):
+    headers, user_id = _register_on(client, register, 0, "copie")
+    assert client.post("/transactions/", headers=headers, json=_expense(1000)).status_code == 200
+    neighbour, _ = _register_on(client, register, 1, "concurrent")
+
+    # Le shard cible est verrouillé pendant la copie : l'insertion concurrente passe après
+    copying = threading.Event()
+    original = rebalance._reserve_ids
+
+    def reserve(dst, table, floor, count):
+        base = original(dst, table, floor, count)
+        copying.set()
+        return base
+
+    responses = []
+    writer = threading.Thread(target=lambda: (copying.wait(5), responses.append(
+        client.post("/transactions/", headers=neighbour, json=_expense(700)).status_code
+    )))
+    writer.start()
+    try:
+        rebalance._reserve_ids = reserve
+        rebalance._copy(two_shards[0], two_shards[1], user_id, {})
+    finally:
+        rebalance._reserve_ids = original
+        writer.join()
+    assert responses == [200]
@@ -0,0 +1,38 @@
+"""Lanceur de production : nombre de workers et configuration gunicorn"""
+
+import multiprocessing
+
+import serve
+from app.cache import create_backend
+from app.config import settings
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.setattr(settings, "workers", 3)
+    assert serve.get_worker_count() == 3
+    # 0 : un worker par cœur
+    monkeypatch.setattr(settings, "workers", 0)
+    assert serve.get_worker_count() == multiprocessing.cpu_count()
+
+
+def test_gunicorn_configuration(monkeypatch):
+    monkeypatch.setattr(settings, "workers", 2)
+    monkeypatch.setattr(settings, "debug", False)
+    monkeypatch.setattr(settings, "graceful_timeout", 20)
+    cfg = serve.ProductionApplication(serve.get_gunicorn_options()).cfg
+    assert cfg.workers == 2
+    assert cfg.bind == [f"{settings.server_host}:{settings.server_port}"]
+    assert cfg.worker_class is serve.ProductionWorker
+    assert (cfg.keepalive, cfg.backlog) == (settings.keep_alive, settings.backlog)
+    assert (cfg.max_requests, cfg.max_requests_jitter) == (settings.max_requests, settings.max_requests_jitter)
+    assert (cfg.graceful_timeout, cfg.timeout) == (20, 50)
+    # Sans DEBUG : pas de journal d'accès (valeur par défaut de gunicorn conservée)
+    assert cfg.accesslog is None
+    assert serve.ProductionWorker.CONFIG_KWARGS == {"loop": "uvloop", "http": "httptools"}
+
+
+def test_process_local_cache_disabled_with_several_workers(monkeypatch):
+    monkeypatch.setattr(settings, "api_workers", 1)
+    assert create_backend("memory") is not None
+    monkeypatch.setattr(settings, "api_workers", 4)
+    assert create_backend("memory") is None
@@ -0,0 +1,103 @@
+"""Relevés mensuels : calcul à la demande, ETag, invalidation par une écriture après coup"""
+
+from datetime import timedelta
+
+import pytest
+
+from app import statements
+from app.statements import invalidate, render_statement, statement_generator
+from check_query_budgets import month_start
+
+START = month_start(1)
+MONTH = START.strftime("%Y-%m")
+
+
+@pytest.fixture(scope="module")
+def statement_user(client, register):
+    headers = register("releves")
+    for days, amount, kind, category, description in (
+        (0, 200000, "revenu", "Salaire", "Salaire"),
+        (2, 15000, "depense", "Nourriture", "Marché <central>"),
+        (3, 5000, "depense", "Transport", "Taxi"),
+    ):
+        response = client.post("/transactions/", headers=headers, json={
+            "amount": amount, "type": kind, "category": category, "description": description,
+            "date": (START + timedelta(days=days)).isoformat(),
+        })
+        assert response.status_code == 200, response.text
+    return headers, client.get("/auth/me", headers=headers).json()["id"]
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Calculs demandés au pool, exécutés ensuite dans le processus du test"""
+    calls = []
+    monkeypatch.setattr(statement_generator, "schedule", lambda *args: calls.append(args))
+    return calls
+
+
+def _get(client, headers, **kwargs):
+    return client.get(f"/statements/{MONTH}", headers=headers, **kwargs)
+
+
+def test_statement_generated_then_served_with_etag(client, statement_user, scheduled):
+    headers, user_id = statement_user
+    response = _get(client, headers)
+    assert response.status_code == 202
+    assert response.headers["Retry-After"] == "2"
+    assert scheduled == [(user_id, MONTH, None)]
+
+    assert render_statement(user_id, MONTH)
+    response = _get(client, headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["totals"] == {"income": 200000, "expenses": 20000, "balance": 180000, "transactions": 3}
+    assert [(c["category"], c["share"]) for c in body["categories"] if c["type"] == "depense"] == [
+        ("Nourriture", 75.0), ("Transport", 25.0),
+    ]
+    assert "goals" not in body
+
+    etag = response.headers["ETag"]
+    assert _get(client, {**headers, "If-None-Match": etag}).status_code == 304
+
+    response = _get(client, headers, params={"format": "csv"})
+    assert response.headers["Content-Disposition"] == f'attachment; filename="releve-{MONTH}.csv"'
+    assert "transaction," in response.text
+    html = _get(client, headers, params={"format": "html"}).text
+    assert "Marché &lt;central&gt;" in html and "<central>" not in html
+
+
+def test_late_write_invalidates_statement(client, statement_user, scheduled):
+    headers, user_id = statement_user
+    render_statement(user_id, MONTH)
+    response = client.post("/transactions/", headers=headers, json={
+        "amount": 1000, "type": "depense", "category": "Transport", "date": (START + timedelta(days=10)).isoformat(),
+    })
+    assert response.status_code == 200
+    assert _get(client, headers).status_code == 202
+
+    assert render_statement(user_id, MONTH)
+    assert _get(client, headers).json()["totals"]["expenses"] == 21000
+
+
+def test_statement_made_stale_during_computation_is_dropped(client, statement_user, monkeypatch):
+    _, user_id = statement_user
+    build = statements.build_statement
+
+    def build_then_write(db, user_id, month):
+        statement = build(db, user_id, month)
+        # Écriture validée pendant le calcul
+        invalidate(user_id, [month])
+        return statement
+
+    monkeypatch.setattr(statements, "build_statement", build_then_write)
+    assert render_statement(user_id, MONTH) is False
+    assert statements.read_statement(user_id, MONTH, "json") is None
+
+
+def test_invalid_requests(client, statement_user):
+    headers, _ = statement_user
+    assert client.get("/statements/2024-13", headers=headers).status_code == 400
+    assert _get(client, headers, params={"format": "pdf"}).status_code == 400
+    current = month_start(0).strftime("%Y-%m")
+    assert client.get(f"/statements/{current}", headers=headers).status_code == 409
@@ -0,0 +1,95 @@
+"""Séries temporelles : LTTB, périodes vides, solde d'ouverture et sommes exactes après réduction"""
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.timeseries import lttb
+from check_query_budgets import month_start
+
+
+def test_lttb_keeps_ends_and_peaks():
+    y = np.zeros(100)
+    y[37] = 50
+    selected = lttb(np.arange(100), y, 10)
+    assert len(selected) == 10
+    assert selected[0] == 0 and selected[-1] == 99
+    assert (np.diff(selected) > 0).all()
+    assert 37 in selected
+
+
+def test_lttb_returns_all_points_below_threshold():
+    assert lttb(np.arange(5), np.arange(5), 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(np.arange(5), np.arange(5), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+START = month_start(2)
+
+
+@pytest.fixture(scope="module")
+def series_headers(client, register):
+    headers = register("series")
+    for days, amount, kind, category in (
+        (-10, 100000, "revenu", "Salaire"),  # avant la période : solde d'ouverture
+        (1, 2000, "depense", "Transport"),
+        (1, 3000, "depense", "Loisirs"),
+        (5, 1500, "depense", "Transport"),
+        (20, 5000, "revenu", "Freelance"),
+    ):
+        response = client.post("/transactions/", headers=headers, json={
+            "amount": amount, "type": kind, "category": category,
+            "date": (START + timedelta(days=days)).isoformat(),
+        })
+        assert response.status_code == 200, response.text
+    return headers
+
+
+def _timeseries(client, headers, **params):
+    params = {"start_date": START.strftime("%Y-%m-%d"),
+              "end_date": (START + timedelta(days=29)).strftime("%Y-%m-%d"), **params}
+    response = client.get("/transactions/timeseries", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_daily_series_includes_empty_days(client, series_headers):
+    body = _timeseries(client, series_headers, by_category=True)
+    assert body["total_periods"] == body["count"] == 30
+    assert not body["downsampled"]
+    assert body["opening_balance"] == 100000
+    assert body["periods"][0] == START.strftime("%Y-%m-%d")
+    assert body["expenses"][1] == 5000 and body["expenses"][2] == 0
+    assert body["balance"][-1] == 100000 - 6500 + 5000
+    assert body["categories"]["Transport"][1] == 2000 and body["categories"]["Transport"][5] == 1500
+    assert set(body["categories"]) == {"Transport", "Loisirs"}
+
+
+def test_downsampled_series_keeps_exact_sums(client, series_headers):
+    full = _timeseries(client, series_headers, by_category=True)
+    body = _timeseries(client, series_headers, by_category=True, max_points=5)
+    assert body["downsampled"] and body["count"] == 5 and body["total_periods"] == 30
+    assert body["periods"][0] == full["periods"][0] and body["periods"][-1] == full["periods"][-1]
+    assert sum(body["revenues"]) == sum(full["revenues"])
+    assert sum(body["expenses"]) == sum(full["expenses"])
+    for name, values in full["categories"].items():
+        assert sum(body["categories"][name]) == sum(values)
+    # Chaque point : solde précédent + revenus - dépenses depuis ce point
+    previous = body["opening_balance"]
+    for revenue, expense, balance in zip(body["revenues"], body["expenses"], body["balance"]):
+        assert balance == previous + revenue - expense
+        previous = balance
+
+
+def test_monthly_buckets_cover_whole_months(client, series_headers):
+    body = _timeseries(client, series_headers, bucket="month")
+    assert body["periods"][0] == START.strftime("%Y-%m")
+    assert sum(body["expenses"]) == 6500 and sum(body["revenues"]) == 5000
+
+
+def test_invalid_parameters(client, series_headers):
+    assert client.get("/transactions/timeseries", headers=series_headers, params={"bucket": "hour"}).status_code == 400
+    response = client.get("/transactions/timeseries", headers=series_headers, params={
+        "start_date": "2024-05-01", "end_date": "2024-04-01",
+    })
+    assert response.status_code == 400